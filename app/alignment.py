@@ -0,0 +1,129 @@
+# app/alignment.py
+
+import os
+import time
+import logging
+from bisect import bisect_right
+
+import numpy as np
+
+import audio
+import models
+import metrics
+
+# Word-level alignment costs an extra model pass, so it is opt-in
+ALIGNMENT_ENABLED = os.getenv("ALIGNMENT_ENABLED", "false").lower() in ("1", "true", "yes")
+# Segments handed to whisperx.align per call
+ALIGN_BATCH_SEGMENTS = int(os.getenv("ALIGN_BATCH_SEGMENTS", 32))
+# Audio kept either side of a batch so words at its edges can still be placed
+ALIGN_PAD_SECONDS = 1.0
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/transcribe.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('alignment')
+
+# Languages whisperx has no default alignment model for; checked once per process
+_unsupported = set()
+
+
+def enabled(language):
+    return ALIGNMENT_ENABLED and language not in _unsupported
+
+
+def _batches(segments, size):
+    for i in range(0, len(segments), size):
+        yield segments[i:i + size]
+
+
+def attach_words(segments, words):
+    """
+    Give each segment the aligned words whose midpoint falls inside it.
+
+    whisperx re-splits its output into sentences, so words are mapped back
+    onto the original segments to keep their ids and text unchanged. A
+    segment that received words has its start and end tightened to them.
+
+    Args:
+        segments (list): Segment dicts sorted by start; updated in place.
+        words (list): whisperx word dicts with 'word' and, when aligned, 'start', 'end' and 'score'.
+    """
+    starts = [segment['start'] for segment in segments]
+    for word in words:
+        if 'start' not in word or 'end' not in word:
+            continue
+        i = max(bisect_right(starts, (word['start'] + word['end']) / 2) - 1, 0)
+        segments[i].setdefault('words', []).append({
+            'word': word['word'],
+            'start': round(word['start'], 3),
+            'end': round(word['end'], 3),
+            'score': round(word.get('score', 0.0), 3)
+        })
+    for segment in segments:
+        if segment.get('words'):
+            segment['start'] = segment['words'][0]['start']
+            segment['end'] = segment['words'][-1]['end']
+
+
+def align(segments, waveform, language, timings=None):
+    """
+    Add word-level timestamps to transcript segments with a wav2vec2 model.
+
+    Segments are aligned ALIGN_BATCH_SEGMENTS at a time against a slice of
+    the waveform covering just that batch, so a long recording is never
+    copied into one tensor. A batch that fails to align keeps its
+    segment-level timestamps.
+
+    Args:
+        segments (list): Segment dicts with start, end and text; updated in place.
+        waveform: 16 kHz mono float32 samples from audio.load_audio.
+        language (str): Language code used to pick the alignment model.
+        timings (dict, optional): Per-job stage timings to add the alignment time to.
+
+    Returns:
+        float: Seconds spent aligning per minute of audio, or None if alignment was skipped.
+    """
+    if not segments or not enabled(language):
+        return None
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    with metrics.timed(timings, 'alignment'):
+        try:
+            model, metadata = models.get_alignment_model(language)
+        except ValueError as e:
+            _unsupported.add(language)
+            logger.warning(f"No alignment model for language '{language}', skipping alignment: {str(e)}")
+            return None
+
+        import whisperx
+        device = "cuda" if models.cuda_available() else "cpu"
+        ordered = sorted(segments, key=lambda s: s['start'])
+        for batch in _batches(ordered, ALIGN_BATCH_SEGMENTS):
+            first = max(0, int((batch[0]['start'] - ALIGN_PAD_SECONDS) * audio.SAMPLE_RATE))
+            last = int((batch[-1]['end'] + ALIGN_PAD_SECONDS) * audio.SAMPLE_RATE)
+            offset = first / audio.SAMPLE_RATE
+            shifted = [{'start': s['start'] - offset, 'end': s['end'] - offset, 'text': s['text']} for s in batch]
+            try:
+                result = whisperx.align(shifted, model, metadata, np.ascontiguousarray(waveform[first:last]),
+                                        device, return_char_alignments=False)
+            except Exception as e:
+                logger.warning(f"Alignment of {len(batch)} segments at {offset:.1f}s failed: {str(e)}")
+                continue
+            words = [dict(word, start=word['start'] + offset, end=word['end'] + offset) if 'start' in word else word
+                     for word in result.get('word_segments', [])]
+            attach_words(batch, words)
+
+    seconds = time.perf_counter() - started
+    audio_minutes = audio.duration_seconds(waveform) / 60
+    try:
+        metrics.increment('alignment_seconds_total', amount=seconds)
+        metrics.increment('alignment_audio_seconds_total', amount=audio_minutes * 60)
+    except Exception as e:
+        logger.error(f"Could not record alignment cost: {str(e)}")
+    cost = seconds / audio_minutes if audio_minutes else None
+    if cost is not None:
+        logger.info(f"Aligned {len(segments)} segments in {seconds:.2f}s ({cost:.2f}s per audio minute)")
+    return cost
@@ -0,0 +1,256 @@
+# app/analytics.py
+
+import json
+import logging
+from datetime import datetime
+
+import history_store
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('analytics')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_users (
+    user               TEXT PRIMARY KEY,
+    uploads            INTEGER NOT NULL DEFAULT 0,
+    completed          INTEGER NOT NULL DEFAULT 0,
+    failed             INTEGER NOT NULL DEFAULT 0,
+    bytes              INTEGER NOT NULL DEFAULT 0,
+    audio_seconds      REAL NOT NULL DEFAULT 0,
+    processing_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS analytics_user_hours (
+    user    TEXT NOT NULL,
+    hour    INTEGER NOT NULL,
+    uploads INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, hour)
+);
+CREATE TABLE IF NOT EXISTS analytics_jobs (
+    job_id             TEXT PRIMARY KEY,
+    user               TEXT NOT NULL,
+    outcome            TEXT,
+    audio_seconds      REAL NOT NULL DEFAULT 0,
+    processing_seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+_schema_ready = False
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def _upload_hour(timestamp):
+    try:
+        return datetime.strptime(history_store.normalize_timestamp(timestamp), history_store.TIMESTAMP_FORMAT).hour
+    except (TypeError, ValueError):
+        return None
+
+
+def _add_upload(conn, record):
+    job_id = record.get('job_id')
+    user = record.get('user') or 'unknown'
+    if conn.execute("SELECT 1 FROM analytics_jobs WHERE job_id = ?", (job_id,)).fetchone():
+        return
+    conn.execute("INSERT INTO analytics_jobs (job_id, user) VALUES (?, ?)", (job_id, user))
+    conn.execute(
+        "INSERT INTO analytics_users (user, uploads, bytes) VALUES (?, 1, ?) "
+        "ON CONFLICT(user) DO UPDATE SET uploads = uploads + 1, bytes = bytes + excluded.bytes",
+        (user, int(record.get('file_size') or 0))
+    )
+    hour = _upload_hour(record.get('timestamp'))
+    if hour is not None:
+        conn.execute(
+            "INSERT INTO analytics_user_hours (user, hour, uploads) VALUES (?, ?, 1) "
+            "ON CONFLICT(user, hour) DO UPDATE SET uploads = uploads + 1", (user, hour)
+        )
+
+
+def _set_outcome(conn, job_id, outcome, audio_seconds, processing_seconds):
+    row = conn.execute("SELECT * FROM analytics_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None or row['outcome'] == outcome:
+        return
+    # Undo a previous outcome (e.g. a retry that failed first and then completed)
+    if row['outcome'] is not None:
+        conn.execute(
+            f"UPDATE analytics_users SET {row['outcome']} = {row['outcome']} - 1, "
+            "audio_seconds = audio_seconds - ?, processing_seconds = processing_seconds - ? WHERE user = ?",
+            (row['audio_seconds'], row['processing_seconds'], row['user'])
+        )
+    if outcome != 'completed':
+        audio_seconds = processing_seconds = 0.0
+    conn.execute(
+        f"UPDATE analytics_users SET {outcome} = {outcome} + 1, "
+        "audio_seconds = audio_seconds + ?, processing_seconds = processing_seconds + ? WHERE user = ?",
+        (audio_seconds, processing_seconds, row['user'])
+    )
+    conn.execute(
+        "UPDATE analytics_jobs SET outcome = ?, audio_seconds = ?, processing_seconds = ? WHERE job_id = ?",
+        (outcome, audio_seconds, processing_seconds, job_id)
+    )
+
+
+def record_upload(record):
+    """Count a newly registered upload (a job record as stored in the history)."""
+    record_uploads([record])
+
+
+def record_uploads(records):
+    """Count several newly registered uploads in one transaction."""
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for record in records:
+            _add_upload(conn, record)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def record_completion(job_id, status, audio_seconds=0.0, processing_seconds=0.0):
+    """
+    Count a finished job. Recording the same job again replaces its earlier outcome.
+
+    Args:
+        job_id (str): ID of the finished job.
+        status (str): 'Complete' or 'Failed'.
+        audio_seconds (float): Length of the transcribed audio. Pass 0 for
+            jobs that reused an earlier transcript, so the real-time factor
+            only reflects actual transcription.
+        processing_seconds (float): Wall-clock time spent transcribing.
+    """
+    outcome = 'completed' if status == 'Complete' else 'failed'
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _set_outcome(conn, job_id, outcome, audio_seconds or 0.0, processing_seconds or 0.0)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def forget_job(job_id):
+    """Remove a job from the lifetime job table, leaving the aggregates untouched."""
+    _connection().execute("DELETE FROM analytics_jobs WHERE job_id = ?", (job_id,))
+
+
+def rebuild():
+    """
+    Recompute every aggregate from the job history in one streaming pass.
+
+    Returns:
+        int: Number of jobs scanned.
+    """
+    conn = _connection()
+    scanned = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM analytics_users")
+        conn.execute("DELETE FROM analytics_user_hours")
+        conn.execute("DELETE FROM analytics_jobs")
+        # Walk the history in bounded batches so it is never held in memory at once
+        for row in _stream_jobs(conn):
+            record = json.loads(row['data'])
+            _add_upload(conn, record)
+            if record.get('status') in ('Complete', 'Failed'):
+                # Dedup hits took no transcription time; keep them out of the real-time factor
+                reused = bool(record.get('deduplicated_from'))
+                _set_outcome(conn, record['job_id'],
+                             'completed' if record['status'] == 'Complete' else 'failed',
+                             0.0 if reused else float(record.get('audio_duration') or 0.0),
+                             0.0 if reused else float(record.get('transcription_duration') or 0.0))
+            scanned += 1
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info(f"Rebuilt analytics from {scanned} jobs")
+    return scanned
+
+
+def ensure_built():
+    """Build the aggregates from the existing history if they have never been built."""
+    conn = _connection()
+    built = conn.execute("SELECT 1 FROM analytics_users LIMIT 1").fetchone() is not None
+    if not built and conn.execute("SELECT 1 FROM jobs LIMIT 1").fetchone() is not None:
+        rebuild()
+
+
+def _stream_jobs(conn, batch_size=1000):
+    """Yield history rows in seq order, one bounded batch at a time."""
+    last_seq = 0
+    while True:
+        rows = conn.execute(
+            "SELECT seq, data FROM jobs WHERE seq > ? ORDER BY seq ASC LIMIT ?", (last_seq, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_seq = rows[-1]['seq']
+
+
+def real_time_factor():
+    """Processing seconds per second of audio over every finished job, or None before the first."""
+    row = _connection().execute(
+        "SELECT SUM(processing_seconds) AS processing, SUM(audio_seconds) AS audio FROM analytics_users"
+    ).fetchone()
+    return row['processing'] / row['audio'] if row['audio'] else None
+
+
+def summary(user=None):
+    """
+    Return the aggregates for the analytics page.
+
+    Args:
+        user (str, optional): Restrict the totals, the hourly histogram and
+            the per-user breakdown to one user.
+
+    Returns:
+        dict: Totals, averages, real-time factor, hourly histogram and per-user breakdown.
+    """
+    conn = _connection()
+    rows = [dict(row) for row in conn.execute(
+        "SELECT * FROM analytics_users WHERE ? IS NULL OR user = ? ORDER BY uploads DESC", (user, user)
+    )]
+
+    totals = {key: sum(row[key] for row in rows)
+              for key in ('uploads', 'completed', 'failed', 'bytes', 'audio_seconds', 'processing_seconds')}
+    hours = [0] * 24
+    for row in conn.execute(
+        "SELECT hour, SUM(uploads) AS uploads FROM analytics_user_hours WHERE ? IS NULL OR user = ? GROUP BY hour",
+        (user, user)
+    ):
+        hours[row['hour']] = row['uploads']
+    peak_hour = max(range(24), key=hours.__getitem__) if any(hours) else None
+
+    for row in rows:
+        row['audio_hours'] = round(row['audio_seconds'] / 3600, 2)
+        row['real_time_factor'] = (round(row['processing_seconds'] / row['audio_seconds'], 3)
+                                   if row['audio_seconds'] else None)
+    return {
+        'total_uploads': totals['uploads'],
+        'completed': totals['completed'],
+        'failed': totals['failed'],
+        'total_bytes': totals['bytes'],
+        'average_file_size': round(totals['bytes'] / totals['uploads']) if totals['uploads'] else None,
+        'audio_hours': round(totals['audio_seconds'] / 3600, 2),
+        'processing_hours': round(totals['processing_seconds'] / 3600, 2),
+        'real_time_factor': (round(totals['processing_seconds'] / totals['audio_seconds'], 3)
+                             if totals['audio_seconds'] else None),
+        'hourly_uploads': hours,
+        'peak_hour': peak_hour,
+        'users': rows
+    }
@@ -0,0 +1,115 @@
+# app/audio.py
+
+import os
+import logging
+import numpy as np
+import av
+
+SAMPLE_RATE = 16000
+AUDIO_CACHE_FOLDER = os.getenv("AUDIO_CACHE_FOLDER", "cache/audio")
+# Decoded buffers longer than this are memory-mapped instead of read into RAM
+MEMMAP_THRESHOLD_SECONDS = float(os.getenv("MEMMAP_THRESHOLD_SECONDS", 30 * 60))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/transcribe.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('audio')
+
+
+def cache_path(filepath):
+    """Path of the decoded buffer for an upload (uploads already have unique names)."""
+    return os.path.join(AUDIO_CACHE_FOLDER, os.path.basename(filepath) + ".f32")
+
+
+def decode_to_file(filepath, output_path):
+    """
+    Decode an audio file to raw 16 kHz mono float32 samples, streaming frame by frame.
+
+    Memory use stays constant regardless of the length of the recording.
+
+    Args:
+        filepath: Path to the source audio file.
+        output_path: Path of the raw float32 file to write.
+
+    Returns:
+        int: Number of samples written.
+    """
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    samples = 0
+
+    def write_frames(frames, out):
+        nonlocal samples
+        if frames is None:
+            return
+        if not isinstance(frames, list):
+            frames = [frames]
+        for frame in frames:
+            chunk = frame.to_ndarray().reshape(-1).astype(np.float32) / 32768.0
+            out.write(chunk.tobytes())
+            samples += chunk.shape[0]
+
+    with av.open(filepath, metadata_errors="ignore") as container, open(tmp_path, "wb") as out:
+        for frame in container.decode(audio=0):
+            frame.pts = None
+            write_frames(resampler.resample(frame), out)
+        # Flush whatever the resampler is still holding
+        write_frames(resampler.resample(None), out)
+
+    os.replace(tmp_path, output_path)
+    return samples
+
+
+def load_audio(filepath):
+    """
+    Return the 16 kHz mono float32 waveform of an upload, decoding it at most once.
+
+    The decoded buffer is cached next to the other uploads' buffers, so
+    later runs on the same upload (e.g. with a different language) skip
+    decoding entirely. Long recordings are returned as a copy-on-write
+    memory map rather than being read into RAM.
+
+    Args:
+        filepath: Path to the uploaded audio file.
+
+    Returns:
+        numpy.ndarray: Waveform samples in [-1, 1].
+    """
+    os.makedirs(AUDIO_CACHE_FOLDER, exist_ok=True)
+    buffer_path = cache_path(filepath)
+
+    if not os.path.exists(buffer_path) or os.path.getmtime(buffer_path) < os.path.getmtime(filepath):
+        logger.info(f"Decoding {filepath} to {buffer_path}")
+        decode_to_file(filepath, buffer_path)
+    else:
+        logger.info(f"Using cached decoded audio for {filepath}")
+
+    num_samples = os.path.getsize(buffer_path) // np.dtype(np.float32).itemsize
+    if num_samples == 0:
+        return np.zeros(0, dtype=np.float32)
+    if num_samples > MEMMAP_THRESHOLD_SECONDS * SAMPLE_RATE:
+        return np.memmap(buffer_path, dtype=np.float32, mode="c", shape=(num_samples,))
+    return np.fromfile(buffer_path, dtype=np.float32)
+
+
+def duration_seconds(waveform):
+    """Duration of a decoded waveform in seconds."""
+    return waveform.shape[0] / SAMPLE_RATE
+
+
+def as_pyannote_input(waveform):
+    """Wrap a decoded waveform in the in-memory format pyannote pipelines accept."""
+    import torch
+    return {"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": SAMPLE_RATE}
+
+
+def evict(filename):
+    """Remove the cached decoded buffer for an upload, if any."""
+    buffer_path = cache_path(filename)
+    if os.path.exists(buffer_path):
+        os.remove(buffer_path)
+        return True
+    return False
@@ -0,0 +1,244 @@
+# app/batching.py
+
+import os
+import time
+import logging
+from bisect import bisect_right
+
+import numpy as np
+
+import audio
+import models
+import ingest
+import preflight
+import job_queue
+import history_store
+
+# Most jobs a worker transcribes in one Whisper call (1 disables batching)
+BATCH_SIZE = int(os.getenv("TRANSCRIBE_BATCH_SIZE", 8))
+# How long a worker waits for more short jobs after claiming the first one
+BATCH_MAX_WAIT_MS = float(os.getenv("TRANSCRIBE_BATCH_MAX_WAIT_MS", 300))
+# Recordings longer than this always get their own call
+BATCH_MAX_AUDIO_SECONDS = float(os.getenv("TRANSCRIBE_BATCH_MAX_AUDIO_SECONDS", 120))
+# Silence inserted between recordings so Whisper ends a segment at each boundary
+BATCH_GAP_SECONDS = float(os.getenv("TRANSCRIBE_BATCH_GAP_SECONDS", 2.0))
+# Polls for more jobs back off from BATCH_POLL_SECONDS up to BATCH_MAX_POLL_SECONDS
+BATCH_POLL_SECONDS = 0.05
+BATCH_MAX_POLL_SECONDS = 0.2
+
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/worker.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('batching')
+
+
+def _settings(record):
+    return (record.get('model_size') or models.DEFAULT_WHISPER_MODEL,
+            models.resolve_compute_type(record.get('compute_type')))
+
+
+def _short_waveform(job):
+    """Decode a job's upload (cached for the transcription that follows); None if it can't be batched."""
+    try:
+        waveform = audio.load_audio(os.path.join(UPLOAD_FOLDER, job['filename']))
+    except Exception as e:
+        logger.warning(f"Could not decode {job['filename']} for batching: {str(e)}")
+        return None
+    if audio.duration_seconds(waveform) > BATCH_MAX_AUDIO_SECONDS:
+        return None
+    return np.asarray(waveform)
+
+
+def _cached(job, settings):
+    """Whether the job will be answered from the dedup cache, so batching it would waste a decode."""
+    import web_transcribe
+
+    return web_transcribe.has_cached_transcript(job['job_id'], job['language'], *settings)
+
+
+def collect(worker_id, first_job, lease_seconds):
+    """
+    Gather short jobs that can share one Whisper call with first_job.
+
+    Jobs of the same user in the same language are claimed for up to
+    BATCH_MAX_WAIT_MS or until BATCH_SIZE is reached, so one call never
+    mixes different users' audio. Jobs that turn out to be long, to need a
+    different model or to have a cached transcript are returned separately
+    to be run one by one. The queue is polled with a read-only check,
+    backing off while it is empty.
+
+    Args:
+        worker_id (str): Worker claiming the jobs.
+        first_job (dict): Job already claimed by the worker.
+        lease_seconds (float): Lease for each additionally claimed job.
+
+    Returns:
+        tuple: (batch, singles) where batch is a list of (job, waveform)
+        and singles is a list of jobs.
+    """
+    if first_job['language'] == preflight.AUTO_LANGUAGE:
+        # One detected language can't be applied to a whole batch
+        return [], [first_job]
+    settings = _settings(history_store.get_job(first_job['job_id']) or {})
+    if _cached(first_job, settings):
+        return [], [first_job]
+    first_waveform = _short_waveform(first_job)
+    if first_waveform is None:
+        return [], [first_job]
+    batch = [(first_job, first_waveform)]
+    singles = []
+
+    language, user = first_job['language'], first_job['user']
+    deadline = time.monotonic() + BATCH_MAX_WAIT_MS / 1000
+    poll = BATCH_POLL_SECONDS
+    while len(batch) < BATCH_SIZE and time.monotonic() < deadline:
+        # Only take the queue's write lock when a matching job is actually waiting
+        job = None
+        if job_queue.has_ready(language, user):
+            job = job_queue.claim(worker_id, lease_seconds, language=language, user=user)
+        if job is None:
+            time.sleep(min(poll, max(deadline - time.monotonic(), 0)))
+            poll = min(poll * 2, BATCH_MAX_POLL_SECONDS)
+            continue
+        poll = BATCH_POLL_SECONDS
+        job = ingest.prepare(job)
+        if _settings(history_store.get_job(job['job_id']) or {}) != settings or _cached(job, settings):
+            singles.append(job)
+            continue
+        waveform = _short_waveform(job)
+        if waveform is None:
+            singles.append(job)
+        else:
+            batch.append((job, waveform))
+    return batch, singles
+
+
+def _pieces(segment, starts):
+    """
+    Yield (recording index, start, end, text) for the parts of a segment in each recording.
+
+    With word timestamps a segment that crosses a boundary is split between
+    the words; without them it goes whole to the recording holding its midpoint.
+    """
+    words = getattr(segment, 'words', None)
+    if not words:
+        yield (max(bisect_right(starts, (segment.start + segment.end) / 2) - 1, 0),
+               segment.start, segment.end, segment.text)
+        return
+    current = None
+    for word in words:
+        i = max(bisect_right(starts, (word.start + word.end) / 2) - 1, 0)
+        if current and current[0] == i:
+            current[2] = word.end
+            current[3] += word.word
+        else:
+            if current:
+                yield tuple(current)
+            current = [i, word.start, word.end, word.word]
+    yield tuple(current)
+
+
+def split_segments(segments, spans):
+    """
+    Split segments of a concatenated buffer back into per-recording segments.
+
+    Each word goes to the recording containing its midpoint (see _pieces),
+    and every piece is clipped to its recording; pieces that fall entirely
+    in a silence gap are dropped.
+
+    Args:
+        segments (iterable): Objects with start, end, text and optional words,
+            in buffer time.
+        spans (list): (start, end) of each recording in the buffer, in order.
+
+    Returns:
+        list: One list of {'start', 'end', 'text'} dicts per recording, in recording time.
+    """
+    starts = [start for start, _ in spans]
+    per_recording = [[] for _ in spans]
+    for segment in segments:
+        for i, piece_start, piece_end, text in _pieces(segment, starts):
+            start, end = spans[i]
+            clipped_start, clipped_end = max(piece_start, start), min(piece_end, end)
+            if clipped_end <= clipped_start or not text.strip():
+                continue
+            per_recording[i].append({
+                'start': clipped_start - start,
+                'end': clipped_end - start,
+                'text': text.strip()
+            })
+    return per_recording
+
+
+def transcribe_batch(batch, language, model_size, compute_type, beam_size=5):
+    """
+    Transcribe several short recordings with one Whisper call.
+
+    The recordings (all from one user, see collect) are joined with
+    BATCH_GAP_SECONDS of silence, so the model's fixed per-call cost and the
+    padding of partly filled 30 s windows are shared across jobs.
+
+    Args:
+        batch (list): (job, waveform) pairs.
+        language, model_size, compute_type: Shared by every job in the batch.
+
+    Returns:
+        tuple: (list of per-job segment lists, seconds spent transcribing)
+    """
+    gap = np.zeros(int(BATCH_GAP_SECONDS * audio.SAMPLE_RATE), dtype=np.float32)
+    parts, spans, offset = [], [], 0
+    for _, waveform in batch:
+        parts.extend((waveform, gap))
+        spans.append((offset / audio.SAMPLE_RATE, (offset + waveform.shape[0]) / audio.SAMPLE_RATE))
+        offset += waveform.shape[0] + gap.shape[0]
+
+    model = models.get_whisper_model(model_size, compute_type)
+    started = time.perf_counter()
+    # Don't let one recording's text prime the decoding of the next
+    # Word timestamps let split_segments cut a segment that runs across a boundary
+    segments, _ = model.transcribe(np.concatenate(parts), language=language, beam_size=beam_size,
+                                   condition_on_previous_text=False, word_timestamps=True)
+    per_job = split_segments(list(segments), spans)
+    return per_job, time.perf_counter() - started
+
+
+def process(worker_id, first_job, lease_seconds, transcribe_job):
+    """
+    Run first_job, batched with any other short jobs that are waiting.
+
+    Args:
+        worker_id (str): Worker running the jobs.
+        first_job (dict): Job already claimed by the worker.
+        lease_seconds (float): Lease for additionally claimed jobs.
+        transcribe_job (callable): transcribe_job(job, batched=None) -> transcript path
+            or None; runs the full per-job pipeline.
+
+    Returns:
+        list: (job, transcript_path) for every job claimed.
+    """
+    batch, singles = collect(worker_id, first_job, lease_seconds)
+    results = []
+    if len(batch) == 1:
+        singles.insert(0, batch[0][0])
+    elif batch:
+        model_size, compute_type = _settings(history_store.get_job(first_job['job_id']) or {})
+        try:
+            per_job, seconds = transcribe_batch(batch, first_job['language'], model_size, compute_type)
+        except Exception as e:
+            logger.error(f"Batched transcription of {len(batch)} jobs failed, running them singly: {str(e)}")
+            singles = [job for job, _ in batch] + singles
+        else:
+            total_audio = sum(waveform.shape[0] for _, waveform in batch) or 1
+            logger.info(f"Transcribed {len(batch)} jobs in one call ({seconds:.2f}s)")
+            for (job, waveform), segments in zip(batch, per_job):
+                # Each job is charged its share of the call by audio length
+                share = seconds * waveform.shape[0] / total_audio
+                results.append((job, transcribe_job(job, batched={'segments': segments, 'seconds': share})))
+    for job in singles:
+        results.append((job, transcribe_job(job)))
+    return results
@@ -0,0 +1,374 @@
+# app/bulk_ingest.py
+
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import utils
+import history_store
+import analytics
+import preflight
+import log_store
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.opus', '.aac', '.wma', '.webm',
+                    '.mp4', '.mkv', '.aif', '.aiff'}
+# Files copied in and registered per history transaction
+BULK_REGISTER_BATCH = int(os.getenv("BULK_REGISTER_BATCH", 200))
+# Seconds between progress lines
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", 30))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/worker.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('bulk_ingest')
+
+# The manifest lives next to the jobs it creates, so a file is marked
+# registered in the same transaction that inserts its job.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulk_files (
+    id            INTEGER PRIMARY KEY,
+    run           TEXT NOT NULL,
+    path          TEXT NOT NULL,
+    size          INTEGER NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    job_id        TEXT,
+    audio_seconds REAL,
+    error         TEXT,
+    updated_at    REAL NOT NULL,
+    UNIQUE (run, path)
+);
+CREATE INDEX IF NOT EXISTS idx_bulk_files_status ON bulk_files (run, status);
+"""
+
+_schema_ready = False
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def default_run_name(root):
+    """Name a run after its directory, so rerunning on the same tree resumes it."""
+    return hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:12]
+
+
+def discover(root, extensions=AUDIO_EXTENSIONS):
+    """Yield (path, size) for every audio file under root, skipping hidden files and folders."""
+    for folder, subfolders, files in os.walk(root):
+        subfolders[:] = sorted(name for name in subfolders if not name.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or os.path.splitext(name)[1].lower() not in extensions:
+                continue
+            path = os.path.join(folder, name)
+            try:
+                yield os.path.abspath(path), os.path.getsize(path)
+            except OSError as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+
+
+def scan(run, root, extensions=AUDIO_EXTENSIONS):
+    """
+    Add files under root that the run's manifest doesn't know yet.
+
+    Returns:
+        int: Number of new files.
+    """
+    conn = _connection()
+    added, batch = 0, []
+
+    def flush():
+        nonlocal added
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO bulk_files (run, path, size, updated_at) VALUES (?, ?, ?, ?)", batch
+            )
+            added += conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        batch.clear()
+
+    for path, size in discover(root, extensions):
+        batch.append((run, path, size, time.time()))
+        if len(batch) >= 1000:
+            flush()
+    if batch:
+        flush()
+    return added
+
+
+def _stored_name(run, row):
+    # Deterministic, so a copy left behind by a crash is overwritten on resume
+    return f"bulk-{run}-{row['id']}{os.path.splitext(row['path'])[1].lower()}"
+
+
+def _store(source, destination, link):
+    """Copy (or hard-link) a file into the upload folder; returns (sha256, size)."""
+    if link:
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.link(source, destination)
+        digest = hashlib.sha256()
+        with open(destination, 'rb') as f:
+            for block in iter(lambda: f.read(utils.COPY_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest(), os.path.getsize(destination)
+    with open(source, 'rb') as stream:
+        return utils.save_and_hash(stream, destination)
+
+
+def register_pending(run, username, language="en", model_size=None, compute_type=None, link=False,
+                     batch_size=BULK_REGISTER_BATCH):
+    """
+    Copy pending files into the upload folder and create their jobs.
+
+    Each batch of jobs goes into the history with one transaction, which
+    also marks the batch registered in the manifest. Jobs are not put on
+    the worker queue; the CLI runs them itself.
+
+    Returns:
+        int: Number of jobs created.
+    """
+    conn = _connection()
+    created = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, path FROM bulk_files WHERE run = ? AND status = 'pending' ORDER BY id LIMIT ?",
+            (run, batch_size)
+        ).fetchall()
+        if not rows:
+            return created
+
+        entries, manifest, failures = [], [], []
+        for row in rows:
+            secure_filename = _stored_name(run, row)
+            filepath = os.path.join(utils.UPLOAD_FOLDER, secure_filename)
+            try:
+                audio_hash, file_size = _store(row['path'], filepath, link)
+                probe = preflight.probe_upload(filepath)
+            except Exception as e:
+                logger.error(f"Could not register {row['path']}: {str(e)}")
+                failures.append((str(e), time.time(), row['id']))
+                continue
+            job_id = f"bulk-{run}-{row['id']}"
+            entry = {
+                "job_id": job_id,
+                "original_filename": os.path.basename(row['path']),
+                "filename": secure_filename,
+                "timestamp": datetime.now().strftime(history_store.TIMESTAMP_FORMAT),
+                "status": "Pending",
+                "language": language,
+                "file_size": file_size,
+                "user": username,
+                "display_name": os.path.basename(row['path']),
+                "audio_hash": audio_hash,
+                "source": "bulk",
+                "source_path": row['path']
+            }
+            entry.update({key: value for key, value in probe.items() if value is not None})
+            if model_size:
+                entry["model_size"] = model_size
+            if compute_type:
+                entry["compute_type"] = compute_type
+            entries.append(entry)
+            manifest.append((job_id, probe['audio_duration'], time.time(), row['id']))
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            history_store.insert_jobs(entries)
+            conn.executemany(
+                "UPDATE bulk_files SET status = 'registered', job_id = ?, audio_seconds = ?, updated_at = ? "
+                "WHERE id = ?", manifest
+            )
+            conn.executemany(
+                "UPDATE bulk_files SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", failures
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        try:
+            analytics.record_uploads(entries)
+        except Exception as e:
+            logger.error(f"Could not count bulk uploads in analytics: {str(e)}")
+        created += len(entries)
+        logger.info(f"Registered {len(entries)} files for run {run}")
+
+
+def _init_child(cpu_threads):
+    log_store.configure(f"bulk-{os.getpid()}")
+    os.environ.setdefault("WHISPER_CPU_THREADS", str(cpu_threads))
+
+
+def _transcribe(job_id):
+    """Run the worker's pipeline for one job in a pool process; returns (job_id, ok, audio seconds)."""
+    import ingest
+    import web_transcribe
+
+    record = history_store.get_job(job_id) or {}
+    filename = ingest.prepare({'job_id': job_id, 'filename': record['filename']})['filename']
+    _, transcript_path = web_transcribe.transcribe_file(
+        job_id=job_id, filename=filename, language=record.get('language', 'en'), user=record.get('user', 'bulk'),
+        model_size=record.get('model_size'), compute_type=record.get('compute_type')
+    )
+    audio_seconds = (history_store.get_job(job_id) or {}).get('audio_duration') or 0.0
+    return job_id, transcript_path is not None, audio_seconds
+
+
+class Progress:
+    """Running totals for a backfill, reported as files/hour and audio-hours/hour."""
+
+    def __init__(self, total_files, total_audio):
+        self.total_files = total_files
+        self.total_audio = total_audio
+        self.started = time.time()
+        self.done = self.failed = 0
+        self.audio_done = 0.0
+        self.last_report = 0.0
+
+    def add(self, ok, audio_seconds):
+        if ok:
+            self.done += 1
+            self.audio_done += audio_seconds
+        else:
+            self.failed += 1
+
+    def rates(self):
+        hours = max(time.time() - self.started, 1e-9) / 3600
+        return (self.done + self.failed) / hours, self.audio_done / 3600 / hours
+
+    def line(self):
+        files_per_hour, audio_per_hour = self.rates()
+        finished = self.done + self.failed
+        eta = ""
+        if files_per_hour and finished < self.total_files:
+            remaining_hours = (self.total_files - finished) / files_per_hour
+            if audio_per_hour and self.total_audio:
+                remaining_hours = max(0.0, self.total_audio / 3600 - self.audio_done / 3600) / audio_per_hour
+            eta = f", ETA {remaining_hours:.1f} h"
+        return (f"{finished}/{self.total_files} files ({self.failed} failed), "
+                f"{self.audio_done / 3600:.2f} audio h | {files_per_hour:.0f} files/h, "
+                f"{audio_per_hour:.2f} audio-h/h{eta}")
+
+    def maybe_report(self, force=False):
+        if force or time.time() - self.last_report >= BULK_PROGRESS_INTERVAL:
+            self.last_report = time.time()
+            print(self.line(), flush=True)
+            logger.info(self.line())
+
+
+def process(run, workers, retry_failed=False):
+    """
+    Transcribe every registered job of a run with a pool of processes.
+
+    Longest recordings are started first so the pool doesn't end on one
+    long straggler. Each finished job is marked in the manifest straight
+    away, so an interrupted run only redoes the jobs that were in flight.
+
+    Returns:
+        Progress: Final totals.
+    """
+    conn = _connection()
+    if retry_failed:
+        conn.execute(
+            "UPDATE bulk_files SET status = 'registered', error = NULL WHERE run = ? AND status = 'failed' "
+            "AND job_id IS NOT NULL", (run,)
+        )
+    rows = conn.execute(
+        "SELECT job_id, audio_seconds FROM bulk_files WHERE run = ? AND status = 'registered' "
+        "ORDER BY COALESCE(audio_seconds, 0) DESC", (run,)
+    ).fetchall()
+    progress = Progress(len(rows), sum(row['audio_seconds'] or 0.0 for row in rows))
+    if not rows:
+        return progress
+
+    import worker
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_child,
+                             initargs=(worker.CPU_THREADS_PER_WORKER,)) as pool:
+        futures = {pool.submit(_transcribe, row['job_id']): row['job_id'] for row in rows}
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                _, ok, audio_seconds = future.result()
+                error = None if ok else (history_store.get_job(job_id) or {}).get('error_message')
+            except Exception as e:
+                ok, audio_seconds, error = False, 0.0, str(e)
+                logger.error(f"Bulk job {job_id} crashed: {error}")
+            conn.execute(
+                "UPDATE bulk_files SET status = ?, error = ?, audio_seconds = COALESCE(?, audio_seconds), "
+                "updated_at = ? WHERE run = ? AND job_id = ?",
+                ('done' if ok else 'failed', error, audio_seconds or None, time.time(), run, job_id)
+            )
+            progress.add(ok, audio_seconds)
+            progress.maybe_report()
+    progress.maybe_report(force=True)
+    return progress
+
+
+def run_status(run):
+    """Count the run's files by manifest status."""
+    rows = _connection().execute(
+        "SELECT status, COUNT(*) AS n FROM bulk_files WHERE run = ? GROUP BY status", (run,)
+    ).fetchall()
+    return {row['status']: row['n'] for row in rows}
+
+
+def main(argv=None):
+    import worker
+
+    parser = argparse.ArgumentParser(description="Transcribe every audio file under a directory.")
+    parser.add_argument("root", help="Directory to walk")
+    parser.add_argument("--user", default="bulk", help="Owner of the created jobs")
+    parser.add_argument("--language", default="en", help="Language code, or 'auto' to detect per file")
+    parser.add_argument("--model", default=None, help="Whisper model size (defaults to WHISPER_MODEL)")
+    parser.add_argument("--compute-type", default=None)
+    parser.add_argument("--workers", type=int, default=worker.default_concurrency(),
+                        help="Transcription processes")
+    parser.add_argument("--run", default=None, help="Manifest name (defaults to one derived from root)")
+    parser.add_argument("--link", action="store_true", help="Hard-link files into uploads instead of copying")
+    parser.add_argument("--retry-failed", action="store_true", help="Run jobs that failed last time again")
+    parser.add_argument("--register-only", action="store_true", help="Create the jobs without transcribing")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"Not a directory: {args.root}")
+    utils.ensure_directories()
+    log_store.configure("bulk")
+    run = args.run or default_run_name(args.root)
+
+    started = time.time()
+    added = scan(run, args.root)
+    created = register_pending(run, args.user, args.language, args.model, args.compute_type, link=args.link)
+    print(f"Run {run}: {added} new files found, {created} jobs registered in {time.time() - started:.1f}s",
+          flush=True)
+
+    if not args.register_only:
+        progress = process(run, args.workers, retry_failed=args.retry_failed)
+        files_per_hour, audio_per_hour = progress.rates()
+        print(f"Finished {progress.done} files ({progress.failed} failed): "
+              f"{files_per_hour:.0f} files/h, {audio_per_hour:.2f} audio-h/h", flush=True)
+    status = run_status(run)
+    print(f"Run {run} status: {status}", flush=True)
+    return 0 if not status.get('failed') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
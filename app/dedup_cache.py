@@ -0,0 +1,168 @@
+# app/dedup_cache.py
+
+import os
+import time
+import logging
+
+import history_store
+
+# Bounds on the content-addressed index; least recently hit entries go first
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", 50000))
+DEDUP_MAX_BYTES = int(os.getenv("DEDUP_MAX_BYTES", 10 * 1024 ** 3))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('dedup_cache')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup (
+    audio_hash  TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    language    TEXT NOT NULL,
+    diarization INTEGER NOT NULL,
+    job_id      TEXT NOT NULL,
+    bytes       INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    last_hit_at REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (audio_hash, model, language, diarization)
+);
+CREATE INDEX IF NOT EXISTS idx_dedup_last_hit ON dedup (last_hit_at);
+CREATE TABLE IF NOT EXISTS dedup_counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+_schema_ready = False
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def _bump(conn, name):
+    conn.execute(
+        "INSERT INTO dedup_counters (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+    )
+
+
+def lookup(audio_hash, model, language, diarization, is_valid=None):
+    """
+    Find a finished job that already transcribed this exact audio with the same settings.
+
+    Args:
+        audio_hash (str): SHA-256 of the uploaded file.
+        model (str): Model identifier, e.g. 'large-v2/int8'.
+        language (str): Language code.
+        diarization (bool): Whether diarization was enabled.
+        is_valid (callable, optional): Checks a cached job_id is still usable
+            (e.g. its transcript hasn't been cleaned up); stale entries are dropped.
+
+    Returns:
+        str: job_id of the cached result, or None.
+    """
+    conn = _connection()
+    key = (audio_hash, model, language, int(bool(diarization)))
+    row = conn.execute(
+        "SELECT job_id FROM dedup WHERE audio_hash = ? AND model = ? AND language = ? AND diarization = ?", key
+    ).fetchone()
+    _bump(conn, 'lookups')
+    if row is None:
+        return None
+    if is_valid is not None and not is_valid(row['job_id']):
+        conn.execute(
+            "DELETE FROM dedup WHERE audio_hash = ? AND model = ? AND language = ? AND diarization = ?", key
+        )
+        return None
+    conn.execute(
+        "UPDATE dedup SET hits = hits + 1, last_hit_at = ? "
+        "WHERE audio_hash = ? AND model = ? AND language = ? AND diarization = ?",
+        (time.time(),) + key
+    )
+    _bump(conn, 'hits')
+    return row['job_id']
+
+
+def peek(audio_hash, model, language, diarization):
+    """Like lookup(), but read-only: no hit or lookup is counted and stale entries are kept."""
+    row = _connection().execute(
+        "SELECT job_id FROM dedup WHERE audio_hash = ? AND model = ? AND language = ? AND diarization = ?",
+        (audio_hash, model, language, int(bool(diarization)))
+    ).fetchone()
+    return row['job_id'] if row else None
+
+
+def record(audio_hash, model, language, diarization, job_id, size_bytes=0):
+    """Remember the result of a finished job and evict old entries if over the limits."""
+    conn = _connection()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO dedup (audio_hash, model, language, diarization, job_id, bytes, "
+        "created_at, last_hit_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+        (audio_hash, model, language, int(bool(diarization)), job_id, size_bytes, now, now)
+    )
+    evict()
+
+
+def evict(max_entries=None, max_bytes=None):
+    """
+    Drop least recently used entries until the index fits its limits.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    max_entries = DEDUP_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = DEDUP_MAX_BYTES if max_bytes is None else max_bytes
+    conn = _connection()
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM dedup").fetchone()
+    removed = 0
+    if count <= max_entries and total <= max_bytes:
+        return removed
+    for row in conn.execute("SELECT rowid, bytes FROM dedup ORDER BY last_hit_at ASC").fetchall():
+        if count <= max_entries and total <= max_bytes:
+            break
+        conn.execute("DELETE FROM dedup WHERE rowid = ?", (row['rowid'],))
+        count -= 1
+        total -= row['bytes']
+        removed += 1
+    if removed:
+        logger.info(f"Evicted {removed} dedup cache entries")
+    return removed
+
+
+def forget_job(job_id):
+    """Remove cache entries that point at a job (e.g. when it is deleted)."""
+    _connection().execute("DELETE FROM dedup WHERE job_id = ?", (job_id,))
+
+
+def stats():
+    """
+    Summarize cache effectiveness.
+
+    Returns:
+        dict: entries, bytes, lookups, hits and hit_rate.
+    """
+    conn = _connection()
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM dedup").fetchone()
+    counters = {row['name']: row['value'] for row in conn.execute("SELECT name, value FROM dedup_counters")}
+    lookups = counters.get('lookups', 0)
+    hits = counters.get('hits', 0)
+    return {
+        'entries': count,
+        'bytes': total,
+        'lookups': lookups,
+        'hits': hits,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+    }
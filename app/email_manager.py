@@ -0,0 +1,370 @@
+# app/email_manager.py
+import os
+import json
+import time
+import heapq
+import queue
+import socket
+import smtplib
+import logging
+import threading
+from datetime import datetime, timedelta
+# Removed unused import
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from dotenv import load_dotenv
+
+# Load environment variables
+if not load_dotenv():
+    logging.warning("Environment variables file (.env) not found or could not be loaded. Ensure environment variables are set.")
+else:
+    logging.info(".env file loaded successfully.")
+
+# Ensure the logs directory exists
+try:
+    os.makedirs('logs', exist_ok=True)
+except OSError as e:
+    logging.error(f"Failed to create logs directory: {e}")
+    raise
+
+# Configure logging
+logging.basicConfig(
+    filename='logs/email.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Messages sent over one connection before it is recycled (many servers cap this)
+MAIL_MAX_PER_CONNECTION = int(os.getenv('MAIL_MAX_PER_CONNECTION', 100))
+# Keep an idle connection open this long in case more mail is queued
+MAIL_IDLE_TIMEOUT = float(os.getenv('MAIL_IDLE_TIMEOUT', 30))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', 2.0))
+# Hour of the day (0-23, local time) the worker supervisor sends the daily summary; unset disables it
+DAILY_SUMMARY_HOUR = os.getenv('DAILY_SUMMARY_HOUR')
+USERS_FILE = os.getenv('USERS_FILE', 'users.json')
+
+def smtp_settings():
+    """
+    Read the SMTP configuration from the environment.
+
+    Returns:
+        dict: server, port, sender, password and starttls.
+    """
+    try:
+        smtp_port = int(os.getenv('SMTP_PORT', 587))
+    except ValueError:
+        logging.error("Invalid SMTP_PORT value in environment variables. Must be an integer.")
+        raise ValueError("Invalid SMTP_PORT value in environment variables.")
+
+    smtp_server = os.getenv('SMTP_SERVER', '').strip()
+    sender_email = os.getenv('EMAIL_ADDRESS', '').strip()
+    sender_password = os.getenv('EMAIL_PASSWORD', '').strip()
+
+    if not smtp_server or not sender_email or not sender_password:
+        logging.error("Missing SMTP configuration in environment variables.")
+        raise ValueError("SMTP configuration is incomplete. Please check your .env file.")
+
+    return {
+        'server': smtp_server,
+        'port': smtp_port,
+        'sender': sender_email,
+        'password': sender_password,
+        'starttls': os.getenv('SMTP_STARTTLS', '1') != '0'
+    }
+
+
+def build_message(subject, body, recipient_email, sender_email):
+    """Validate the recipient and build a plain-text message."""
+    if not recipient_email or "@" not in recipient_email:
+        logging.error(f"Invalid recipient email: {recipient_email}")
+        raise ValueError("Invalid recipient email address.")
+
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def send_email(subject, body, recipient_email):
+    """
+    Sends an email with the specified subject and body to the recipient.
+
+    Opens a connection for this one message; use MailDispatcher for bulk mail.
+    """
+    settings = smtp_settings()
+    msg = build_message(subject, body, recipient_email, settings['sender'])
+
+    try:
+        with smtplib.SMTP(settings['server'], settings['port']) as server:
+            if settings['starttls']:
+                server.starttls()
+            server.login(settings['sender'], settings['password'])
+            server.send_message(msg)
+        logging.info(f"Email sent to {recipient_email} with subject: {subject}")
+        return True
+    except smtplib.SMTPException as smtp_error:
+        logging.error(f"SMTP error occurred: {smtp_error}")
+        return False
+    except Exception as e:
+        logging.error(f"Failed to send email: {e}")
+        return False
+
+
+def _is_transient(error):
+    """4xx replies, dropped connections and network errors are worth retrying."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Every SMTPException is an OSError; the rest (e.g. SMTPNotSupportedError) won't fix themselves
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, (ConnectionError, TimeoutError, socket.gaierror))
+
+
+class MailDispatcher:
+    """
+    Sends queued mail from a background thread over one persistent SMTP connection.
+
+    The connection is opened (STARTTLS + login) once and reused for every
+    queued message until it has sent MAIL_MAX_PER_CONNECTION messages or sat
+    idle for MAIL_IDLE_TIMEOUT seconds. Transient failures reconnect and retry
+    with exponential backoff; a message waiting for its retry is set aside
+    until it is due, so it doesn't hold up the rest of the queue. Permanent
+    rejections are logged and dropped.
+
+    Args:
+        server, port, sender, password, starttls: SMTP settings; default to smtp_settings().
+            Pass password=None and starttls=False to talk to a local stand-in
+            such as `python -m aiosmtpd -n -l localhost:8025`.
+    """
+
+    def __init__(self, server=None, port=None, sender=None, password=None, starttls=None,
+                 max_per_connection=MAIL_MAX_PER_CONNECTION, idle_timeout=MAIL_IDLE_TIMEOUT,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_base=MAIL_RETRY_BASE):
+        if server is None:
+            settings = smtp_settings()
+            server, port, sender = settings['server'], settings['port'], settings['sender']
+            password, starttls = settings['password'], settings['starttls']
+        self.server = server
+        self.port = port or 587
+        self.sender = sender
+        self.password = password
+        self.starttls = bool(starttls)
+        self.max_per_connection = max_per_connection
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'connections': 0}
+        self._queue = queue.Queue()
+        # (due monotonic time, sequence, msg, attempt) of messages waiting to be retried
+        self._delayed = []
+        self._sequence = 0
+        self._last_activity = time.monotonic()
+        self._conn = None
+        self._sent_on_conn = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, subject, body, recipient_email):
+        """Queue a message; returns immediately. Invalid recipients raise ValueError here."""
+        msg = build_message(subject, body, recipient_email, self.sender)
+        self.stats['queued'] += 1
+        self._queue.put((msg, 1))
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been sent or given up on.
+
+        Returns:
+            bool: True if the queue drained within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks or self._delayed:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=None):
+        """Send what is queued, then stop the worker thread and close the connection."""
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.server, self.port, timeout=30)
+        if self.starttls:
+            conn.starttls()
+        if self.password:
+            conn.login(self.sender, self.password)
+        self._conn = conn
+        self._sent_on_conn = 0
+        self.stats['connections'] += 1
+        return conn
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except (smtplib.SMTPException, OSError):
+            self._conn.close()
+        self._conn = None
+
+    def _send(self, msg):
+        if self._conn is None or self._sent_on_conn >= self.max_per_connection:
+            self._disconnect()
+            self._connect()
+        self._conn.send_message(msg)
+        self._sent_on_conn += 1
+
+    def _release_due(self):
+        """Move retries whose backoff has passed back onto the queue; returns seconds to the next one."""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, msg, attempt = self._delayed[0]
+            # Queue before unlisting so flush() never sees the message in neither place
+            self._queue.put((msg, attempt))
+            heapq.heappop(self._delayed)
+        return self._delayed[0][0] - now if self._delayed else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            next_retry = self._release_due()
+            timeout = self.idle_timeout if self._conn else 0.5
+            if next_retry is not None:
+                timeout = min(timeout, next_retry)
+            try:
+                msg, attempt = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                if time.monotonic() - self._last_activity >= self.idle_timeout:
+                    # Nothing sent for a while: don't hold the server's connection slot
+                    self._disconnect()
+                continue
+
+            self._last_activity = time.monotonic()
+            try:
+                self._send(msg)
+                self.stats['sent'] += 1
+                logging.info(f"Email sent to {msg['To']} with subject: {msg['Subject']}")
+            except Exception as e:
+                # The connection may be unusable after any error; start fresh next time
+                self._disconnect()
+                if _is_transient(e) and attempt < self.max_attempts:
+                    self.stats['retries'] += 1
+                    delay = self.retry_base * 2 ** (attempt - 1)
+                    self._sequence += 1
+                    heapq.heappush(self._delayed, (time.monotonic() + delay, self._sequence, msg, attempt + 1))
+                    logging.warning(f"Retrying email to {msg['To']} in {delay:.0f}s (attempt {attempt}): {e}")
+                else:
+                    self.stats['failed'] += 1
+                    logging.error(f"Giving up on email to {msg['To']} after {attempt} attempts: {e}")
+            finally:
+                self._queue.task_done()
+        self._disconnect()
+
+
+def format_daily_summary(summary, username):
+    """
+    Render the daily summary for one user from stats computed once for everyone.
+
+    Args:
+        summary (dict): Output of analytics.summary().
+        username (str): Recipient's username.
+
+    Returns:
+        tuple: (subject, body)
+    """
+    mine = next((row for row in summary['users'] if row['user'] == username), None) or {}
+    peak = summary.get('peak_hour')
+    lines = [
+        f"Hello {username},",
+        "",
+        "Your transcriptions:",
+        f"  Uploads: {mine.get('uploads', 0)}",
+        f"  Completed: {mine.get('completed', 0)}",
+        f"  Failed: {mine.get('failed', 0)}",
+        f"  Audio transcribed: {mine.get('audio_hours', 0)} hours",
+        "",
+        "Across the server:",
+        f"  Uploads: {summary['total_uploads']}",
+        f"  Audio transcribed: {summary['audio_hours']} hours",
+        f"  Peak usage time: {'-' if peak is None else f'{peak:02d}:00'}",
+    ]
+    return "Your daily transcription summary", "\n".join(lines)
+
+
+def send_daily_summary(recipients, dispatcher=None, summary=None):
+    """
+    Queue the daily summary for every recipient over one pooled connection.
+
+    Args:
+        recipients (list): User dicts with 'username' and 'email'.
+        dispatcher (MailDispatcher, optional): Defaults to one built from the environment.
+        summary (dict, optional): Precomputed analytics.summary(); computed once here otherwise.
+
+    Returns:
+        dict: The dispatcher's delivery stats after the queue has drained.
+    """
+    if summary is None:
+        import analytics
+        summary = analytics.summary()
+    owns_dispatcher = dispatcher is None
+    dispatcher = dispatcher or MailDispatcher()
+    for user in recipients:
+        if not user.get('email') or not user.get('active', True):
+            continue
+        subject, body = format_daily_summary(summary, user.get('username'))
+        try:
+            dispatcher.submit(subject, body, user['email'])
+        except ValueError:
+            continue
+    if owns_dispatcher:
+        dispatcher.close()
+    else:
+        dispatcher.flush()
+    logging.info(f"Daily summary delivery: {dispatcher.stats}")
+    return dict(dispatcher.stats)
+
+
+def load_recipients(users_file=USERS_FILE):
+    """Read the users to send the daily summary to from users.json."""
+    try:
+        with open(users_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not read {users_file}: {e}")
+        return []
+
+
+def next_summary_time(now, hour):
+    """The next time the daily summary is due, at the given hour of the day."""
+    due = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    return due if due > now else due + timedelta(days=1)
+
+
+def run_daily_summary_forever(hour=None, stop_event=None):
+    """Send the daily summary at DAILY_SUMMARY_HOUR every day until stop_event is set."""
+    hour = int(DAILY_SUMMARY_HOUR if hour is None else hour)
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        wait = (next_summary_time(datetime.now(), hour) - datetime.now()).total_seconds()
+        if stop_event.wait(max(wait, 0)):
+            return
+        try:
+            send_daily_summary(load_recipients())
+        except Exception as e:
+            logging.error(f"Daily summary failed: {e}")
+
+
+if __name__ == "__main__":
+    # One-off send, e.g. from cron
+    print(json.dumps(send_daily_summary(load_recipients()), indent=2))
@@ -0,0 +1,126 @@
+# app/exporters.py
+
+import os
+import json
+import glob
+import logging
+
+import transcript_store
+
+EXPORT_FOLDER = os.getenv("EXPORT_FOLDER", os.path.join(transcript_store.TRANSCRIPTS_FOLDER, "exports"))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('exporters')
+
+
+def _timestamp(seconds, separator):
+    millis = int(round(max(seconds, 0.0) * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def iter_txt(segments):
+    """Yield the plain-text transcript, one bracketed line per segment."""
+    for seg in segments:
+        speaker = f"{seg['speaker']}: " if seg.get('speaker') else ""
+        yield f"[{seg['start']:.2f} - {seg['end']:.2f}] {speaker}{seg['text']}\n"
+
+
+def iter_srt(segments):
+    """Yield SubRip cues."""
+    for number, seg in enumerate(segments, start=1):
+        speaker = f"{seg['speaker']}: " if seg.get('speaker') else ""
+        yield (f"{number}\n{_timestamp(seg['start'], ',')} --> {_timestamp(seg['end'], ',')}\n"
+               f"{speaker}{seg['text']}\n\n")
+
+
+def iter_vtt(segments):
+    """Yield WebVTT cues, using voice tags for speakers."""
+    yield "WEBVTT\n\n"
+    for seg in segments:
+        text = f"<v {seg['speaker']}>{seg['text']}" if seg.get('speaker') else seg['text']
+        yield f"{_timestamp(seg['start'], '.')} --> {_timestamp(seg['end'], '.')}\n{text}\n\n"
+
+
+def iter_json(segments):
+    """Yield a JSON array of segments one element at a time."""
+    yield "["
+    for i, seg in enumerate(segments):
+        yield ("," if i else "") + json.dumps(seg)
+    yield "]\n"
+
+
+# format -> (renderer, mimetype, file extension)
+FORMATS = {
+    'txt': (iter_txt, 'text/plain; charset=utf-8', 'txt'),
+    'srt': (iter_srt, 'application/x-subrip; charset=utf-8', 'srt'),
+    'vtt': (iter_vtt, 'text/vtt; charset=utf-8', 'vtt'),
+    'json': (iter_json, 'application/json', 'json'),
+}
+
+
+def export_path(transcript_id, version, fmt):
+    return os.path.join(EXPORT_FOLDER, transcript_id, f"v{version}.{FORMATS[fmt][2]}")
+
+
+def etag_for(transcript_id, version, fmt):
+    return f"{transcript_id}-v{version}-{fmt}"
+
+
+def get_export(transcript_id, fmt):
+    """
+    Return a rendered export, rendering it only if this version isn't cached yet.
+
+    Renders stream straight to disk, so memory use doesn't grow with the
+    transcript. Cached files for older versions of the transcript are
+    removed when a newer version is rendered.
+
+    Args:
+        transcript_id (str): Transcript to export.
+        fmt (str): One of FORMATS.
+
+    Returns:
+        tuple: (path, etag, mimetype)
+
+    Raises:
+        KeyError: If fmt is not supported.
+        transcript_store.TranscriptNotFound: If the transcript does not exist.
+    """
+    renderer, mimetype, _ = FORMATS[fmt]
+    transcript = transcript_store.get_transcript(transcript_id)
+    version = transcript['version']
+    path = export_path(transcript_id, version, fmt)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for chunk in renderer(transcript['segments']):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        logger.info(f"Rendered {fmt} export of {transcript_id} at version {version}")
+        _prune(transcript_id, keep_version=version)
+
+    return path, etag_for(transcript_id, version, fmt), mimetype
+
+
+def _prune(transcript_id, keep_version):
+    for path in glob.glob(os.path.join(EXPORT_FOLDER, transcript_id, "v*.*")):
+        name = os.path.basename(path)
+        if not name.endswith(".tmp") and not name.startswith(f"v{keep_version}."):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def invalidate(transcript_id):
+    """Drop every cached export of a transcript."""
+    _prune(transcript_id, keep_version=None)
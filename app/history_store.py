@@ -0,0 +1,364 @@
+# app/history_store.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('history_store')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id    TEXT NOT NULL UNIQUE,
+    user      TEXT,
+    status    TEXT,
+    timestamp TEXT,
+    data      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user, seq);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, seq);
+CREATE INDEX IF NOT EXISTS idx_jobs_timestamp ON jobs (timestamp);
+CREATE TABLE IF NOT EXISTS progress (
+    job_id          TEXT PRIMARY KEY,
+    processed       REAL NOT NULL,
+    duration        REAL NOT NULL,
+    percent         REAL NOT NULL,
+    eta_seconds     REAL,
+    updated_at      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+
+
+def get_connection():
+    """
+    Return this thread's connection to the history database.
+
+    Connections are cached per thread and per process, so forked workers
+    never share a handle with their parent.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(HISTORY_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def normalize_timestamp(value):
+    """Convert the timestamp formats found in old history files to TIMESTAMP_FORMAT."""
+    if not value:
+        return value
+    for fmt in (TIMESTAMP_FORMAT, "%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    return value
+
+
+def _row_values(record):
+    record = dict(record)
+    record['timestamp'] = normalize_timestamp(record.get('timestamp'))
+    return record, (record['job_id'], record.get('user'), record.get('status'),
+                    record.get('timestamp'), json.dumps(record))
+
+
+def insert_job(record):
+    """
+    Add a job record to the history (newest first).
+
+    Args:
+        record (dict): Job record; must contain 'job_id'.
+    """
+    _, values = _row_values(record)
+    get_connection().execute(
+        "INSERT INTO jobs (job_id, user, status, timestamp, data) VALUES (?, ?, ?, ?, ?)", values
+    )
+
+
+def insert_jobs(records):
+    """
+    Add many job records with one write, e.g. for a bulk import.
+
+    Runs in one transaction, or as part of the caller's if one is open.
+
+    Args:
+        records (list): Job records; each must contain 'job_id'.
+    """
+    conn = get_connection()
+    rows = [_row_values(record)[1] for record in records]
+    sql = "INSERT INTO jobs (job_id, user, status, timestamp, data) VALUES (?, ?, ?, ?, ?)"
+    if conn.in_transaction:
+        conn.executemany(sql, rows)
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(sql, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def update_job(job_id, fields):
+    """
+    Merge fields into an existing job record.
+
+    Args:
+        job_id (str): ID of the job to update.
+        fields (dict): Fields to set on the record.
+
+    Returns:
+        bool: True if the job existed and was updated.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None:
+            record = json.loads(row['data'])
+            record.update(fields)
+            _write(conn, record)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row is not None
+
+
+def _write(conn, record):
+    record, values = _row_values(record)
+    conn.execute(
+        "UPDATE jobs SET user = ?, status = ?, timestamp = ?, data = ? WHERE job_id = ?",
+        values[1:] + values[:1]
+    )
+
+
+def get_job(job_id):
+    """Return a job record by ID, or None."""
+    row = get_connection().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def list_jobs(user=None, status=None, limit=None):
+    """
+    List job records, newest first.
+
+    Args:
+        user (str, optional): Only return jobs owned by this user.
+        status (str, optional): Only return jobs with this status.
+        limit (int, optional): Maximum number of records.
+
+    Returns:
+        list: Job records.
+    """
+    clauses, params = [], []
+    if user is not None:
+        clauses.append("user = ?")
+        params.append(user)
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    sql = "SELECT data FROM jobs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY seq DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return [json.loads(row['data']) for row in get_connection().execute(sql, params)]
+
+
+# Sort keys for query_jobs(); each is paired with seq so the order is total
+SORT_COLUMNS = {'timestamp': 'timestamp', 'created': 'seq', 'user': 'user', 'status': 'status'}
+
+
+def query_jobs(user=None, status=None, language=None, since=None, until=None, search=None,
+               sort='timestamp', descending=True, cursor=None, limit=50):
+    """
+    Return one page of job records using keyset (cursor) pagination.
+
+    Args:
+        user, status, language (str, optional): Exact-match filters.
+        since (str, optional): Only jobs with timestamp >= since.
+        until (str, optional): Only jobs with timestamp < until.
+        search (str, optional): Free text that must appear in the transcript.
+        sort (str): One of SORT_COLUMNS.
+        descending (bool): Newest/largest first.
+        cursor (list, optional): next_cursor from the previous page.
+        limit (int): Page size.
+
+    Returns:
+        tuple: (records, next_cursor); next_cursor is None on the last page.
+    """
+    column = SORT_COLUMNS.get(sort)
+    if column is None:
+        raise ValueError(f"Unknown sort key: {sort}")
+    clauses, params = [], []
+    for name, value in (('user', user), ('status', status)):
+        if value is not None:
+            clauses.append(f"{name} = ?")
+            params.append(value)
+    if language is not None:
+        clauses.append("json_extract(data, '$.language') = ?")
+        params.append(language)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(normalize_timestamp(since))
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(normalize_timestamp(until))
+    if search:
+        import search_index
+        match = search_index.match_filter(search)
+        if match is None:
+            return [], None
+        clauses.append(f"job_id IN ({match[0]})")
+        params.extend(match[1])
+    if cursor is not None:
+        if len(cursor) != 2:
+            raise ValueError("Malformed cursor")
+        # Row-value comparison continues exactly after the last row of the previous page
+        clauses.append(f"({column}, seq) {'<' if descending else '>'} (?, ?)")
+        params.extend(cursor)
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT seq, {column} AS sort_key, data FROM jobs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {column} {direction}, seq {direction} LIMIT ?"
+    rows = get_connection().execute(sql, params + [int(limit) + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = [rows[-1]['sort_key'], rows[-1]['seq']]
+    return [json.loads(row['data']) for row in rows], next_cursor
+
+
+def jobs_older_than(cutoff, limit=None):
+    """
+    List jobs whose timestamp is before cutoff, oldest first, using the timestamp index.
+
+    Args:
+        cutoff (datetime): Exclusive upper bound.
+        limit (int, optional): Maximum number of records.
+    """
+    sql = "SELECT data FROM jobs WHERE timestamp < ? ORDER BY timestamp ASC"
+    params = [cutoff.strftime(TIMESTAMP_FORMAT)]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return [json.loads(row['data']) for row in get_connection().execute(sql, params)]
+
+
+def delete_jobs(job_ids):
+    """Delete job records by ID. Returns the number of rows removed."""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return 0
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        removed = conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in job_ids]).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return removed
+
+
+def set_progress(job_id, processed, duration, eta_seconds=None):
+    """
+    Record how far a running job has got.
+
+    Progress lives in its own narrow table so frequent updates don't
+    rewrite the job record.
+
+    Args:
+        job_id (str): ID of the job.
+        processed (float): Seconds of audio processed so far.
+        duration (float): Total seconds of audio.
+        eta_seconds (float, optional): Estimated seconds until completion.
+    """
+    percent = 100.0 if duration <= 0 else min(100.0, 100.0 * processed / duration)
+    get_connection().execute(
+        "INSERT OR REPLACE INTO progress (job_id, processed, duration, percent, eta_seconds, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (job_id, processed, duration, round(percent, 1), eta_seconds, time.time())
+    )
+
+
+def get_progress(job_id):
+    """Return the latest progress for a job as a dict, or None."""
+    row = get_connection().execute("SELECT * FROM progress WHERE job_id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def migrate_from_json(history_file):
+    """
+    Import an existing uploads.json history into the database, once.
+
+    The JSON file is left in place; a marker in the meta table prevents a
+    second import.
+
+    Args:
+        history_file (str): Path to the legacy JSON history.
+
+    Returns:
+        int: Number of records imported.
+    """
+    conn = get_connection()
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+        return 0
+    records = []
+    if os.path.exists(history_file) and os.path.getsize(history_file) > 0:
+        with open(history_file, 'r') as f:
+            records = json.load(f)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # The JSON file is newest first; insert oldest first so seq keeps that order
+        imported = 0
+        for record in reversed(records):
+            if not record.get('job_id'):
+                continue
+            _, values = _row_values(record)
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, user, status, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                values
+            )
+            imported += 1
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+            (datetime.now().strftime(TIMESTAMP_FORMAT),)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info(f"Migrated {imported} history records from {history_file}")
+    return imported
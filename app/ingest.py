@@ -0,0 +1,204 @@
+# app/ingest.py
+
+import os
+import shutil
+import logging
+
+import av
+
+import audio
+import history_store
+import job_queue
+
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
+# Canonical storage format for uploads: 'flac' (lossless), 'opus' (smallest) or 'off' (keep as uploaded)
+INGEST_FORMAT = os.getenv("INGEST_FORMAT", "flac").lower()
+INGEST_OPUS_BITRATE = int(os.getenv("INGEST_OPUS_BITRATE", 32000))
+# Where originals are moved after transcoding; empty deletes them
+COLD_STORAGE_FOLDER = os.getenv("COLD_STORAGE_FOLDER", "")
+
+# format -> (codec, container, file extension)
+FORMATS = {
+    'flac': ('flac', 'flac', '.flac'),
+    'opus': ('libopus', 'ogg', '.opus'),
+}
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/worker.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('ingest')
+
+
+def probe(filepath):
+    """
+    Describe the first audio stream of a file without decoding it.
+
+    Returns:
+        dict: codec, sample_rate, channels and duration (seconds, None if the container doesn't say).
+    """
+    with av.open(filepath, metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        duration = None
+        if container.duration is not None:
+            duration = container.duration / av.time_base
+        elif stream.duration is not None and stream.time_base is not None:
+            duration = float(stream.duration * stream.time_base)
+        return {
+            'codec': stream.codec_context.name,
+            'sample_rate': stream.codec_context.sample_rate,
+            'channels': stream.codec_context.channels,
+            'duration': duration
+        }
+
+
+def is_canonical(info, fmt=INGEST_FORMAT):
+    codec = FORMATS[fmt][0]
+    # Opus decoders always report 48 kHz, whatever rate was encoded
+    rate_ok = fmt == 'opus' or info['sample_rate'] == audio.SAMPLE_RATE
+    return info['codec'] in (codec, codec.replace('lib', '')) and rate_ok and info['channels'] == 1
+
+
+def transcode(filepath, output_path, fmt=INGEST_FORMAT):
+    """
+    Re-encode an audio file as 16 kHz mono FLAC or Opus, streaming frame by frame.
+
+    Memory use stays constant regardless of the length of the recording.
+
+    Args:
+        filepath: Path to the source audio file.
+        output_path: Path of the file to write.
+        fmt (str): One of FORMATS.
+
+    Returns:
+        int: Number of samples written.
+    """
+    codec, container_format, _ = FORMATS[fmt]
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=audio.SAMPLE_RATE)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    samples = 0
+
+    with av.open(filepath, metadata_errors="ignore") as source, \
+            av.open(tmp_path, "w", format=container_format) as out:
+        stream = out.add_stream(codec, rate=audio.SAMPLE_RATE)
+        stream.codec_context.layout = "mono"
+        stream.codec_context.format = "s16"
+        if fmt == 'opus':
+            stream.codec_context.bit_rate = INGEST_OPUS_BITRATE
+
+        def encode(frames):
+            nonlocal samples
+            if frames is None:
+                return
+            if not isinstance(frames, list):
+                frames = [frames]
+            for frame in frames:
+                frame.pts = None
+                samples += frame.samples
+                out.mux(stream.encode(frame))
+
+        for frame in source.decode(audio=0):
+            frame.pts = None
+            encode(resampler.resample(frame))
+        # Flush the resampler, then the encoder
+        encode(resampler.resample(None))
+        out.mux(stream.encode(None))
+
+    os.replace(tmp_path, output_path)
+    return samples
+
+
+def _retire_original(filepath):
+    """Move an original upload to cold storage, or delete it; returns its new path or None."""
+    audio.evict(os.path.basename(filepath))
+    if not COLD_STORAGE_FOLDER:
+        os.remove(filepath)
+        return None
+    os.makedirs(COLD_STORAGE_FOLDER, exist_ok=True)
+    destination = os.path.join(COLD_STORAGE_FOLDER, os.path.basename(filepath))
+    shutil.move(filepath, destination)
+    return destination
+
+
+def normalize_upload(job_id, filename, fmt=INGEST_FORMAT):
+    """
+    Store a job's upload in the canonical format and record what was done.
+
+    Uploads already in the canonical format are only probed. The job
+    record gets the codec, duration and sizes, and the stored filename is
+    updated in both the history and the queue.
+
+    Args:
+        job_id (str): Job the upload belongs to.
+        filename (str): Current name of the upload in UPLOAD_FOLDER.
+        fmt (str): One of FORMATS.
+
+    Returns:
+        str: Name of the stored upload after ingest.
+    """
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    info = probe(filepath)
+    original_size = os.path.getsize(filepath)
+    fields = {
+        'original_codec': info['codec'],
+        'original_sample_rate': info['sample_rate'],
+        'original_channels': info['channels']
+    }
+
+    if is_canonical(info, fmt):
+        fields.update({'codec': info['codec'], 'audio_duration': info['duration']})
+        history_store.update_job(job_id, fields)
+        return filename
+
+    stem, extension = os.path.splitext(filename)
+    if extension == FORMATS[fmt][2]:
+        # e.g. a 44.1 kHz stereo FLAC; keep the original under its own name
+        stem += "-16k"
+    new_filename = stem + FORMATS[fmt][2]
+    new_path = os.path.join(UPLOAD_FOLDER, new_filename)
+    samples = transcode(filepath, new_path, fmt)
+    new_size = os.path.getsize(new_path)
+    fields.update({
+        'filename': new_filename,
+        'codec': FORMATS[fmt][0],
+        'audio_duration': round(samples / audio.SAMPLE_RATE, 2),
+        'file_size': new_size,
+        'original_size': original_size
+    })
+    # Point the job at the new file before the original goes away
+    history_store.update_job(job_id, fields)
+    job_queue.set_filename(job_id, new_filename)
+    cold_path = _retire_original(filepath)
+    if cold_path:
+        history_store.update_job(job_id, {'cold_storage_path': cold_path})
+
+    logger.info(f"Transcoded {filename} ({info['codec']}, {info['sample_rate']} Hz, {info['channels']} ch, "
+                f"{original_size} bytes) to {new_filename} ({new_size} bytes)")
+    return new_filename
+
+
+def prepare(job):
+    """
+    Run ingest for a freshly claimed job, once.
+
+    A failure is logged and the job goes on with the file as uploaded;
+    if that can't be decoded either, transcription reports the error.
+
+    Args:
+        job (dict): Job as returned by job_queue.claim; its filename is updated.
+
+    Returns:
+        dict: The same job.
+    """
+    record = history_store.get_job(job['job_id']) or {}
+    if record.get('filename'):
+        job['filename'] = record['filename']
+    if INGEST_FORMAT == 'off' or record.get('codec'):
+        return job
+    try:
+        job['filename'] = normalize_upload(job['job_id'], job['filename'])
+    except Exception as e:
+        logger.warning(f"Could not transcode {job['filename']} (job {job['job_id']}), keeping the original: {str(e)}")
+    return job
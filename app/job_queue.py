@@ -0,0 +1,334 @@
+# app/job_queue.py
+
+import os
+import time
+import heapq
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+QUEUE_DB = os.getenv("QUEUE_DB", "queue.db")
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 3))
+RETRY_BACKOFF_SECONDS = float(os.getenv("QUEUE_RETRY_BACKOFF", 30))
+# 'sjf' runs the shortest recording first (with aging); 'fifo' keeps arrival order
+QUEUE_SCHEDULING = os.getenv("QUEUE_SCHEDULING", "sjf").lower()
+# Seconds of audio a queued job is moved ahead by for every second it waits,
+# so a long recording overtakes newly arriving short ones eventually
+QUEUE_AGING_RATE = float(os.getenv("QUEUE_AGING_RATE", 0.25))
+# Assumed length of uploads whose duration could not be read
+QUEUE_UNKNOWN_AUDIO_SECONDS = float(os.getenv("QUEUE_UNKNOWN_AUDIO_SECONDS", 600))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/queue.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('job_queue')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    job_id       TEXT PRIMARY KEY,
+    filename     TEXT NOT NULL,
+    user         TEXT NOT NULL,
+    language     TEXT NOT NULL,
+    priority     INTEGER NOT NULL DEFAULT 0,
+    state        TEXT NOT NULL DEFAULT 'queued',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    enqueued_at  REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at   REAL,
+    lease_until  REAL,
+    worker       TEXT,
+    last_error   TEXT,
+    audio_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_state ON queue (state, available_at);
+CREATE INDEX IF NOT EXISTS idx_queue_user ON queue (user, state);
+"""
+
+
+@contextmanager
+def _connect():
+    """Open a connection to the queue database, creating the schema if needed."""
+    conn = sqlite3.connect(QUEUE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        yield conn
+    finally:
+        conn.close()
+
+
+_migrated = False
+
+
+def _migrate(conn):
+    """Add columns introduced after a queue.db was created."""
+    global _migrated
+    if _migrated:
+        return
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(queue)")}
+    if 'audio_seconds' not in columns:
+        conn.execute("ALTER TABLE queue ADD COLUMN audio_seconds REAL")
+    _migrated = True
+
+
+def _order_by():
+    """
+    ORDER BY for picking the next job; takes the parameters of _order_params().
+
+    Fair share comes first, then priority. Under 'sjf' the shortest
+    recording goes next, less QUEUE_AGING_RATE seconds for each second it
+    has waited; ties (and 'fifo') fall back to arrival order.
+    """
+    clause = ("(SELECT COUNT(*) FROM queue r WHERE r.state = 'running' AND r.user = q.user) ASC, "
+              "q.priority DESC, ")
+    if QUEUE_SCHEDULING == 'sjf':
+        clause += "COALESCE(q.audio_seconds, ?) - ? * (? - q.enqueued_at) ASC, "
+    return clause + "q.enqueued_at ASC"
+
+
+def _order_params(now):
+    return [QUEUE_UNKNOWN_AUDIO_SECONDS, QUEUE_AGING_RATE, now] if QUEUE_SCHEDULING == 'sjf' else []
+
+
+def enqueue(job_id, filename, user, language="en", priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS,
+            audio_seconds=None):
+    """
+    Add a job to the transcription queue.
+
+    Args:
+        job_id (str): ID of the job (as recorded in the upload history).
+        filename (str): Name of the uploaded file in UPLOAD_FOLDER.
+        user (str): Username that owns the job, used for fair-share scheduling.
+        language (str): Language code for transcription.
+        priority (int): Higher values are claimed first within a user's share.
+        max_attempts (int): How many times the job may be tried before failing.
+        audio_seconds (float, optional): Length of the recording, for shortest-job-first.
+    """
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO queue (job_id, filename, user, language, priority, state, "
+            "attempts, max_attempts, enqueued_at, available_at, audio_seconds) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)",
+            (job_id, filename, user, language, priority, max_attempts, now, now, audio_seconds)
+        )
+    logger.info(f"Enqueued job {job_id} for {user} (priority={priority})")
+
+
+def claim(worker_id, lease_seconds, language=None, user=None):
+    """
+    Atomically claim the next job for a worker.
+
+    Jobs are picked fair-share first (the user with the fewest running jobs
+    goes next), then by priority, then shortest recording first with aging
+    (see _order_by). Expired leases are left to the supervisor, which
+    terminates the worker holding them first (see release_orphaned).
+
+    Args:
+        worker_id (str): Identifier of the claiming worker.
+        lease_seconds (float): How long the worker may hold the job before it times out.
+        language (str, optional): Only claim jobs in this language (used to fill a batch).
+        user (str, optional): Only claim jobs of this user (used to fill a batch).
+
+    Returns:
+        dict: The claimed job, or None if nothing is ready.
+    """
+    now = time.time()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT q.* FROM queue q WHERE q.state = 'queued' AND q.available_at <= ? "
+                "AND (? IS NULL OR q.language = ?) AND (? IS NULL OR q.user = ?) "
+                f"ORDER BY {_order_by()} LIMIT 1",
+                [now, language, language, user, user] + _order_params(now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE queue SET state = 'running', attempts = attempts + 1, started_at = ?, "
+                "lease_until = ?, worker = ? WHERE job_id = ?",
+                (now, now + lease_seconds, worker_id, row['job_id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    job = dict(row)
+    job['attempts'] += 1
+    job['wait_seconds'] = now - job['enqueued_at']
+    return job
+
+
+def has_ready(language=None, user=None, now=None):
+    """
+    Whether any job could be claimed right now, without taking the write lock.
+
+    Cheap enough to poll; claim() still decides which job is taken.
+    """
+    now = now or time.time()
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM queue WHERE state = 'queued' AND available_at <= ? "
+            "AND (? IS NULL OR language = ?) AND (? IS NULL OR user = ?) LIMIT 1",
+            (now, language, language, user, user)
+        ).fetchone()
+    return row is not None
+
+
+def set_filename(job_id, filename):
+    """Point a queued or running job at a new stored file (e.g. after transcoding)."""
+    with _connect() as conn:
+        conn.execute("UPDATE queue SET filename = ? WHERE job_id = ?", (filename, job_id))
+
+
+def complete(job_id):
+    """Remove a finished job from the queue."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+
+
+def fail(job_id, error_message):
+    """
+    Record a failed attempt, rescheduling the job with backoff if it has attempts left.
+
+    Returns:
+        bool: True if the job will be retried, False if it is permanently failed.
+    """
+    now = time.time()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT attempts, max_attempts FROM queue WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return False
+        retry = row['attempts'] < row['max_attempts']
+        if retry:
+            conn.execute(
+                "UPDATE queue SET state = 'queued', available_at = ?, lease_until = NULL, "
+                "worker = NULL, last_error = ? WHERE job_id = ?",
+                (now + RETRY_BACKOFF_SECONDS * (2 ** (row['attempts'] - 1)), error_message, job_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE queue SET state = 'failed', lease_until = NULL, last_error = ? WHERE job_id = ?",
+                (error_message, job_id)
+            )
+        conn.execute("COMMIT")
+    logger.info(f"Job {job_id} failed ({'retrying' if retry else 'giving up'}): {error_message}")
+    return retry
+
+
+def expired_leases(now=None):
+    """
+    List running jobs whose lease has run out.
+
+    Returns:
+        list: (job_id, worker) tuples for jobs that exceeded their timeout.
+    """
+    now = now or time.time()
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT job_id, worker FROM queue WHERE state = 'running' AND lease_until < ?", (now,)
+        ).fetchall()
+    return [(row['job_id'], row['worker']) for row in rows]
+
+
+def release_worker(worker_id, error_message):
+    """Fail every job held by a worker that died or was terminated."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT job_id FROM queue WHERE state = 'running' AND worker = ?", (worker_id,)
+        ).fetchall()
+    return [(row['job_id'], fail(row['job_id'], error_message)) for row in rows]
+
+
+def release_orphaned(live_workers, error_message, now=None):
+    """
+    Fail expired jobs held by workers that are no longer running.
+
+    Jobs of live workers are left alone; the supervisor terminates those
+    workers first and then releases their jobs with release_worker.
+
+    Args:
+        live_workers (iterable): IDs of the workers currently running.
+        error_message (str): Reason recorded on each released job.
+
+    Returns:
+        list: (job_id, retry) for every released job.
+    """
+    live_workers = set(live_workers)
+    return [(job_id, fail(job_id, error_message)) for job_id, worker in expired_leases(now)
+            if worker not in live_workers]
+
+
+def queue_stats():
+    """
+    Summarize the queue.
+
+    Returns:
+        dict: Count of jobs per state.
+    """
+    with _connect() as conn:
+        rows = conn.execute("SELECT state, COUNT(*) AS n FROM queue GROUP BY state").fetchall()
+    return {row['state']: row['n'] for row in rows}
+
+
+def estimate_wait(job_id, real_time_factor, workers, now=None):
+    """
+    Estimate when a queued job will start and finish.
+
+    Running jobs free their worker after their remaining expected time;
+    queued jobs are then handed, in claim order as it stands now, to
+    whichever worker frees up first. Each job is expected to take its audio
+    length times the measured real-time factor. Fair share is ignored, so
+    this is an estimate, not a promise.
+
+    Args:
+        job_id (str): Job to estimate.
+        real_time_factor (float): Processing seconds per second of audio.
+        workers (int): Number of worker processes.
+
+    Returns:
+        dict: start_seconds, eta_seconds (until it finishes) and position,
+        or None if the job is not queued or running.
+    """
+    now = now or time.time()
+    with _connect() as conn:
+        running = conn.execute(
+            "SELECT job_id, audio_seconds, started_at FROM queue WHERE state = 'running'"
+        ).fetchall()
+        queued = conn.execute(
+            "SELECT q.job_id, q.audio_seconds, q.available_at FROM queue q WHERE q.state = 'queued' "
+            f"ORDER BY {_order_by()}", _order_params(now)
+        ).fetchall()
+
+    def expected(row):
+        return (row['audio_seconds'] or QUEUE_UNKNOWN_AUDIO_SECONDS) * real_time_factor
+
+    free_at = []
+    for row in running:
+        remaining = max(0.0, expected(row) - (now - (row['started_at'] or now)))
+        if row['job_id'] == job_id:
+            return {'start_seconds': 0.0, 'eta_seconds': round(remaining, 1), 'position': 0}
+        free_at.append(remaining)
+    # One slot per worker; extra running jobs (e.g. a batch) finish with the earliest ones
+    free_at = sorted(free_at + [0.0] * max(0, workers - len(free_at)))[:max(1, workers)]
+
+    for position, row in enumerate(queued, start=1):
+        start = max(free_at[0], row['available_at'] - now)
+        finish = start + expected(row)
+        if row['job_id'] == job_id:
+            return {'start_seconds': round(start, 1), 'eta_seconds': round(finish, 1), 'position': position}
+        heapq.heapreplace(free_at, finish)
+    return None
+
@@ -0,0 +1,287 @@
+# app/log_store.py
+
+import os
+import re
+import queue
+import atexit
+import bisect
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+
+LOG_FOLDER = os.getenv("LOG_FOLDER", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 20 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+# Upper bound on how far back tail() reads looking for matching records
+LOG_TAIL_MAX_BYTES = int(os.getenv("LOG_TAIL_MAX_BYTES", 8 * 1024 * 1024))
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+READ_BLOCK_SIZE = 64 * 1024
+
+# A record starts with the asctime of LOG_FORMAT; other lines (tracebacks) continue it
+_RECORD_START = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} - [^\n]*? - ([A-Z]+) - ')
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener = None
+_configure_lock = threading.Lock()
+# path -> {'key': (inode, device), 'points': sorted [(offset, time)]}; see seek_time()
+_index = {}
+_index_lock = threading.Lock()
+
+
+def configure(component, level=LOG_LEVEL):
+    """
+    Route this process's logging through a queue to a size-rotated file.
+
+    Callers only enqueue the record; a background QueueListener does the
+    formatting and the disk write, so hot paths never wait on I/O. Each
+    process logs to its own file (logs/<component>.log) because
+    RotatingFileHandler cannot rotate one file safely from several processes.
+    Handlers installed earlier (e.g. by a module's logging.basicConfig) are
+    replaced.
+
+    Args:
+        component (str): Log file name, e.g. 'web', 'worker' or 'worker-0'.
+        level (str): Minimum level to record.
+
+    Returns:
+        str: Path of the log file.
+    """
+    global _listener
+    os.makedirs(LOG_FOLDER, exist_ok=True)
+    path = os.path.join(LOG_FOLDER, f"{component}.log")
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        records = queue.SimpleQueue()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+        _listener.start()
+    return path
+
+
+@atexit.register
+def _flush_on_exit():
+    if _listener is not None:
+        _listener.stop()
+
+
+def sources():
+    """Names of the current (unrotated) log files, e.g. ['web', 'worker-0']."""
+    if not os.path.isdir(LOG_FOLDER):
+        return []
+    return sorted(name[:-len('.log')] for name in os.listdir(LOG_FOLDER) if name.endswith('.log'))
+
+
+def source_path(source):
+    """Map a source name to its file, refusing anything outside LOG_FOLDER."""
+    if source not in sources():
+        raise FileNotFoundError(source)
+    return os.path.join(LOG_FOLDER, f"{source}.log")
+
+
+def _parse(record_bytes):
+    """Turn the raw bytes of one record into a dict."""
+    match = _RECORD_START.match(record_bytes)
+    text = record_bytes.decode('utf-8', errors='replace').rstrip('\n')
+    if not match:
+        return {'time': None, 'level': None, 'text': text}
+    return {'time': match.group(1).decode(), 'level': match.group(2).decode(), 'text': text}
+
+
+def _matches(record, job_id=None, min_level=None):
+    if job_id and job_id not in record['text']:
+        return False
+    if min_level:
+        level = logging.getLevelName(record['level'] or '')
+        if not isinstance(level, int) or level < min_level:
+            return False
+    return True
+
+
+def _split_records(data):
+    """Split complete lines into records, each starting at a timestamped line."""
+    records, current, position, start = [], [], 0, 0
+    for line in data.splitlines(keepends=True):
+        if _RECORD_START.match(line) and current:
+            records.append((start, b''.join(current)))
+            current, start = [], position
+        current.append(line)
+        position += len(line)
+    if current:
+        records.append((start, b''.join(current)))
+    return records
+
+
+def read_from(path, offset, job_id=None, level=None, limit=500):
+    """
+    Read records forward from a byte offset.
+
+    Args:
+        path (str): Log file.
+        offset (int): Byte offset of a record start (from seek_time(), tail() or a previous call).
+        job_id (str, optional): Only records mentioning this job.
+        level (str, optional): Minimum level name, e.g. 'WARNING'.
+        limit (int): Maximum records to return.
+
+    Returns:
+        tuple: (records, next_offset) where each record carries its 'offset'.
+    """
+    min_level = logging.getLevelName(level.upper()) if level else None
+    found = []
+    buffer, base = b'', offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while len(found) < limit:
+            chunk = f.read(READ_BLOCK_SIZE)
+            buffer += chunk
+            # Only whole lines; a line still being written is picked up next time
+            records = _split_records(buffer[:buffer.rfind(b'\n') + 1])
+            if chunk and records:
+                # The last record may continue in the next block
+                records = records[:-1]
+            consumed = 0
+            for start, raw in records:
+                consumed = start + len(raw)
+                record = _parse(raw)
+                if _matches(record, job_id, min_level):
+                    record['offset'] = base + start
+                    found.append(record)
+                    if len(found) >= limit:
+                        break
+            buffer, base = buffer[consumed:], base + consumed
+            if not chunk:
+                break
+    return found, base
+
+
+def tail(path, lines=100, job_id=None, level=None):
+    """
+    Return the last matching records of a log, reading backwards from the end.
+
+    At most LOG_TAIL_MAX_BYTES are read, so a rare job_id in a huge file
+    doesn't turn into a full scan.
+
+    Returns:
+        tuple: (records oldest first, offset to follow the file from)
+    """
+    min_level = logging.getLevelName(level.upper()) if level else None
+    found = []
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        # Follow from the end of the last complete line
+        f.seek(max(0, size - READ_BLOCK_SIZE))
+        last_block = f.read()
+        end = size - len(last_block) + last_block.rfind(b'\n') + 1 if b'\n' in last_block else size - len(last_block)
+
+        buffer, buffer_start = b'', end
+        while buffer_start > 0 and len(found) < lines and end - buffer_start < LOG_TAIL_MAX_BYTES:
+            start = max(0, buffer_start - READ_BLOCK_SIZE)
+            f.seek(start)
+            data = f.read(buffer_start - start)
+            buffer, buffer_start = data + buffer, start
+            records = _split_records(buffer)
+            if buffer_start > 0:
+                # The first record may have begun in an earlier block; finish it next round
+                buffer = records[0][1]
+                records = records[1:]
+            for record_start, raw in reversed(records):
+                record = _parse(raw)
+                if _matches(record, job_id, min_level):
+                    record['offset'] = buffer_start + record_start
+                    found.append(record)
+                    if len(found) >= lines:
+                        break
+    found.reverse()
+    return found, end
+
+
+def _record_at(f, offset):
+    """Find the first record starting at or after offset: (record offset, time) or None."""
+    f.seek(offset)
+    if offset:
+        f.readline()  # Skip the partial line we landed in
+    position = f.tell()
+    for line in iter(f.readline, b''):
+        match = _RECORD_START.match(line)
+        if match:
+            return position, datetime.strptime(match.group(1).decode(), _TIME_FORMAT)
+        position += len(line)
+    return None
+
+
+def seek_time(path, when):
+    """
+    Byte offset of the first record at or after a time, found by binary search.
+
+    Each probe reads one line, so a seek costs O(log file size) small reads.
+    Probes are kept in a sparse per-file index that later seeks narrow their
+    search with; the index is dropped when the file is rotated.
+
+    Args:
+        path (str): Log file.
+        when (datetime): Time to seek to.
+
+    Returns:
+        int: Offset to pass to read_from().
+    """
+    st = os.stat(path)
+    key = (st.st_ino, st.st_dev)
+    with _index_lock:
+        entry = _index.get(path)
+        if entry is None or entry['key'] != key:
+            entry = _index[path] = {'key': key, 'points': []}
+        points = list(entry['points'])
+
+    # Narrow the range with what earlier seeks learned
+    offsets = [offset for offset, _ in points]
+    times = [t for _, t in points]
+    i = bisect.bisect_left(times, when)
+    low = offsets[i - 1] if i > 0 else 0
+    high = offsets[i] if i < len(points) else st.st_size
+
+    learned = []
+    with open(path, 'rb') as f:
+        while high - low > READ_BLOCK_SIZE:
+            middle = (low + high) // 2
+            probe = _record_at(f, middle)
+            if probe is None or probe[0] >= high:
+                high = middle
+                continue
+            learned.append(probe)
+            if probe[1] < when:
+                low = probe[0] + 1
+            else:
+                high = probe[0]
+        # Finish with a short linear scan
+        f.seek(low)
+        if low:
+            f.readline()
+        position = f.tell()
+        result = st.st_size
+        for line in iter(f.readline, b''):
+            match = _RECORD_START.match(line)
+            if match and datetime.strptime(match.group(1).decode(), _TIME_FORMAT) >= when:
+                result = position
+                break
+            position += len(line)
+
+    if learned:
+        with _index_lock:
+            if _index.get(path, {}).get('key') == key:
+                merged = dict(_index[path]['points'])
+                merged.update(learned)
+                _index[path]['points'] = sorted(merged.items())
+    return result
@@ -0,0 +1,162 @@
+# app/long_audio.py
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+import audio
+import models
+
+# Files longer than this are split on voice activity and transcribed in parallel
+LONG_FILE_SECONDS = float(os.getenv("LONG_FILE_SECONDS", 20 * 60))
+# Target length of each chunk; chunks are only ever cut inside silence
+CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", 5 * 60))
+CHUNK_MIN_SILENCE_MS = int(os.getenv("CHUNK_MIN_SILENCE_MS", 500))
+LONG_FILE_WORKERS = int(os.getenv("LONG_FILE_WORKERS", 0))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/transcribe.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('long_audio')
+
+# Model loaded once in each pool process by _init_pool_process
+_pool_model = None
+_pools = {}
+
+
+def is_long(waveform):
+    """Whether a decoded waveform should go through the chunked path."""
+    return audio.duration_seconds(waveform) > LONG_FILE_SECONDS
+
+
+def plan_chunks(waveform, chunk_seconds=CHUNK_SECONDS):
+    """
+    Split a waveform into chunks of roughly chunk_seconds, cutting only in silence.
+
+    Voice activity is detected with the Silero VAD that ships with
+    faster-whisper. Consecutive speech regions are merged until adding the
+    next one would exceed chunk_seconds; a single speech region longer than
+    that becomes its own chunk.
+
+    Args:
+        waveform: 16 kHz mono float32 samples.
+        chunk_seconds: Target chunk length in seconds.
+
+    Returns:
+        list: (start_sample, end_sample) tuples covering all detected speech.
+    """
+    # Imported here so modules that only use the short-file path load without faster-whisper
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(
+        np.asarray(waveform), VadOptions(min_silence_duration_ms=CHUNK_MIN_SILENCE_MS)
+    )
+    max_samples = int(chunk_seconds * audio.SAMPLE_RATE)
+    chunks = []
+    for region in speech:
+        if chunks and region['end'] - chunks[-1][0] <= max_samples:
+            chunks[-1] = (chunks[-1][0], region['end'])
+        else:
+            chunks.append((region['start'], region['end']))
+    return chunks
+
+
+def _init_pool_process(model_size, device, compute_type, cpu_threads):
+    global _pool_model
+    os.environ["WHISPER_CPU_THREADS"] = str(cpu_threads)
+    _pool_model = models.get_whisper_model(model_size, compute_type, device)
+
+
+def _transcribe_chunk(buffer_path, num_samples, start, end, language, beam_size):
+    """
+    Transcribe one chunk in a pool process; timestamps are returned in file time.
+
+    Returns:
+        tuple: (segment dicts, language the chunk was transcribed in)
+    """
+    waveform = np.memmap(buffer_path, dtype=np.float32, mode="r", shape=(num_samples,))
+    chunk = np.array(waveform[start:end])
+    offset = start / audio.SAMPLE_RATE
+    segments, info = _pool_model.transcribe(chunk, language=language, beam_size=beam_size)
+    return [
+        {"start": segment.start + offset, "end": segment.end + offset, "text": segment.text.strip()}
+        for segment in segments
+    ], info.language
+
+
+def get_pool(model_size, device, compute_type, workers=None):
+    """
+    Return a process pool whose processes each hold a loaded Whisper model.
+
+    Pools are kept per model configuration for the life of the calling
+    process so models are not reloaded for every long file.
+    """
+    workers = workers or LONG_FILE_WORKERS or max(1, (os.cpu_count() or 1) // 4)
+    key = (model_size, device, compute_type, workers)
+    if key not in _pools:
+        cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+        _pools[key] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_pool_process,
+            initargs=(model_size, device, compute_type, cpu_threads)
+        )
+        logger.info(f"Started long-file pool: {workers} processes x {cpu_threads} threads ({model_size}, {compute_type})")
+    return _pools[key]
+
+
+def transcribe_chunked(filepath, waveform, language, model_size="large-v2", device="auto",
+                       compute_type="int8", beam_size=5, workers=None, on_progress=None):
+    """
+    Transcribe a long recording in parallel, chunked on voice-activity boundaries.
+
+    Args:
+        filepath: Path of the upload; its cached decoded buffer is shared with the pool by path.
+        waveform: The decoded waveform from audio.load_audio(filepath).
+        language: Language code for transcription, or None to detect it. It is
+            then detected once, on the first chunk, and used for every other chunk.
+        model_size, device, compute_type: Whisper model configuration for the pool.
+        beam_size: Beam size passed to Whisper.
+        workers: Number of pool processes (defaults to LONG_FILE_WORKERS or cores / 4).
+        on_progress: Optional callable receiving, after each chunk, how far through the
+            recording the job is, in seconds of the full duration.
+
+    Returns:
+        tuple: (segment dicts with 'start', 'end' and 'text' ordered by start time,
+        language the recording was transcribed in)
+    """
+    chunks = plan_chunks(waveform)
+    logger.info(f"Transcribing {filepath} in {len(chunks)} chunks")
+    pool = get_pool(model_size, device, compute_type, workers)
+    buffer_path = audio.cache_path(filepath)
+    segments = []
+    done_samples = 0
+    # Chunks only cover speech; scale to the full duration the progress is measured against
+    speech_samples = sum(end - start for start, end in chunks) or 1
+    duration = audio.duration_seconds(waveform)
+    if language is None and chunks:
+        # Chunks detecting their own language could come back in different ones
+        start, end = chunks.pop(0)
+        first, language = pool.submit(_transcribe_chunk, buffer_path, waveform.shape[0], start, end,
+                                      None, beam_size).result()
+        logger.info(f"Detected language '{language}' on the first chunk of {filepath}")
+        segments.extend(first)
+        done_samples += end - start
+        if on_progress:
+            on_progress(duration * done_samples / speech_samples)
+    futures = {
+        pool.submit(_transcribe_chunk, buffer_path, waveform.shape[0], start, end, language, beam_size): end - start
+        for start, end in chunks
+    }
+    for future in as_completed(futures):
+        segments.extend(future.result()[0])
+        done_samples += futures[future]
+        if on_progress:
+            on_progress(duration * done_samples / speech_samples)
+    segments.sort(key=lambda segment: segment['start'])
+    return segments, language
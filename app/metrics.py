@@ -0,0 +1,168 @@
+# app/metrics.py
+
+import time
+import logging
+from contextlib import contextmanager
+
+import history_store
+
+# Histogram bucket upper bounds in seconds (a +Inf bucket is implied)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('metrics')
+
+# Workers and the web server are separate processes, so observations live in
+# history.db and every process's /metrics sees the same totals.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_histograms (
+    name   TEXT NOT NULL,
+    stage  TEXT NOT NULL,
+    le     REAL NOT NULL,
+    count  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, stage, le)
+);
+CREATE TABLE IF NOT EXISTS metric_sums (
+    name   TEXT NOT NULL,
+    stage  TEXT NOT NULL,
+    count  INTEGER NOT NULL DEFAULT 0,
+    sum    REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, stage)
+);
+CREATE TABLE IF NOT EXISTS metric_counters (
+    name   TEXT NOT NULL,
+    label  TEXT NOT NULL,
+    value  REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, label)
+);
+"""
+
+_schema_ready = False
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Add the wall-clock time of the enclosed block to timings[stage].
+
+    Args:
+        timings (dict): Per-job stage timings being collected.
+        stage (str): Stage name, e.g. 'decode' or 'diarization'.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def record_job(timings, outcome, audio_seconds=None):
+    """
+    Fold one job's stage timings into the shared histograms and counters.
+
+    Args:
+        timings (dict): Stage name -> seconds.
+        outcome (str): 'Complete' or 'Failed'.
+        audio_seconds (float, optional): Length of the processed audio.
+    """
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for stage, seconds in timings.items():
+            _observe(conn, 'stage_seconds', stage, seconds)
+        _increment(conn, 'jobs_total', outcome)
+        if audio_seconds:
+            _increment(conn, 'audio_seconds_total', outcome, audio_seconds)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def increment(name, label='', amount=1):
+    """Add to a counter, e.g. increment('dedup_hits_total')."""
+    _increment(_connection(), name, label, amount)
+
+
+def _observe(conn, name, stage, seconds):
+    # Buckets are stored non-cumulatively; render() accumulates them
+    le = next((bound for bound in STAGE_BUCKETS if seconds <= bound), float('inf'))
+    conn.execute(
+        "INSERT INTO metric_histograms (name, stage, le, count) VALUES (?, ?, ?, 1) "
+        "ON CONFLICT(name, stage, le) DO UPDATE SET count = count + 1", (name, stage, le)
+    )
+    conn.execute(
+        "INSERT INTO metric_sums (name, stage, count, sum) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT(name, stage) DO UPDATE SET count = count + 1, sum = sum + excluded.sum",
+        (name, stage, seconds)
+    )
+
+
+def _increment(conn, name, label, amount=1):
+    conn.execute(
+        "INSERT INTO metric_counters (name, label, value) VALUES (?, ?, ?) "
+        "ON CONFLICT(name, label) DO UPDATE SET value = value + excluded.value", (name, label, amount)
+    )
+
+
+def _format_le(bound):
+    return '+Inf' if bound == float('inf') else f"{bound:g}"
+
+
+def render(gauges=None):
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Args:
+        gauges (dict, optional): Extra point-in-time values, name -> {label: value}.
+
+    Returns:
+        str: The /metrics response body.
+    """
+    conn = _connection()
+    lines = [
+        "# HELP audium_stage_seconds Time spent in each pipeline stage per job.",
+        "# TYPE audium_stage_seconds histogram"
+    ]
+    buckets = {}
+    for row in conn.execute("SELECT stage, le, count FROM metric_histograms WHERE name = 'stage_seconds'"):
+        buckets.setdefault(row['stage'], {})[row['le']] = row['count']
+    sums = {row['stage']: row for row in conn.execute(
+        "SELECT stage, count, sum FROM metric_sums WHERE name = 'stage_seconds'")}
+    for stage in sorted(buckets):
+        cumulative = 0
+        for bound in STAGE_BUCKETS + (float('inf'),):
+            cumulative += buckets[stage].get(bound, 0)
+            lines.append(f'audium_stage_seconds_bucket{{stage="{stage}",le="{_format_le(bound)}"}} {cumulative}')
+        lines.append(f'audium_stage_seconds_sum{{stage="{stage}"}} {sums[stage]["sum"]:.6f}')
+        lines.append(f'audium_stage_seconds_count{{stage="{stage}"}} {sums[stage]["count"]}')
+
+    counters = {}
+    for row in conn.execute("SELECT name, label, value FROM metric_counters ORDER BY name, label"):
+        counters.setdefault(row['name'], []).append((row['label'], row['value']))
+    for name, values in counters.items():
+        lines.append(f"# TYPE audium_{name} counter")
+        for label, value in values:
+            selector = f'{{outcome="{label}"}}' if label else ''
+            lines.append(f"audium_{name}{selector} {value:g}")
+
+    for name, values in (gauges or {}).items():
+        lines.append(f"# TYPE audium_{name} gauge")
+        for label, value in values.items():
+            selector = f'{{state="{label}"}}' if label else ''
+            lines.append(f"audium_{name}{selector} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,221 @@
+# app/models.py
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+import psutil
+
+import metrics
+
+DEFAULT_WHISPER_MODEL = os.getenv("WHISPER_MODEL", "large-v2")
+DEFAULT_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "auto")
+COMPUTE_TYPES = ("auto", "int8", "int8_float16", "float16", "float32")
+# Loaded models are evicted least-recently-used first once their combined
+# resident size goes over this cap
+MODEL_MEMORY_CAP_MB = float(os.getenv("MODEL_MEMORY_CAP_MB", 12000))
+# Most wav2vec2 alignment models (one per language) kept loaded at once
+ALIGN_MODEL_CACHE_SIZE = int(os.getenv("ALIGN_MODEL_CACHE_SIZE", 3))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/transcribe.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('models')
+
+_models = OrderedDict()
+_lock = threading.RLock()
+# Registry activity in this process since it started
+_totals = {'hits': 0, 'loads': 0, 'load_seconds': 0.0, 'evictions': 0}
+
+
+def cuda_available():
+    """Whether a CUDA device is usable, without importing torch at module load."""
+    import torch
+    return torch.cuda.is_available()
+
+
+def resolve_compute_type(compute_type=None):
+    """Map 'auto' (or None) to float16 on GPU and int8 on CPU."""
+    compute_type = compute_type or DEFAULT_COMPUTE_TYPE
+    if compute_type not in COMPUTE_TYPES:
+        raise ValueError(f"Unsupported compute type: {compute_type}")
+    if compute_type == "auto":
+        return "float16" if cuda_available() else "int8"
+    return compute_type
+
+
+def _resident_mb():
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _count(name, amount=1):
+    """Add to this process's registry totals and to the shared /metrics counter."""
+    _totals[name] += amount
+    try:
+        metrics.increment(f"model_{name}_total", amount=amount)
+    except Exception as e:
+        logger.warning(f"Could not record model {name}: {str(e)}")
+
+
+def _load(key, loader):
+    """Load a model through the registry, recording load time and resident memory."""
+    with _lock:
+        if key in _models:
+            _models.move_to_end(key)
+            entry = _models[key]
+            entry['hits'] += 1
+            entry['last_used'] = time.time()
+            _count('hits')
+            return entry['model']
+
+        rss_before = _resident_mb()
+        started = time.time()
+        model = loader()
+        load_seconds = time.time() - started
+        resident_mb = max(0.0, _resident_mb() - rss_before)
+
+        _models[key] = {
+            'model': model,
+            'load_seconds': load_seconds,
+            'resident_mb': resident_mb,
+            'hits': 0,
+            'last_used': time.time()
+        }
+        logger.info(f"Loaded {key} in {load_seconds:.1f}s (+{resident_mb:.0f} MB resident)")
+        _count('loads')
+        _count('load_seconds', load_seconds)
+        _enforce_cap(keep=key)
+        return model
+
+
+def _enforce_cap(keep):
+    while len(_models) > 1 and sum(e['resident_mb'] for e in _models.values()) > MODEL_MEMORY_CAP_MB:
+        oldest = next(iter(_models))
+        if oldest == keep:
+            break
+        evict(oldest)
+
+
+def evict(key):
+    """Drop a loaded model from the registry so its memory can be reclaimed."""
+    with _lock:
+        entry = _models.pop(key, None)
+    if entry is None:
+        return False
+    logger.info(f"Evicted {key} ({entry['resident_mb']:.0f} MB)")
+    _count('evictions')
+    del entry
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return True
+
+
+def get_whisper_model(model_size=None, compute_type=None, device="auto"):
+    """
+    Return a faster-whisper model, loading it on first use.
+
+    Args:
+        model_size (str): Whisper model size, e.g. 'large-v2', 'medium', 'small'.
+        compute_type (str): One of COMPUTE_TYPES.
+        device (str): 'auto', 'cpu' or 'cuda'.
+
+    Returns:
+        faster_whisper.WhisperModel
+    """
+    model_size = model_size or DEFAULT_WHISPER_MODEL
+    compute_type = resolve_compute_type(compute_type)
+    cpu_threads = int(os.getenv("WHISPER_CPU_THREADS", 0))
+
+    def loader():
+        from faster_whisper import WhisperModel
+        return WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+    return _load(('whisper', model_size, device, compute_type), loader)
+
+
+def get_diarization_pipeline():
+    """
+    Return the pyannote speaker-diarization pipeline, loading it on first use.
+
+    Returns:
+        pyannote.audio.Pipeline, or None if HF_TOKEN is not set.
+    """
+    hf_token = os.getenv("HF_TOKEN")
+    if not hf_token:
+        return None
+
+    def loader():
+        from pyannote.audio import Pipeline
+        pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=hf_token)
+        if cuda_available():
+            import torch
+            pipeline.to(torch.device("cuda"))
+        return pipeline
+
+    return _load(('diarization', 'pyannote/speaker-diarization'), loader)
+
+
+def get_alignment_model(language, device="auto"):
+    """
+    Return the whisperx (wav2vec2) alignment model for a language, loading it on first use.
+
+    Alignment models are cached per language; once more than
+    ALIGN_MODEL_CACHE_SIZE are loaded, the least recently used one is
+    evicted, on top of the shared memory cap.
+
+    Args:
+        language (str): Language code, e.g. 'en'.
+        device (str): 'auto', 'cpu' or 'cuda'.
+
+    Returns:
+        tuple: (model, metadata) as returned by whisperx.load_align_model.
+
+    Raises:
+        ValueError: If whisperx has no default alignment model for the language.
+    """
+    if device == "auto":
+        device = "cuda" if cuda_available() else "cpu"
+
+    def loader():
+        import whisperx
+        return whisperx.load_align_model(language_code=language, device=device)
+
+    key = ('alignment', language, device)
+    model = _load(key, loader)
+    with _lock:
+        loaded = [k for k in _models if k[0] == 'alignment' and k != key]
+        for old_key in loaded[:max(0, len(loaded) + 1 - ALIGN_MODEL_CACHE_SIZE)]:
+            evict(old_key)
+    return model
+
+
+def stats():
+    """
+    Describe the models currently loaded in this process.
+
+    Returns:
+        dict: Process RSS, the registry's hit/load/eviction totals, and load
+        time, estimated resident memory and hit count for each loaded model,
+        most recently used last.
+    """
+    with _lock:
+        loaded = [
+            {
+                'model': '/'.join(str(part) for part in key),
+                'load_seconds': round(entry['load_seconds'], 2),
+                'resident_mb': round(entry['resident_mb'], 1),
+                'hits': entry['hits'],
+                'last_used': entry['last_used']
+            }
+            for key, entry in _models.items()
+        ]
+        totals = dict(_totals, load_seconds=round(_totals['load_seconds'], 2))
+    return {'process_rss_mb': round(_resident_mb(), 1), 'memory_cap_mb': MODEL_MEMORY_CAP_MB,
+            'resident_mb': round(sum(model['resident_mb'] for model in loaded), 1), 'totals': totals,
+            'models': loaded}
@@ -3,29 +3,78 @@ import os
 import json
 import hashlib
 import secrets
+import threading
 import filelock
 from datetime import datetime
 
 USERS_FILE = 'users.json'
 
+# scrypt cost parameters; raising them makes existing hashes get upgraded on next login
+SCRYPT_N = int(os.getenv('SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('SCRYPT_P', 1))
+SCRYPT_DKLEN = 32
+
+# In-memory index of users.json, reloaded whenever the file changes on disk
+_user_index = {'key': None, 'users': [], 'by_username': {}, 'by_email': {}}
+_user_index_lock = threading.Lock()
+
 def generate_salt():
     """Generate a random salt for password hashing"""
     return secrets.token_hex(16)
 
-def hash_password(password, salt=None):
-    """Hash a password with a salt using SHA-256"""
+def hash_password(password, salt=None, n=None, r=None, p=None):
+    """Hash a password with a salt using scrypt; the cost parameters are stored in the hash"""
     if salt is None:
         salt = generate_salt()
+    n, r, p = n or SCRYPT_N, r or SCRYPT_R, p or SCRYPT_P
     
-    # Combine password and salt, then hash
-    password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-    return password_hash, salt
+    derived = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                             maxmem=256 * n * r * p, dklen=SCRYPT_DKLEN)
+    return f"scrypt${n}${r}${p}${derived.hex()}", salt
+
+def _legacy_hash(password, salt):
+    """Single-round SHA-256 hash used before scrypt"""
+    return hashlib.sha256((password + salt).encode()).hexdigest()
 
 def verify_password(stored_hash, stored_salt, provided_password):
-    """Verify a password against a stored hash and salt"""
-    calculated_hash, _ = hash_password(provided_password, stored_salt)
+    """Verify a password against a stored hash and salt (scrypt or legacy SHA-256)"""
+    if stored_hash.startswith('scrypt$'):
+        _, n, r, p, _ = stored_hash.split('$')
+        calculated_hash, _ = hash_password(provided_password, stored_salt, int(n), int(r), int(p))
+    else:
+        calculated_hash = _legacy_hash(provided_password, stored_salt)
     return secrets.compare_digest(calculated_hash, stored_hash)
 
+def needs_rehash(stored_hash):
+    """Whether a stored hash is legacy SHA-256 or uses weaker scrypt parameters than configured"""
+    if not stored_hash.startswith('scrypt$'):
+        return True
+    _, n, r, p, _ = stored_hash.split('$')
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+def _save_users(users):
+    """Atomically replace the users file; caller holds the users lock"""
+    temp_file = f"{USERS_FILE}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(users, f, indent=2)
+    os.replace(temp_file, USERS_FILE)
+
+def _rehash_password(username, password):
+    """Upgrade a user's stored hash to the current scheme after a successful login"""
+    lock = filelock.FileLock(f"{USERS_FILE}.lock")
+    with lock:
+        with open(USERS_FILE, 'r') as f:
+            users = json.load(f)
+        for user in users:
+            if user.get('username') == username:
+                user['password_hash'], user['salt'] = hash_password(password)
+                user.pop('password', None)
+                break
+        else:
+            return
+        _save_users(users)
+
 def migrate_users_to_hashed_passwords():
     """Migrate existing plaintext passwords to hashed passwords"""
     if not os.path.exists(USERS_FILE):
@@ -50,6 +99,7 @@ def migrate_users_to_hashed_passwords():
                 if password:
                     password_hash, salt = hash_password(password)
                     user['password_hash'] = password_hash
+                    user['salt'] = salt
             temp_file = f"{USERS_FILE}.tmp"
             with open(temp_file, 'w') as f:
                 json.dump(users, f, indent=2)
@@ -101,40 +151,61 @@ def create_user(username, email, password, role='user'):
             return False, f"Error creating user: {e}"
 
 def validate_user(username, password):
-    """Validate user credentials using secure password verification"""
-    users = get_users()
-    for user in users:
-        if user.get('username') == username:
-            # Check if we're using the new hash system
-            if 'password_hash' in user and 'salt' in user:
-                # Verify using the hash system
-                if verify_password(user['password_hash'], user['salt'], password):
-                    return user.get('active', True)
-            # Legacy plain text password (fallback during migration)
-            elif 'password' in user and user.get('password') == password:
-                return user.get('active', True)
+    """Validate user credentials, upgrading legacy or outdated hashes on success"""
+    user = get_user_by_username(username)
+    if user is None:
+        return False
+    # Check if we're using the new hash system
+    if 'password_hash' in user and 'salt' in user:
+        # Verify using the hash system
+        if not verify_password(user['password_hash'], user['salt'], password):
+            return False
+        if needs_rehash(user['password_hash']):
+            _rehash_password(username, password)
+        return user.get('active', True)
+    # Legacy plain text password (fallback during migration); compare bytes,
+    # compare_digest rejects str with non-ASCII characters
+    elif 'password' in user and secrets.compare_digest(str(user.get('password')).encode('utf-8'),
+                                                       password.encode('utf-8')):
+        _rehash_password(username, password)
+        return user.get('active', True)
     return False
 
-def get_users():
-    """Load users from JSON file"""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error reading {USERS_FILE}: {e}")
-            return []
-    else:
+def _load_user_index():
+    """Return the user index, re-reading users.json only if it changed since the last load"""
+    try:
+        st = os.stat(USERS_FILE)
+    except FileNotFoundError:
         with open(USERS_FILE, 'w') as f:
             json.dump([], f)
-    return []
+        st = os.stat(USERS_FILE)
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _user_index_lock:
+        if _user_index['key'] != key:
+            try:
+                with open(USERS_FILE, 'r') as f:
+                    users = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Error reading {USERS_FILE}: {e}")
+                users = []
+            _user_index['users'] = users
+            _user_index['by_username'] = {u.get('username'): u for u in users}
+            _user_index['by_email'] = {u.get('email'): u for u in users if u.get('email')}
+            _user_index['key'] = key
+        return _user_index
+
+def get_users():
+    """Load users from JSON file (served from the in-memory index while the file is unchanged)"""
+    return [dict(user) for user in _load_user_index()['users']]
 def get_user_by_username(username):
     """Get a user record by username"""
-    users = get_users()
-    for user in users:
-        if user.get('username') == username:
-            return user
-    return None
+    user = _load_user_index()['by_username'].get(username)
+    return dict(user) if user is not None else None
+
+def get_user_by_email(email):
+    """Get a user record by email"""
+    user = _load_user_index()['by_email'].get(email)
+    return dict(user) if user is not None else None
 
 def is_admin(username):
     """Check if a user has admin privileges"""
@@ -0,0 +1,125 @@
+# app/preflight.py
+
+import os
+import logging
+
+import av
+import numpy as np
+
+import audio
+import ingest
+import models
+import history_store
+
+# Whisper model used only to detect the language of uploads marked "auto"
+LANGUAGE_PROBE_MODEL = os.getenv("LANGUAGE_PROBE_MODEL", "tiny")
+# Seconds of audio the language is detected on (Whisper looks at one 30 s window)
+LANGUAGE_PROBE_SECONDS = float(os.getenv("LANGUAGE_PROBE_SECONDS", 30))
+# Skip this much from the start; recordings often open with silence or music
+LANGUAGE_PROBE_OFFSET_SECONDS = float(os.getenv("LANGUAGE_PROBE_OFFSET_SECONDS", 0))
+AUTO_LANGUAGE = "auto"
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('preflight')
+
+
+def read_window(filepath, start=0.0, seconds=LANGUAGE_PROBE_SECONDS):
+    """
+    Decode just one window of a file to 16 kHz mono float32.
+
+    Decoding stops as soon as the window is filled, so the cost doesn't
+    depend on the length of the recording.
+    """
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=audio.SAMPLE_RATE)
+    skip = int(start * audio.SAMPLE_RATE)
+    wanted = int(seconds * audio.SAMPLE_RATE)
+    chunks, collected = [], 0
+    with av.open(filepath, metadata_errors="ignore") as container:
+        for frame in container.decode(audio=0):
+            frame.pts = None
+            frames = resampler.resample(frame)
+            for resampled in frames if isinstance(frames, list) else [frames]:
+                chunk = resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0
+                if skip:
+                    dropped = min(skip, chunk.shape[0])
+                    chunk, skip = chunk[dropped:], skip - dropped
+                chunks.append(chunk)
+                collected += chunk.shape[0]
+            if collected >= wanted:
+                break
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks)[:wanted]
+
+
+def detect_language(filepath):
+    """
+    Detect the spoken language from one window of audio.
+
+    Returns:
+        tuple: (language code, probability)
+    """
+    window = read_window(filepath, LANGUAGE_PROBE_OFFSET_SECONDS)
+    if window.shape[0] < audio.SAMPLE_RATE and LANGUAGE_PROBE_OFFSET_SECONDS:
+        # Shorter than the offset; use the start instead
+        window = read_window(filepath)
+    model = models.get_whisper_model(LANGUAGE_PROBE_MODEL)
+    # Segments are generated lazily; asking for them only runs language detection
+    _, info = model.transcribe(window, language=None, beam_size=1)
+    return info.language, info.language_probability
+
+
+def probe_upload(filepath):
+    """
+    Read what scheduling needs to know about an upload before it is queued.
+
+    The duration comes from container metadata, so this doesn't decode the
+    file and is cheap enough for the upload request. Language detection for
+    "auto" uploads is left to the worker (see resolve_language). Failures are
+    logged and leave the duration unset.
+
+    Args:
+        filepath (str): Stored upload.
+
+    Returns:
+        dict: audio_duration (seconds or None).
+    """
+    result = {'audio_duration': None}
+    try:
+        info = ingest.probe(filepath)
+        if info['duration'] is not None:
+            result['audio_duration'] = round(info['duration'], 2)
+    except Exception as e:
+        logger.warning(f"Could not read the duration of {filepath}: {str(e)}")
+    return result
+
+
+def resolve_language(job_id, filepath, language):
+    """
+    Detect the language of an "auto" job in the worker and record it on the job.
+
+    Args:
+        job_id (str): Job being transcribed.
+        filepath (str): Stored upload.
+        language (str): Language the job was queued with.
+
+    Returns:
+        str: The detected language, or language unchanged if it wasn't "auto"
+        or detection failed (Whisper then detects it during transcription).
+    """
+    if language != AUTO_LANGUAGE:
+        return language
+    try:
+        detected, probability = detect_language(filepath)
+    except Exception as e:
+        logger.warning(f"Language detection failed for job {job_id}, leaving it to Whisper: {str(e)}")
+        return language
+    history_store.update_job(job_id, {'language': detected, 'detected_language': detected,
+                                      'language_probability': round(probability, 3)})
+    logger.info(f"Detected language '{detected}' (p={probability:.2f}) for job {job_id}")
+    return detected
@@ -0,0 +1,230 @@
+# app/resumable.py
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+import filelock
+
+import history_store
+import utils
+
+# Uploads that see no data for this long are abandoned and cleaned up
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 ** 3))
+# How often the worker supervisor looks for abandoned uploads
+UPLOAD_EXPIRY_INTERVAL = float(os.getenv("UPLOAD_EXPIRY_INTERVAL", 3600))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('resumable')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    upload_id         TEXT PRIMARY KEY,
+    user              TEXT NOT NULL,
+    original_filename TEXT NOT NULL,
+    filename          TEXT NOT NULL,
+    language          TEXT NOT NULL,
+    length            INTEGER NOT NULL,
+    offset            INTEGER NOT NULL DEFAULT 0,
+    job_id            TEXT,
+    created_at        REAL NOT NULL,
+    updated_at        REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions (updated_at);
+"""
+
+_schema_ready = False
+# upload_id -> (sha256 object, offset it has consumed); rebuilt from disk when missing
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, expected):
+        super().__init__(f"Upload-Offset must be {expected}")
+        self.expected = expected
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def _lock_for(upload_id):
+    return filelock.FileLock(os.path.join(utils.UPLOAD_FOLDER, f".{upload_id}.lock"))
+
+
+def create_upload(username, original_filename, length, language="en"):
+    """
+    Start a resumable upload.
+
+    The target file is created at its final location in UPLOAD_FOLDER and
+    filled in place by append_chunk(); nothing is spooled elsewhere.
+
+    Args:
+        username: User who is uploading.
+        original_filename: Name of the file on the client.
+        length: Total size in bytes the client will send.
+        language: Language code for transcription.
+
+    Returns:
+        str: upload_id to send chunks to.
+    """
+    if length < 0 or length > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Upload length must be between 0 and {MAX_UPLOAD_BYTES} bytes")
+    upload_id = uuid.uuid4().hex
+    filename = utils.make_secure_filename(original_filename)
+    open(os.path.join(utils.UPLOAD_FOLDER, filename), 'wb').close()
+    now = time.time()
+    _connection().execute(
+        "INSERT INTO upload_sessions (upload_id, user, original_filename, filename, language, length, "
+        "offset, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+        (upload_id, username, original_filename, filename, language, length, now, now)
+    )
+    logger.info(f"Started resumable upload {upload_id} ({original_filename}, {length} bytes) for {username}")
+    return upload_id
+
+
+def get_upload(upload_id):
+    """Return the session for an upload as a dict, or raise UploadNotFound."""
+    row = _connection().execute("SELECT * FROM upload_sessions WHERE upload_id = ?", (upload_id,)).fetchone()
+    if row is None:
+        raise UploadNotFound(upload_id)
+    return dict(row)
+
+
+def _hasher_at(upload_id, filepath, offset):
+    """Return a sha256 object that has consumed exactly the first offset bytes of the file."""
+    with _hashers_lock:
+        cached = _hashers.get(upload_id)
+    if cached and cached[1] == offset:
+        return cached[0]
+    # Resumed in another process or after a restart: rehash what is already on disk once
+    digest = hashlib.sha256()
+    remaining = offset
+    with open(filepath, 'rb') as f:
+        while remaining:
+            block = f.read(min(utils.COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def append_chunk(upload_id, offset, stream, username=None):
+    """
+    Write the next part of an upload straight into its final file.
+
+    Args:
+        upload_id: Upload to append to.
+        offset: Byte offset the client claims to resume from; must match the server's.
+        stream: Readable binary stream with the chunk body.
+        username: If given, the upload must belong to this user.
+
+    Returns:
+        dict: The updated session; 'job_id' is set once the upload is complete
+        and has been queued for transcription.
+
+    Raises:
+        UploadNotFound, OffsetMismatch
+    """
+    with _lock_for(upload_id):
+        session = get_upload(upload_id)
+        if username is not None and session['user'] != username:
+            raise UploadNotFound(upload_id)
+        if offset != session['offset'] or session['job_id']:
+            raise OffsetMismatch(session['offset'])
+
+        filepath = os.path.join(utils.UPLOAD_FOLDER, session['filename'])
+        digest = _hasher_at(upload_id, filepath, offset)
+        remaining = session['length'] - offset
+        written = 0
+        try:
+            with open(filepath, 'r+b') as out:
+                # Drop anything past the acknowledged offset left by an interrupted chunk
+                out.truncate(offset)
+                out.seek(offset)
+                while remaining > 0:
+                    block = stream.read(min(utils.COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    out.write(block)
+                    digest.update(block)
+                    written += len(block)
+                    remaining -= len(block)
+        finally:
+            # Record whatever made it to disk so a dropped connection can resume from there
+            new_offset = offset + written
+            with _hashers_lock:
+                _hashers[upload_id] = (digest, new_offset)
+            _connection().execute(
+                "UPDATE upload_sessions SET offset = ?, updated_at = ? WHERE upload_id = ?",
+                (new_offset, time.time(), upload_id)
+            )
+
+        session['offset'] = new_offset
+        if new_offset == session['length']:
+            session['job_id'] = utils.register_upload(
+                session['original_filename'], session['filename'], session['user'],
+                session['language'], new_offset, digest.hexdigest()
+            )
+            _connection().execute(
+                "UPDATE upload_sessions SET job_id = ? WHERE upload_id = ?", (session['job_id'], upload_id)
+            )
+            with _hashers_lock:
+                _hashers.pop(upload_id, None)
+            logger.info(f"Completed resumable upload {upload_id} as job {session['job_id']}")
+        return session
+
+
+def abort_upload(upload_id, username=None):
+    """Cancel an unfinished upload and delete its partial file."""
+    with _lock_for(upload_id):
+        session = get_upload(upload_id)
+        if username is not None and session['user'] != username:
+            raise UploadNotFound(upload_id)
+        if not session['job_id']:
+            filepath = os.path.join(utils.UPLOAD_FOLDER, session['filename'])
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        _connection().execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    lock_path = os.path.join(utils.UPLOAD_FOLDER, f".{upload_id}.lock")
+    if os.path.exists(lock_path):
+        os.remove(lock_path)
+
+
+def expire_stale_uploads(now=None):
+    """
+    Abort uploads that have not received data within UPLOAD_SESSION_TTL.
+
+    Returns:
+        int: Number of uploads removed.
+    """
+    cutoff = (now or time.time()) - UPLOAD_SESSION_TTL
+    rows = _connection().execute(
+        "SELECT upload_id FROM upload_sessions WHERE updated_at < ?", (cutoff,)
+    ).fetchall()
+    for row in rows:
+        abort_upload(row['upload_id'])
+    if rows:
+        logger.info(f"Expired {len(rows)} abandoned uploads")
+    return len(rows)
@@ -0,0 +1,250 @@
+# app/retention.py
+
+import os
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+
+import history_store
+import transcript_store
+import exporters
+import dedup_cache
+import analytics
+import speaker_index
+import job_queue
+import utils
+
+# Age limit in days; unset keeps jobs forever
+RETENTION_DAYS = os.getenv("RETENTION_DAYS")
+# Per-user limits applied to every user; RETENTION_USER_QUOTAS overrides them per user,
+# e.g. {"alice": {"max_jobs": 500, "max_bytes": 10737418240}}
+RETENTION_USER_MAX_JOBS = os.getenv("RETENTION_USER_MAX_JOBS")
+RETENTION_USER_MAX_BYTES = os.getenv("RETENTION_USER_MAX_BYTES")
+RETENTION_USER_QUOTAS = os.getenv("RETENTION_USER_QUOTAS", "{}")
+# Upper bound on the size of all uploads together
+RETENTION_MAX_TOTAL_BYTES = os.getenv("RETENTION_MAX_TOTAL_BYTES")
+# Jobs purged per batch; each batch is one short write transaction
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 200))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+
+# Jobs in these states are still in use and never purged
+ACTIVE_STATUSES = ('Pending', 'Processing')
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('retention')
+
+_FINISHED = f"status NOT IN ({', '.join('?' * len(ACTIVE_STATUSES))})"
+_SIZE = "COALESCE(CAST(json_extract(data, '$.file_size') AS INTEGER), 0)"
+
+
+def _optional(value, cast):
+    return None if value in (None, '') else cast(value)
+
+
+def default_policy():
+    """
+    Build the retention policy from the environment.
+
+    Returns:
+        dict: max_age_days, user_max_jobs, user_max_bytes, user_quotas and max_total_bytes.
+    """
+    try:
+        quotas = json.loads(RETENTION_USER_QUOTAS or "{}")
+    except ValueError:
+        logger.error("RETENTION_USER_QUOTAS is not valid JSON; ignoring it")
+        quotas = {}
+    return {
+        'max_age_days': _optional(RETENTION_DAYS, float),
+        'user_max_jobs': _optional(RETENTION_USER_MAX_JOBS, int),
+        'user_max_bytes': _optional(RETENTION_USER_MAX_BYTES, int),
+        'user_quotas': quotas,
+        'max_total_bytes': _optional(RETENTION_MAX_TOTAL_BYTES, int)
+    }
+
+
+def enabled(policy=None):
+    """Whether the policy sets any limit at all."""
+    policy = policy or default_policy()
+    return any(policy.get(key) is not None for key in ('max_age_days', 'user_max_jobs', 'user_max_bytes',
+                                                       'max_total_bytes')) or bool(policy.get('user_quotas'))
+
+
+def _rows(sql, params):
+    conn = history_store.get_connection()
+    return [json.loads(row['data']) for row in conn.execute(sql, params).fetchall()]
+
+
+def _expired_by_age(cutoff, limit):
+    # Walks idx_jobs_timestamp oldest first
+    return _rows(
+        f"SELECT data FROM jobs WHERE timestamp < ? AND {_FINISHED} ORDER BY timestamp ASC LIMIT ?",
+        (cutoff.strftime(history_store.TIMESTAMP_FORMAT),) + ACTIVE_STATUSES + (limit,)
+    )
+
+
+def _oldest_until(sql, params, excess_jobs, excess_bytes, limit):
+    """Take jobs oldest first until both excesses are covered, at most limit of them."""
+    picked = []
+    for job in _rows(sql + " ORDER BY seq ASC LIMIT ?", params + (limit,)):
+        if excess_jobs <= 0 and excess_bytes <= 0:
+            break
+        picked.append(job)
+        excess_jobs -= 1
+        excess_bytes -= int(job.get('file_size') or 0)
+    return picked
+
+
+def _over_user_quota(policy, limit):
+    conn = history_store.get_connection()
+    quotas = policy.get('user_quotas') or {}
+    usage = conn.execute(
+        f"SELECT user, COUNT(*) AS jobs, SUM({_SIZE}) AS bytes FROM jobs WHERE {_FINISHED} GROUP BY user",
+        ACTIVE_STATUSES
+    ).fetchall()
+    for row in usage:
+        quota = quotas.get(row['user'], {})
+        max_jobs = quota.get('max_jobs', policy.get('user_max_jobs'))
+        max_bytes = quota.get('max_bytes', policy.get('user_max_bytes'))
+        excess_jobs = row['jobs'] - max_jobs if max_jobs is not None else 0
+        excess_bytes = row['bytes'] - max_bytes if max_bytes is not None else 0
+        if excess_jobs > 0 or excess_bytes > 0:
+            # Walks idx_jobs_user for just this user
+            return _oldest_until(
+                f"SELECT data FROM jobs WHERE user = ? AND {_FINISHED}", (row['user'],) + ACTIVE_STATUSES,
+                excess_jobs, excess_bytes, limit
+            )
+    return []
+
+
+def _over_total_size(max_total_bytes, limit):
+    conn = history_store.get_connection()
+    total = conn.execute(f"SELECT COALESCE(SUM({_SIZE}), 0) FROM jobs").fetchone()[0]
+    if total <= max_total_bytes:
+        return []
+    return _oldest_until(f"SELECT data FROM jobs WHERE {_FINISHED}", ACTIVE_STATUSES,
+                         0, total - max_total_bytes, limit)
+
+
+def _remove(path):
+    """Delete a file if present and return the bytes it held."""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def purge_files(job):
+    """
+    Delete everything stored on disk for a job and drop its cache, speaker
+    index and queue entries.
+
+    Returns:
+        int: Bytes reclaimed.
+    """
+    job_id = job.get('job_id')
+    reclaimed = 0
+    filename = job.get('filename')
+    if filename:
+        reclaimed += _remove(os.path.join(utils.UPLOAD_FOLDER, filename))
+        reclaimed += _remove(os.path.join(utils.AUDIO_CACHE_FOLDER, f"{filename}.f32"))
+    if job.get('cold_storage_path'):
+        reclaimed += _remove(job['cold_storage_path'])
+    # Same folder the pipeline writes the plain-text transcript to
+    reclaimed += _remove(os.path.join(transcript_store.TRANSCRIPTS_FOLDER, f"{job_id}.txt"))
+    for path in (transcript_store.snapshot_path(job_id), transcript_store.log_path(job_id)):
+        if os.path.exists(path):
+            reclaimed += os.path.getsize(path)
+    transcript_store.delete_transcript(job_id)
+    export_dir = os.path.join(exporters.EXPORT_FOLDER, job_id)
+    if os.path.isdir(export_dir):
+        for name in os.listdir(export_dir):
+            reclaimed += _remove(os.path.join(export_dir, name))
+        os.rmdir(export_dir)
+    dedup_cache.forget_job(job_id)
+    analytics.forget_job(job_id)
+    speaker_index.forget_job(job_id)
+    job_queue.complete(job_id)
+    return reclaimed
+
+
+def sweep(policy=None, now=None, batch_size=RETENTION_BATCH_SIZE, max_batches=None):
+    """
+    Purge jobs that break the retention policy, oldest first.
+
+    Candidates are found with indexed queries, their files are deleted with
+    no database lock held, and the job records are then removed in one short
+    transaction per batch, so job updates are only blocked briefly.
+
+    Args:
+        policy (dict, optional): See default_policy().
+        now (datetime, optional): Reference time for the age limit.
+        batch_size (int): Jobs purged per batch.
+        max_batches (int, optional): Stop after this many batches (the next sweep continues).
+
+    Returns:
+        dict: jobs removed, bytes_reclaimed and a per-reason breakdown.
+    """
+    policy = policy or default_policy()
+    now = now or datetime.now()
+    report = {'jobs': 0, 'bytes_reclaimed': 0, 'by_reason': {}}
+
+    stages = []
+    if policy.get('max_age_days') is not None:
+        cutoff = now - timedelta(days=policy['max_age_days'])
+        stages.append(('age', lambda: _expired_by_age(cutoff, batch_size)))
+    if policy.get('user_max_jobs') is not None or policy.get('user_max_bytes') is not None \
+            or policy.get('user_quotas'):
+        stages.append(('user_quota', lambda: _over_user_quota(policy, batch_size)))
+    if policy.get('max_total_bytes') is not None:
+        stages.append(('total_size', lambda: _over_total_size(policy['max_total_bytes'], batch_size)))
+
+    batches = 0
+    started = time.time()
+    for reason, next_batch in stages:
+        while max_batches is None or batches < max_batches:
+            batch = next_batch()
+            if not batch:
+                break
+            reclaimed = 0
+            for job in batch:
+                try:
+                    reclaimed += purge_files(job)
+                except OSError as e:
+                    logger.error(f"Error removing files of job {job.get('job_id')}: {str(e)}")
+            removed = history_store.delete_jobs(job['job_id'] for job in batch)
+            batches += 1
+            report['jobs'] += removed
+            report['bytes_reclaimed'] += reclaimed
+            stats = report['by_reason'].setdefault(reason, {'jobs': 0, 'bytes_reclaimed': 0})
+            stats['jobs'] += removed
+            stats['bytes_reclaimed'] += reclaimed
+
+    if report['jobs']:
+        logger.info(f"Retention sweep removed {report['jobs']} jobs and reclaimed "
+                    f"{report['bytes_reclaimed']} bytes in {time.time() - started:.1f}s: {report['by_reason']}")
+    return report
+
+
+def run_forever(interval=RETENTION_INTERVAL, stop_event=None):
+    """Sweep every interval seconds until stop_event is set."""
+    while stop_event is None or not stop_event.is_set():
+        try:
+            sweep()
+        except Exception as e:
+            logger.error(f"Retention sweep failed: {str(e)}")
+        if stop_event is not None:
+            stop_event.wait(interval)
+        else:
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    print(json.dumps(sweep(), indent=2))
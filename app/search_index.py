@@ -0,0 +1,175 @@
+# app/search_index.py
+
+import os
+import re
+import logging
+
+import history_store
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('search_index')
+
+# Segments live in a plain table; the FTS5 index mirrors it through triggers,
+# so replacing one edited segment only re-indexes that segment.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcript_segments (
+    id         INTEGER PRIMARY KEY,
+    job_id     TEXT NOT NULL,
+    segment_id TEXT NOT NULL,
+    text       TEXT NOT NULL,
+    UNIQUE (job_id, segment_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts USING fts5(
+    job_id UNINDEXED, segment_id UNINDEXED, text,
+    content='transcript_segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS transcript_segments_ai AFTER INSERT ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (rowid, job_id, segment_id, text) VALUES (new.id, new.job_id, new.segment_id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcript_segments_ad AFTER DELETE ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (transcript_fts, rowid, job_id, segment_id, text)
+    VALUES ('delete', old.id, old.job_id, old.segment_id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcript_segments_au AFTER UPDATE ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (transcript_fts, rowid, job_id, segment_id, text)
+    VALUES ('delete', old.id, old.job_id, old.segment_id, old.text);
+    INSERT INTO transcript_fts (rowid, job_id, segment_id, text) VALUES (new.id, new.job_id, new.segment_id, new.text);
+END;
+"""
+
+# Subquery selecting the job_ids whose transcripts match an FTS query (one parameter)
+MATCH_SQL = ("SELECT DISTINCT s.job_id FROM transcript_fts f JOIN transcript_segments s ON s.id = f.rowid "
+             "WHERE transcript_fts MATCH ?")
+
+_schema_ready = False
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def fts_query(text):
+    """
+    Turn free text from a search box into a safe FTS5 query.
+
+    Every word must match (AND); a trailing * keeps prefix matching. FTS5
+    operators and quotes typed by the user are treated as plain text.
+    """
+    terms = []
+    for word in re.findall(r'[\w\']+\*?', text or '', re.UNICODE):
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def match_filter(text):
+    """
+    Build a filter on job_id for transcripts containing the search text.
+
+    Returns:
+        tuple: (subquery SQL, params), or None if the text has no searchable words.
+    """
+    query = fts_query(text)
+    if not query:
+        return None
+    _connection()
+    return MATCH_SQL, [query]
+
+
+def _transaction(conn, statements):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        statements(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def index_transcript(job_id, segments):
+    """Replace everything indexed for a job with its current segments."""
+    def statements(conn):
+        conn.execute("DELETE FROM transcript_segments WHERE job_id = ?", (job_id,))
+        conn.executemany(
+            "INSERT INTO transcript_segments (job_id, segment_id, text) VALUES (?, ?, ?)",
+            [(job_id, str(seg.get('id', i)), seg.get('text') or '') for i, seg in enumerate(segments)]
+        )
+    _transaction(_connection(), statements)
+
+
+def update_segments(job_id, edits):
+    """Re-index only the segments whose text changed in a batch of edits."""
+    changed = [(edit['text'] or '', job_id, str(edit['id'])) for edit in edits if 'text' in edit]
+    if not changed:
+        return
+    _transaction(_connection(), lambda conn: conn.executemany(
+        "UPDATE transcript_segments SET text = ? WHERE job_id = ? AND segment_id = ?", changed
+    ))
+
+
+def remove(job_id):
+    """Drop a job's transcript from the index."""
+    _connection().execute("DELETE FROM transcript_segments WHERE job_id = ?", (job_id,))
+
+
+def snippets(text, job_ids, tokens=12):
+    """
+    Return the best matching excerpt for each job, with hits wrapped in [ ].
+
+    Args:
+        text (str): Search text as typed by the user.
+        job_ids (list): Jobs to fetch excerpts for (e.g. one page of results).
+
+    Returns:
+        dict: job_id -> excerpt.
+    """
+    query = fts_query(text)
+    if not query or not job_ids:
+        return {}
+    placeholders = ', '.join('?' * len(job_ids))
+    rows = _connection().execute(
+        f"SELECT s.job_id, snippet(transcript_fts, 2, '[', ']', '...', ?) AS excerpt "
+        f"FROM transcript_fts f JOIN transcript_segments s ON s.id = f.rowid "
+        f"WHERE transcript_fts MATCH ? AND s.job_id IN ({placeholders}) ORDER BY rank",
+        [tokens, query] + list(job_ids)
+    ).fetchall()
+    excerpts = {}
+    for row in rows:
+        excerpts.setdefault(row['job_id'], row['excerpt'])
+    return excerpts
+
+
+def ensure_built():
+    """Index existing transcript snapshots the first time the index is used."""
+    import transcript_store
+
+    transcripts_folder = transcript_store.TRANSCRIPTS_FOLDER
+    conn = _connection()
+    if conn.execute("SELECT 1 FROM transcript_segments LIMIT 1").fetchone() is not None \
+            or not os.path.isdir(transcripts_folder):
+        return 0
+    indexed = 0
+    for name in os.listdir(transcripts_folder):
+        if not name.endswith('.json'):
+            continue
+        job_id = name[:-len('.json')]
+        try:
+            index_transcript(job_id, transcript_store.get_transcript(job_id)['segments'])
+            indexed += 1
+        except Exception as e:
+            logger.error(f"Could not index transcript {job_id}: {str(e)}")
+    if indexed:
+        logger.info(f"Indexed {indexed} existing transcripts")
+    return indexed
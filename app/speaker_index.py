@@ -0,0 +1,407 @@
+# app/speaker_index.py
+
+import os
+import math
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import history_store
+
+SPEAKER_INDEX_ENABLED = os.getenv("SPEAKER_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+SPEAKER_INDEX_FOLDER = os.getenv("SPEAKER_INDEX_FOLDER", "cache/speakers")
+# Cosine similarity a diarization cluster needs to be treated as a known speaker
+SPEAKER_MATCH_THRESHOLD = float(os.getenv("SPEAKER_MATCH_THRESHOLD", 0.7))
+# Below this many embeddings every query is a plain scan; above it the index is bucketed
+SPEAKER_INDEX_TRAIN_AT = int(os.getenv("SPEAKER_INDEX_TRAIN_AT", 4096))
+# Buckets searched per query once the index is bucketed
+SPEAKER_INDEX_NPROBE = int(os.getenv("SPEAKER_INDEX_NPROBE", 8))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/transcribe.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('speaker_index')
+
+# Embeddings are L2-normalized float32 rows appended to one flat file; row n
+# of the file is speaker_embeddings.row n. Everything else lives in history.db,
+# whose write lock also serializes appends from several workers. Rows of a
+# re-run or purged job are deleted from the table and leave a hole in the file.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS speakers (
+    id       INTEGER PRIMARY KEY,
+    name     TEXT,
+    created  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS speaker_embeddings (
+    row        INTEGER PRIMARY KEY,
+    speaker_id INTEGER NOT NULL,
+    job_id     TEXT NOT NULL,
+    label      TEXT NOT NULL,
+    bucket     INTEGER NOT NULL DEFAULT -1
+);
+CREATE INDEX IF NOT EXISTS idx_speaker_embeddings_speaker ON speaker_embeddings (speaker_id);
+CREATE INDEX IF NOT EXISTS idx_speaker_embeddings_job ON speaker_embeddings (job_id, label);
+CREATE TABLE IF NOT EXISTS speaker_index_meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS speaker_centroids (
+    bucket  INTEGER PRIMARY KEY,
+    vector  BLOB NOT NULL
+);
+"""
+
+_schema_ready = False
+# In-process copy of the index, topped up with rows other processes added
+_state = None
+_state_lock = threading.Lock()
+
+
+def _connection():
+    global _schema_ready
+    conn = history_store.get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def vectors_path():
+    return os.path.join(SPEAKER_INDEX_FOLDER, "embeddings.f32")
+
+
+def _meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM speaker_index_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO speaker_index_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value))
+    )
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _read_rows(dim, start, stop):
+    """Read embedding rows [start, stop) from the vectors file."""
+    count = stop - start
+    if count <= 0:
+        return np.zeros((0, dim), dtype=np.float32)
+    with open(vectors_path(), 'rb') as f:
+        f.seek(start * dim * 4)
+        data = np.fromfile(f, dtype=np.float32, count=count * dim)
+    return data.reshape(count, dim)
+
+
+def _refresh(conn):
+    """
+    Bring the in-process copy up to date with history.db.
+
+    New rows are read incrementally; a retrained bucketing or deleted rows
+    (a new generation) reload everything. Holes left by deleted rows get
+    speaker -1 and a zero vector, and are never returned by search().
+    """
+    global _state
+    dim = int(_meta(conn, 'dim', 0))
+    generation = int(_meta(conn, 'generation', 0))
+    rows = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) AS n FROM speaker_embeddings").fetchone()['n']
+    with _state_lock:
+        state = _state
+        if state is None or state['dim'] != dim or state['generation'] != generation or state['rows'] > rows:
+            state = {'dim': dim, 'generation': generation, 'rows': 0,
+                     'vectors': np.zeros((0, dim), dtype=np.float32),
+                     'speaker_ids': np.zeros(0, dtype=np.int64),
+                     'buckets': np.zeros(0, dtype=np.int32),
+                     'centroids': None, 'order': None, 'bounds': None}
+            centroid_rows = conn.execute("SELECT vector FROM speaker_centroids ORDER BY bucket").fetchall()
+            if centroid_rows:
+                state['centroids'] = np.stack([np.frombuffer(r['vector'], dtype=np.float32) for r in centroid_rows])
+        if rows > state['rows']:
+            start = state['rows']
+            speaker_ids = np.full(rows - start, -1, dtype=np.int64)
+            # Holes sort before the unbucketed rows (-1), so no inverted list includes them
+            buckets = np.full(rows - start, -2, dtype=np.int32)
+            for r in conn.execute(
+                "SELECT row, speaker_id, bucket FROM speaker_embeddings WHERE row >= ? AND row < ?", (start, rows)
+            ):
+                speaker_ids[r['row'] - start] = r['speaker_id']
+                buckets[r['row'] - start] = r['bucket']
+            vectors = _read_rows(dim, start, rows)
+            vectors[speaker_ids < 0] = 0.0
+            state['vectors'] = np.concatenate([state['vectors'], vectors])
+            state['speaker_ids'] = np.concatenate([state['speaker_ids'], speaker_ids])
+            state['buckets'] = np.concatenate([state['buckets'], buckets])
+            state['rows'] = rows
+            state['order'] = None
+        if state['centroids'] is not None and state['order'] is None:
+            # Inverted lists: rows sorted by bucket, with each bucket's slice bounds
+            state['order'] = np.argsort(state['buckets'], kind='stable')
+            state['bounds'] = np.searchsorted(state['buckets'][state['order']],
+                                              np.arange(-1, len(state['centroids']) + 1))
+        _state = state
+        return state
+
+
+def _candidates(state, query):
+    """Rows worth scoring for a query: all of them, or the rows in the nearest buckets."""
+    if state['centroids'] is None:
+        return None
+    nprobe = min(SPEAKER_INDEX_NPROBE, len(state['centroids']))
+    probe = np.argpartition(-(state['centroids'] @ query), nprobe - 1)[:nprobe]
+    order, bounds = state['order'], state['bounds']
+    # bounds[0]..bounds[1] are unbucketed rows (bucket -1), always searched
+    slices = [order[bounds[0]:bounds[1]]] + [order[bounds[b + 1]:bounds[b + 2]] for b in probe]
+    return np.concatenate(slices)
+
+
+def search(embeddings, k=1):
+    """
+    Find the nearest stored embeddings for each query by cosine similarity.
+
+    Args:
+        embeddings (array): Query vectors, one per row.
+        k (int): Neighbours to return per query.
+
+    Returns:
+        list: For each query, a list of (speaker_id, similarity) best first.
+    """
+    conn = _connection()
+    state = _refresh(conn)
+    queries = _normalize(np.atleast_2d(embeddings))
+    if state['rows'] == 0 or queries.shape[1] != state['dim']:
+        return [[] for _ in queries]
+    results = []
+    for query in queries:
+        rows = _candidates(state, query)
+        vectors = state['vectors'] if rows is None else state['vectors'][rows]
+        if not len(vectors):
+            results.append([])
+            continue
+        ids = state['speaker_ids'] if rows is None else state['speaker_ids'][rows]
+        # Holes (deleted rows) are never a match
+        scores = np.where(ids >= 0, vectors @ query, -np.inf)
+        top = np.argsort(-scores)[:k]
+        results.append([(int(ids[i]), float(scores[i])) for i in top if ids[i] >= 0])
+    return results
+
+
+def identify(job_id, embeddings):
+    """
+    Match a job's diarization clusters to known speakers and add them to the index.
+
+    Clusters are matched greedily, best similarity first, so two clusters of
+    one job never map to the same speaker. Clusters that match nobody become
+    new (unnamed) speakers. Embeddings stored by an earlier run of the same
+    job (a retry or re-transcription) are replaced, so a job is never
+    counted twice; they still take part in matching, so a re-run keeps its
+    speaker IDs.
+
+    Args:
+        job_id (str): Job the clusters come from.
+        embeddings (dict): Diarization label -> embedding vector.
+
+    Returns:
+        dict: label -> {'speaker_id', 'name', 'similarity'}; similarity is None for new speakers.
+    """
+    labels = [label for label, vector in embeddings.items() if np.all(np.isfinite(vector))]
+    if not labels:
+        return {}
+    vectors = _normalize([embeddings[label] for label in labels])
+    neighbours = search(vectors, k=5)
+
+    pairs = sorted(((score, label, speaker_id)
+                    for label, found in zip(labels, neighbours)
+                    for speaker_id, score in found if score >= SPEAKER_MATCH_THRESHOLD), reverse=True)
+    matched, taken = {}, set()
+    for score, label, speaker_id in pairs:
+        if label not in matched and speaker_id not in taken:
+            matched[label] = (speaker_id, score)
+            taken.add(speaker_id)
+
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        dim = int(_meta(conn, 'dim', 0))
+        if not dim:
+            dim = vectors.shape[1]
+            _set_meta(conn, 'dim', dim)
+        if vectors.shape[1] != dim:
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match the index ({dim})")
+        for label in labels:
+            if label not in matched:
+                cursor = conn.execute("INSERT INTO speakers (created) VALUES (?)",
+                                      (datetime.now().strftime(history_store.TIMESTAMP_FORMAT),))
+                matched[label] = (cursor.lastrowid, None)
+
+        _forget(conn, job_id)
+        buckets = _assign(conn, vectors)
+        first = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) AS n FROM speaker_embeddings").fetchone()['n']
+        os.makedirs(SPEAKER_INDEX_FOLDER, exist_ok=True)
+        with open(vectors_path(), 'ab') as f:
+            # Drop bytes left by an append whose transaction rolled back
+            f.truncate(first * dim * 4)
+            f.write(vectors.tobytes())
+        conn.executemany(
+            "INSERT INTO speaker_embeddings (row, speaker_id, job_id, label, bucket) VALUES (?, ?, ?, ?, ?)",
+            [(first + i, matched[label][0], job_id, label, int(bucket))
+             for i, (label, bucket) in enumerate(zip(labels, buckets))]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    names = _names(conn, [speaker_id for speaker_id, _ in matched.values()])
+    _maybe_train(conn)
+    return {label: {'speaker_id': speaker_id, 'name': names.get(speaker_id),
+                    'similarity': None if score is None else round(score, 3)}
+            for label, (speaker_id, score) in matched.items()}
+
+
+def _forget(conn, job_id):
+    """Delete a job's embeddings inside an open transaction; returns how many there were."""
+    removed = conn.execute("DELETE FROM speaker_embeddings WHERE job_id = ?", (job_id,)).rowcount
+    if removed:
+        # Other processes must reload to drop the rows from their in-memory copy
+        _set_meta(conn, 'generation', int(_meta(conn, 'generation', 0)) + 1)
+    return removed
+
+
+def forget_job(job_id):
+    """
+    Remove a job's embeddings from the index, e.g. when the job is purged.
+
+    Speakers keep their IDs (older job records refer to them), but unnamed
+    ones left without embeddings are no longer listed.
+
+    Returns:
+        int: Number of embeddings removed.
+    """
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        removed = _forget(conn, job_id)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return removed
+
+
+def _names(conn, speaker_ids):
+    if not speaker_ids:
+        return {}
+    placeholders = ', '.join('?' * len(speaker_ids))
+    return {row['id']: row['name'] for row in conn.execute(
+        f"SELECT id, name FROM speakers WHERE id IN ({placeholders})", list(speaker_ids))}
+
+
+def _assign(conn, vectors):
+    """Bucket of each vector under the current centroids (-1 before the index is bucketed)."""
+    rows = conn.execute("SELECT vector FROM speaker_centroids ORDER BY bucket").fetchall()
+    if not rows:
+        return np.full(len(vectors), -1, dtype=np.int32)
+    centroids = np.stack([np.frombuffer(r['vector'], dtype=np.float32) for r in rows])
+    return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means on unit vectors; returns (k, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Reseed empty buckets with random points so every bucket stays in use
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _maybe_train(conn):
+    """(Re)bucket the index once it passes SPEAKER_INDEX_TRAIN_AT rows and again each time it doubles."""
+    rows = conn.execute("SELECT COUNT(*) AS n FROM speaker_embeddings").fetchone()['n']
+    trained = int(_meta(conn, 'trained_rows', 0))
+    if rows < SPEAKER_INDEX_TRAIN_AT or (trained and rows < 2 * trained):
+        return False
+    try:
+        train(conn)
+    except Exception as e:
+        logger.error(f"Could not retrain the speaker index: {str(e)}")
+        return False
+    return True
+
+
+def train(conn=None):
+    """
+    Cluster the stored embeddings into about sqrt(n) buckets.
+
+    A query then scores the centroids plus the rows of its
+    SPEAKER_INDEX_NPROBE nearest buckets instead of every row. Only live
+    rows are sampled; holes left by deleted jobs don't shape the buckets.
+    """
+    conn = conn or _connection()
+    dim = int(_meta(conn, 'dim', 0))
+    live = np.array([r['row'] for r in conn.execute("SELECT row FROM speaker_embeddings ORDER BY row")],
+                    dtype=np.int64)
+    k = max(1, int(math.sqrt(len(live))))
+    vectors = np.memmap(vectors_path(), dtype=np.float32, mode='r', shape=(int(live[-1]) + 1, dim))
+    sample = np.random.default_rng(0).choice(live, size=min(len(live), KMEANS_SAMPLE), replace=False)
+    centroids = kmeans(np.asarray(vectors[np.sort(sample)]), k)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM speaker_centroids")
+        conn.executemany("INSERT INTO speaker_centroids (bucket, vector) VALUES (?, ?)",
+                         [(i, centroid.tobytes()) for i, centroid in enumerate(centroids)])
+        # Rows appended by others since `live` was read are bucketed too
+        total = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) AS n FROM speaker_embeddings").fetchone()['n']
+        for start in range(0, total, 10000):
+            chunk = _read_rows(dim, start, min(start + 10000, total))
+            buckets = np.argmax(chunk @ centroids.T, axis=1)
+            conn.executemany("UPDATE speaker_embeddings SET bucket = ? WHERE row = ?",
+                             [(int(b), start + i) for i, b in enumerate(buckets)])
+        _set_meta(conn, 'trained_rows', conn.execute("SELECT COUNT(*) FROM speaker_embeddings").fetchone()[0])
+        _set_meta(conn, 'generation', int(_meta(conn, 'generation', 0)) + 1)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info(f"Bucketed {total} speaker embeddings into {k} buckets")
+    return k
+
+
+def list_speakers():
+    """Known speakers with how many embeddings and jobs each has (named ones even with none left)."""
+    rows = _connection().execute(
+        "SELECT s.id, s.name, s.created, COUNT(e.row) AS embeddings, COUNT(DISTINCT e.job_id) AS jobs "
+        "FROM speakers s LEFT JOIN speaker_embeddings e ON e.speaker_id = s.id GROUP BY s.id "
+        "HAVING COUNT(e.row) > 0 OR s.name IS NOT NULL ORDER BY s.id"
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def name_speaker(speaker_id, name):
+    """
+    Give a known speaker a name used to label later transcripts.
+
+    Returns:
+        bool: False if there is no such speaker.
+    """
+    cursor = _connection().execute("UPDATE speakers SET name = ? WHERE id = ?", (name or None, speaker_id))
+    return cursor.rowcount > 0
@@ -0,0 +1,81 @@
+# app/speakers.py
+
+import heapq
+from bisect import bisect_left
+
+
+def diarization_turns(diarization):
+    """
+    Flatten a pyannote annotation into speaker turns.
+
+    Args:
+        diarization: pyannote.core.Annotation returned by the diarization pipeline.
+
+    Returns:
+        list: (start, end, speaker) tuples sorted by start time.
+    """
+    turns = [(turn.start, turn.end, speaker)
+             for turn, _, speaker in diarization.itertracks(yield_label=True)]
+    turns.sort()
+    return turns
+
+
+def assign_speakers(segments, turns):
+    """
+    Label each transcript segment with the speaker that overlaps it most.
+
+    Segments and turns are both swept in start order while a min-heap keyed
+    on turn end time holds the turns that are still open, so each turn is
+    pushed and popped once: O((n + m) log(n + m)) overall. Segments that no
+    turn overlaps fall back to the nearest turn.
+
+    Args:
+        segments (list): Dicts with 'start' and 'end' keys; updated in place with 'speaker'.
+        turns (list): (start, end, speaker) tuples sorted by start, as from diarization_turns().
+
+    Returns:
+        list: The same segments.
+    """
+    if not turns:
+        return segments
+
+    turn_starts = [turn[0] for turn in turns]
+    active = []
+    next_turn = 0
+
+    for segment in sorted(segments, key=lambda s: s['start']):
+        seg_start, seg_end = segment['start'], segment['end']
+
+        # Open every turn that starts before this segment ends
+        while next_turn < len(turns) and turns[next_turn][0] < seg_end:
+            start, end, speaker = turns[next_turn]
+            heapq.heappush(active, (end, start, speaker))
+            next_turn += 1
+        # Close turns that ended before this segment starts; later segments start later still
+        while active and active[0][0] <= seg_start:
+            heapq.heappop(active)
+
+        overlap = {}
+        for end, start, speaker in active:
+            amount = min(end, seg_end) - max(start, seg_start)
+            if amount > 0:
+                overlap[speaker] = overlap.get(speaker, 0.0) + amount
+
+        if overlap:
+            segment['speaker'] = max(overlap, key=overlap.get)
+        else:
+            segment['speaker'] = _nearest_speaker(turns, turn_starts, (seg_start + seg_end) / 2)
+
+    return segments
+
+
+def _nearest_speaker(turns, turn_starts, point):
+    """Speaker of the turn closest to a point in time."""
+    index = bisect_left(turn_starts, point)
+    candidates = turns[max(0, index - 1):index + 1]
+
+    def distance(turn):
+        start, end, _ = turn
+        return 0.0 if start <= point <= end else min(abs(point - start), abs(point - end))
+
+    return min(candidates, key=distance)[2]
@@ -0,0 +1,277 @@
+# app/transcript_store.py
+
+import os
+import json
+import time
+import logging
+import threading
+import filelock
+from contextlib import contextmanager
+
+import search_index
+
+TRANSCRIPTS_FOLDER = os.getenv("TRANSCRIPTS_FOLDER", "transcripts")
+# Fold the edit log into the snapshot once it holds this many edits
+COMPACT_AFTER_EDITS = int(os.getenv("TRANSCRIPT_COMPACT_AFTER", 200))
+EDITABLE_FIELDS = ('text', 'speaker')
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/utils.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('transcript_store')
+
+# transcript_id -> loaded state; see _load()
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class TranscriptNotFound(Exception):
+    pass
+
+
+class SegmentNotFound(Exception):
+    pass
+
+
+def snapshot_path(transcript_id):
+    return os.path.join(TRANSCRIPTS_FOLDER, f"{transcript_id}.json")
+
+
+def log_path(transcript_id):
+    return os.path.join(TRANSCRIPTS_FOLDER, f"{transcript_id}.edits.jsonl")
+
+
+def _lock_for(transcript_id):
+    return filelock.FileLock(os.path.join(TRANSCRIPTS_FOLDER, f"{transcript_id}.lock"))
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+
+def _apply(state, entry):
+    position = state['index'][entry['segment_id']]
+    state['segments'][position].update(entry['fields'])
+    state['version'] = entry['version']
+    state['pending_edits'] += 1
+
+
+def _load(transcript_id):
+    """
+    Return the current state of a transcript: snapshot plus replayed edits.
+
+    State is cached per process. A changed snapshot (e.g. compacted by
+    another process) triggers a full reload; otherwise only edit-log lines
+    appended since the last load are replayed.
+    """
+    snapshot = snapshot_path(transcript_id)
+    snapshot_key = _stat_key(snapshot)
+    if snapshot_key is None:
+        _cache.pop(transcript_id, None)
+        raise TranscriptNotFound(transcript_id)
+
+    state = _cache.get(transcript_id)
+    if state is None or state['snapshot_key'] != snapshot_key:
+        with open(snapshot, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        segments = data.get('segments', [])
+        state = {
+            'job_id': data.get('job_id', transcript_id),
+            'version': data.get('version', 0),
+            'segments': segments,
+            'index': {str(seg.get('id')): i for i, seg in enumerate(segments)},
+            'snapshot_key': snapshot_key,
+            'log_offset': 0,
+            'pending_edits': 0
+        }
+        _cache[transcript_id] = state
+
+    log = log_path(transcript_id)
+    if os.path.exists(log) and os.path.getsize(log) > state['log_offset']:
+        with open(log, 'rb') as f:
+            f.seek(state['log_offset'])
+            appended = f.read()
+        # Ignore a trailing partial line that is still being written
+        appended = appended[:appended.rfind(b'\n') + 1]
+        for line in appended.splitlines():
+            entry = json.loads(line)
+            if entry['version'] > state['version']:
+                _apply(state, entry)
+        state['log_offset'] += len(appended)
+    return state
+
+
+def write_transcript(transcript_id, segments, job_id=None):
+    """
+    Create (or replace) a structured transcript.
+
+    Args:
+        transcript_id (str): Transcript ID (the job ID for pipeline output).
+        segments (list): Segment dicts with start, end, text and optional speaker.
+            Segments without an 'id' are numbered in order.
+        job_id (str, optional): Job the transcript belongs to.
+
+    Returns:
+        str: Path of the snapshot file.
+    """
+    os.makedirs(TRANSCRIPTS_FOLDER, exist_ok=True)
+    normalized = []
+    for i, seg in enumerate(segments):
+        seg = dict(seg)
+        seg['id'] = str(seg.get('id', i))
+        normalized.append(seg)
+
+    with _lock_for(transcript_id), _cache_lock:
+        # Versions keep increasing across re-runs so version-keyed caches stay valid
+        try:
+            version = _load(transcript_id)['version'] + 1
+        except TranscriptNotFound:
+            version = 0
+        path = snapshot_path(transcript_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'job_id': job_id or transcript_id, 'version': version, 'segments': normalized}, f)
+        os.replace(tmp_path, path)
+        if os.path.exists(log_path(transcript_id)):
+            os.remove(log_path(transcript_id))
+        _cache.pop(transcript_id, None)
+    _reindex(search_index.index_transcript, transcript_id, normalized)
+    return path
+
+
+def _reindex(update, transcript_id, *args):
+    """Keep the search index in step; it is derived data, so failures never block a write."""
+    try:
+        update(transcript_id, *args)
+    except Exception as e:
+        logger.error(f"Could not update search index for {transcript_id}: {str(e)}")
+
+
+@contextmanager
+def _reading(transcript_id):
+    """
+    Hold the transcript's file lock (the one writers take) while loading it.
+
+    Compaction swaps the snapshot and removes the edit log in two steps; a
+    reader that refreshed in between would pair a log offset with the wrong
+    file, so refreshes wait for any write or compaction to finish.
+    """
+    if not os.path.exists(snapshot_path(transcript_id)):
+        with _cache_lock:
+            _cache.pop(transcript_id, None)
+        raise TranscriptNotFound(transcript_id)
+    with _lock_for(transcript_id), _cache_lock:
+        yield
+
+
+def get_transcript(transcript_id):
+    """
+    Load a transcript with all edits applied.
+
+    Returns:
+        dict: {'job_id', 'version', 'segments'}; segments must be treated as read-only.
+
+    Raises:
+        TranscriptNotFound: If the transcript does not exist.
+    """
+    with _reading(transcript_id):
+        state = _load(transcript_id)
+        return {'job_id': state['job_id'], 'version': state['version'], 'segments': list(state['segments'])}
+
+
+def get_segment(transcript_id, segment_id):
+    """Return one segment by ID in O(1), or raise SegmentNotFound."""
+    with _reading(transcript_id):
+        state = _load(transcript_id)
+        position = state['index'].get(str(segment_id))
+        if position is None:
+            raise SegmentNotFound(segment_id)
+        return dict(state['segments'][position])
+
+
+def apply_edits(transcript_id, edits, user=None):
+    """
+    Apply a batch of segment edits with a single append to the edit log.
+
+    Args:
+        transcript_id (str): Transcript to edit.
+        edits (list): Dicts with 'id' and any of EDITABLE_FIELDS.
+        user (str, optional): Who made the edits, recorded in the log.
+
+    Returns:
+        int: The transcript version after the edits.
+
+    Raises:
+        TranscriptNotFound: If the transcript does not exist.
+        SegmentNotFound: If any edit names an unknown segment; nothing is applied.
+        ValueError: If an edit has no editable fields.
+    """
+    with _lock_for(transcript_id), _cache_lock:
+        state = _load(transcript_id)
+
+        entries = []
+        version = state['version']
+        for edit in edits:
+            segment_id = str(edit.get('id'))
+            if segment_id not in state['index']:
+                raise SegmentNotFound(segment_id)
+            fields = {k: edit[k] for k in EDITABLE_FIELDS if k in edit}
+            if not fields:
+                raise ValueError(f"No editable fields for segment {segment_id}")
+            version += 1
+            entries.append({'version': version, 'segment_id': segment_id, 'fields': fields,
+                            'user': user, 'ts': time.time()})
+        if not entries:
+            return state['version']
+
+        payload = ''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8')
+        with open(log_path(transcript_id), 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            _apply(state, entry)
+        state['log_offset'] += len(payload)
+
+        if state['pending_edits'] >= COMPACT_AFTER_EDITS:
+            _compact(transcript_id, state)
+        _reindex(search_index.update_segments, transcript_id,
+                 [dict(entry['fields'], id=entry['segment_id']) for entry in entries])
+        return state['version']
+
+
+def _compact(transcript_id, state):
+    """
+    Fold the edit log into a new snapshot.
+
+    Caller holds the transcript's file lock, which readers also take, so no
+    process sees the new snapshot alongside the old log or a stale offset.
+    """
+    path = snapshot_path(transcript_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'job_id': state['job_id'], 'version': state['version'], 'segments': state['segments']}, f)
+    os.replace(tmp_path, path)
+    os.remove(log_path(transcript_id))
+    state['snapshot_key'] = _stat_key(path)
+    state['log_offset'] = 0
+    state['pending_edits'] = 0
+    logger.info(f"Compacted transcript {transcript_id} at version {state['version']}")
+
+
+def delete_transcript(transcript_id):
+    """Remove a transcript's snapshot, edit log and lock file."""
+    for path in (snapshot_path(transcript_id), log_path(transcript_id),
+                 os.path.join(TRANSCRIPTS_FOLDER, f"{transcript_id}.lock")):
+        if os.path.exists(path):
+            os.remove(path)
+    with _cache_lock:
+        _cache.pop(transcript_id, None)
+    _reindex(search_index.remove, transcript_id)
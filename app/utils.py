@@ -1,16 +1,23 @@
 # app/utils.py
 
 import os
-import json
 import uuid
+import hashlib
 import filelock
 import logging
-from datetime import datetime, timedelta
+import job_queue
+import history_store
+import analytics
+import search_index
+import preflight
+from datetime import datetime
 
 UPLOAD_FOLDER = 'uploads'
 HISTORY_FILE = 'uploads.json'
 TRANSCRIPTS_FOLDER = 'static/transcripts'
 LOG_FOLDER = 'logs'
+AUDIO_CACHE_FOLDER = os.getenv("AUDIO_CACHE_FOLDER", "cache/audio")
+COPY_BLOCK_SIZE = 1024 * 1024
 
 # Set up logging
 logging.basicConfig(
@@ -21,25 +28,26 @@ logging.basicConfig(
 logger = logging.getLogger('utils')
 
 def ensure_directories():
-    """Ensure all required directories and history file exist."""
+    """Ensure all required directories exist and the history database is migrated."""
     try:
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(TRANSCRIPTS_FOLDER, exist_ok=True)
         os.makedirs(LOG_FOLDER, exist_ok=True)
-        
+
+        # One-shot import of the legacy JSON history into the database
         lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
         with lock:
-            if not os.path.exists(HISTORY_FILE):
-                with open(HISTORY_FILE, 'w') as f:
-                    json.dump([], f)
-                
+            history_store.migrate_from_json(HISTORY_FILE)
+            analytics.ensure_built()
+            search_index.ensure_built()
+
         logger.info("Directory structure validated")
     except Exception as e:
         logger.error(f"Error ensuring directories: {str(e)}")
         raise
 
 
-def save_upload(file_obj, username, language="en"):
+def save_upload(file_obj, username, language="en", model_size=None, compute_type=None):
     """
     Save uploaded file and log it to history.
 
@@ -47,6 +55,8 @@ def save_upload(file_obj, username, language="en"):
         file_obj: Werkzeug FileStorage object
         username: User who uploaded the file
         language: Language code for transcription
+        model_size: Optional Whisper model size for this job (defaults to WHISPER_MODEL)
+        compute_type: Optional Whisper compute type for this job (int8, int8_float16, float32, ...)
     Returns:
         tuple: (job_id, filename) - identifiers for the saved file
     """
@@ -55,42 +65,14 @@ def save_upload(file_obj, username, language="en"):
         if not file_obj or not hasattr(file_obj, 'filename'):
             raise ValueError("Invalid file object provided")
         original_filename = file_obj.filename
-        secure_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
-        
-        job_id = str(uuid.uuid4())
+        secure_filename = make_secure_filename(original_filename)
         filepath = os.path.join(UPLOAD_FOLDER, secure_filename)
         
-        # Save the file
-        file_obj.save(filepath)
-        file_size = os.path.getsize(filepath)
-
-        entry = {
-            "job_id": job_id,
-            "original_filename": original_filename,
-            "filename": secure_filename,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "status": "Pending",
-            "language": language,
-            "file_size": file_size,
-            "user": username,
-            "display_name": original_filename
-        }
-        lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-        with lock:
-            if os.path.exists(HISTORY_FILE) and os.path.getsize(HISTORY_FILE) > 0:
-                with open(HISTORY_FILE, 'r') as f:
-                    history = json.load(f)
-            else:
-                history = []
-
-            history.insert(0, entry)
-
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(history, f, indent=2)
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(history, f, indent=2)
-        
-        logger.info(f"File saved: {original_filename} by {username}, job_id: {job_id}")
+        # Save the file, hashing it on the way for the dedup cache
+        audio_hash, file_size = save_and_hash(file_obj.stream, filepath)
+
+        job_id = register_upload(original_filename, secure_filename, username, language, file_size,
+                                 audio_hash, model_size, compute_type)
         return job_id, secure_filename
     
     except Exception as e:
@@ -98,67 +80,125 @@ def save_upload(file_obj, username, language="en"):
         raise
 
 
+def make_secure_filename(original_filename):
+    """Generate a storage name for an upload that can't be used for path traversal."""
+    return str(uuid.uuid4()) + os.path.splitext(os.path.basename(original_filename))[1]
+
+
+def register_upload(original_filename, secure_filename, username, language, file_size,
+                    audio_hash=None, model_size=None, compute_type=None):
+    """
+    Record a fully stored upload in the history and queue it for transcription.
+
+    Args:
+        original_filename: Name the user uploaded the file as
+        secure_filename: Name of the stored file in UPLOAD_FOLDER
+        username: User who uploaded the file
+        language: Language code for transcription
+        file_size: Size of the stored file in bytes
+        audio_hash: SHA-256 of the file, for the dedup cache
+        model_size: Optional Whisper model size for this job
+        compute_type: Optional Whisper compute type for this job
+    Returns:
+        str: job_id of the new job
+    """
+    job_id = str(uuid.uuid4())
+    # The duration lets the scheduler run short jobs first; "auto" is resolved by the worker
+    probe = preflight.probe_upload(os.path.join(UPLOAD_FOLDER, secure_filename))
+    entry = {
+        "job_id": job_id,
+        "original_filename": original_filename,
+        "filename": secure_filename,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "Pending",
+        "language": language,
+        "file_size": file_size,
+        "user": username,
+        "display_name": original_filename,
+        "audio_hash": audio_hash
+    }
+    entry.update({key: value for key, value in probe.items() if value is not None})
+    if model_size:
+        entry["model_size"] = model_size
+    if compute_type:
+        entry["compute_type"] = compute_type
+    history_store.insert_job(entry)
+    analytics.record_upload(entry)
+
+    # Hand the job to the worker pool
+    job_queue.enqueue(job_id, secure_filename, username, language, audio_seconds=probe['audio_duration'])
+
+    logger.info(f"File saved: {original_filename} by {username}, job_id: {job_id}")
+    return job_id
+
+
+def save_and_hash(stream, filepath):
+    """
+    Copy a stream to disk in fixed-size blocks, hashing it as it goes.
+
+    Args:
+        stream: Readable binary stream.
+        filepath: Destination path.
+
+    Returns:
+        tuple: (sha256 hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'wb') as out:
+        while True:
+            block = stream.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
 def get_upload_history():
     """
-    Load upload history from file.
+    Load upload history from the history database.
 
     Returns:
-        list: List of upload history entries.
+        list: List of upload history entries, newest first.
     """
     try:
-        lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-        with lock:
-            if os.path.exists(HISTORY_FILE):
-                with open(HISTORY_FILE, 'r') as f:
-                    return json.load(f)
-        return []
+        return history_store.list_jobs()
     except Exception as e:
         logger.error(f"Error loading upload history: {str(e)}")
         return []
 
-    def update_job_status(job_id, status, error_message=None):
-        """
-        Update the status of a job in the history file.
-    
-        Args:
-            job_id (str): ID of the job to update.
-            status (str): New status of the job.
-            error_message (str, optional): Optional error message.
-    
-        Returns:
-            bool: True if update was successful, False otherwise.
-        """
-        try:
-            if not os.path.exists(HISTORY_FILE):
-                logger.warning(f"History file not found when updating job {job_id}")
-                return False
-    
-            lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-            with lock:
-                with open(HISTORY_FILE, 'r') as f:
-                    history = json.load(f)
-    
-                job_updated = False
-                for job in history:
-                    if job.get('job_id') == job_id:
-                        job['status'] = status
-                        if error_message:
-                            job['error_message'] = error_message
-                        job_updated = True
-                        break
-    
-                if job_updated:
-                    with open(HISTORY_FILE, 'w') as f:
-                        json.dump(history, f, indent=2)
-                    logger.info(f"Job {job_id} status updated to '{status}'")
-                    return True
-                else:
-                    logger.warning(f"Job {job_id} not found when updating status")
-                    return False
-    
-        except Exception as e:
-            logger.error(f"Error updating job status: {str(e)}")
+
+def update_job_status(job_id, status, error_message=None):
+    """
+    Update the status of a job in the history database.
+
+    Args:
+        job_id (str): ID of the job to update.
+        status (str): New status of the job.
+        error_message (str, optional): Optional error message.
+
+    Returns:
+        bool: True if update was successful, False otherwise.
+    """
+    try:
+        fields = {'status': status}
+        if error_message:
+            fields['error_message'] = error_message
+
+        if history_store.update_job(job_id, fields):
+            logger.info(f"Job {job_id} status updated to '{status}'")
+            return True
+        else:
+            logger.warning(f"Job {job_id} not found when updating status")
             return False
+
+    except Exception as e:
+        logger.error(f"Error updating job status: {str(e)}")
+        return False
+
+
 def get_job_by_id(job_id):
     """
     Get job details by ID.
@@ -170,15 +210,7 @@ def get_job_by_id(job_id):
         dict: Job details if found, None otherwise.
     """
     try:
-        lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-        with lock:
-            if os.path.exists(HISTORY_FILE):
-                with open(HISTORY_FILE, 'r') as f:
-                    history = json.load(f)
-                for job in history:
-                    if job.get('job_id') == job_id:
-                        return job
-        return None
+        return history_store.get_job(job_id)
     except Exception as e:
         logger.error(f"Error retrieving job by ID: {str(e)}")
         return None
@@ -193,40 +225,12 @@ def remove_old_uploads(days):
     Returns:
         int: Number of files cleaned up.
     """
+    # Imported here: retention builds on this module's folders
+    import retention
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        cleaned_count = 0
-
-        lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-        with lock:
-            if os.path.exists(HISTORY_FILE):
-                with open(HISTORY_FILE, 'r') as f:
-                    history = json.load(f)
-
-                new_history = []
-                for job in history:
-                    timestamp = job.get('timestamp')
-                    if timestamp:
-                        job_date = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
-                        if job_date < cutoff_date:
-                            filename = job.get('filename')
-                            if filename:
-                                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                                if os.path.exists(filepath):
-                                    os.remove(filepath)
-                            transcript_path = os.path.join(TRANSCRIPTS_FOLDER, f"{job.get('job_id')}.txt")
-                            if os.path.exists(transcript_path):
-                                os.remove(transcript_path)
-                            cleaned_count += 1
-                        else:
-                            new_history.append(job)
-
-                with open(HISTORY_FILE, 'w') as f:
-                    json.dump(new_history, f, indent=2)
-
-        logger.info(f"Cleaned up {cleaned_count} old uploads")
-        return cleaned_count
+        report = retention.sweep({'max_age_days': days})
+        logger.info(f"Cleaned up {report['jobs']} old uploads ({report['bytes_reclaimed']} bytes)")
+        return report['jobs']
     except Exception as e:
         logger.error(f"Error cleaning old uploads: {str(e)}")
         return 0
-        return 0
@@ -1,7 +1,20 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, Response, stream_with_context, send_file
 import os
 import json
+import time
+import base64
 from functools import wraps
+import history_store
+import transcript_store
+import exporters
+import resumable
+import analytics
+import metrics
+import job_queue
+import search_index
+import log_store
+import speaker_index
+from datetime import datetime
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.secret_key = 'your_secret_key_here'
@@ -9,9 +22,12 @@ app.secret_key = 'your_secret_key_here'
 UPLOAD_FOLDER = 'uploads'
 HISTORY_FILE = 'uploads.json'
 TRANSCRIPTS_FOLDER = 'transcripts'
+SSE_POLL_INTERVAL = 1.0
+TUS_VERSION = '1.0.0'
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TRANSCRIPTS_FOLDER, exist_ok=True)
+log_store.configure('web')
 if not os.path.exists(HISTORY_FILE):
     with open(HISTORY_FILE, 'w') as f:
         json.dump([], f)
@@ -26,6 +42,21 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def can_access_job(job_id):
+    """Whether the logged-in user may see a job (and its transcript): its owner or an admin."""
+    if session.get('role') == 'admin':
+        return True
+    job = history_store.get_job(job_id)
+    return job is not None and job.get('user') == session.get('username')
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -40,24 +71,366 @@ def update_transcript_segment(transcript_id, segment_id):
     Receives: { "text": "Corrected text" }
     Edits the transcript segment and saves the transcript.
     """
-    transcript_path = os.path.join(TRANSCRIPTS_FOLDER, f"{transcript_id}.json")
-    if not os.path.exists(transcript_path):
+    if not (request.is_json and isinstance(request.json, dict) and 'text' in request.json):
+        return jsonify({'success': False, 'message': 'Missing text'}), 400
+    if not can_access_job(transcript_id):
+        return jsonify({'success': False, 'message': 'Transcript not found'}), 404
+    try:
+        version = transcript_store.apply_edits(
+            transcript_id, [{'id': segment_id, 'text': request.json['text']}], user=session.get('username')
+        )
+    except transcript_store.TranscriptNotFound:
         return jsonify({'success': False, 'message': 'Transcript not found'}), 404
-    with open(transcript_path, 'r') as f:
-        data = json.load(f)
-    updated = False
-    for seg in data.get('segments', []):
-        if seg.get('id') == segment_id:
-            if request.is_json and isinstance(request.json, dict) and 'text' in request.json:
-                seg['text'] = request.json['text']
-            updated = True
-            break
-    if updated:
-        with open(transcript_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        return jsonify({'success': True, 'message': 'Segment updated'})
-    else:
+    except transcript_store.SegmentNotFound:
         return jsonify({'success': False, 'message': 'Segment not found'}), 404
+    exporters.invalidate(transcript_id)
+    return jsonify({'success': True, 'message': 'Segment updated', 'version': version})
+
+# -- Batch edit of transcript segments --
+@app.route('/transcript/<transcript_id>/segments', methods=['PATCH'])
+@login_required
+def update_transcript_segments(transcript_id):
+    """
+    Receives: { "edits": [ { "id": "12", "text": "...", "speaker": "..." }, ... ] }
+    Applies all edits in one write; if any segment is unknown, nothing is applied.
+    """
+    edits = request.json.get('edits') if request.is_json and isinstance(request.json, dict) else None
+    if not isinstance(edits, list) or not all(isinstance(e, dict) and 'id' in e for e in edits):
+        return jsonify({'success': False, 'message': 'Expected a list of edits with segment ids'}), 400
+    if not can_access_job(transcript_id):
+        return jsonify({'success': False, 'message': 'Transcript not found'}), 404
+    try:
+        version = transcript_store.apply_edits(transcript_id, edits, user=session.get('username'))
+    except transcript_store.TranscriptNotFound:
+        return jsonify({'success': False, 'message': 'Transcript not found'}), 404
+    except transcript_store.SegmentNotFound as e:
+        return jsonify({'success': False, 'message': f'Segment not found: {e}'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    exporters.invalidate(transcript_id)
+    return jsonify({'success': True, 'message': f'{len(edits)} segments updated', 'version': version})
+
+# -- Resumable uploads (tus-style offsets) --
+def _tus_metadata(header):
+    """Parse a tus Upload-Metadata header: comma-separated 'key base64value' pairs."""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+    return metadata
+
+@app.route('/uploads', methods=['POST'])
+@login_required
+def create_resumable_upload():
+    """
+    Starts a resumable upload. Headers: Upload-Length, and Upload-Metadata
+    with 'filename' and optional 'language'. Returns its URL in Location.
+    """
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+        metadata = _tus_metadata(request.headers.get('Upload-Metadata'))
+        upload_id = resumable.create_upload(
+            session['username'], metadata.get('filename') or 'upload', length, metadata.get('language') or 'en'
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid upload request: {e}'}), 400
+    response = jsonify({'success': True, 'upload_id': upload_id})
+    response.status_code = 201
+    response.headers['Location'] = url_for('resumable_upload', upload_id=upload_id)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+@login_required
+def resumable_upload(upload_id):
+    """
+    HEAD reports Upload-Offset so a client can resume; PATCH appends the body
+    (Content-Type: application/offset+octet-stream) at Upload-Offset; DELETE aborts.
+    When the last byte arrives the job is queued and returned in Upload-Job-Id.
+    """
+    username = session['username']
+    headers = {'Tus-Resumable': TUS_VERSION, 'Cache-Control': 'no-store'}
+    try:
+        if request.method == 'HEAD':
+            upload = resumable.get_upload(upload_id)
+            if upload['user'] != username:
+                raise resumable.UploadNotFound(upload_id)
+        elif request.method == 'DELETE':
+            resumable.abort_upload(upload_id, username)
+            return Response(status=204, headers=headers)
+        else:
+            if request.mimetype != 'application/offset+octet-stream':
+                return Response(status=415, headers=headers)
+            offset = int(request.headers.get('Upload-Offset', ''))
+            upload = resumable.append_chunk(upload_id, offset, request.stream, username)
+    except resumable.UploadNotFound:
+        return Response(status=404, headers=headers)
+    except resumable.OffsetMismatch as e:
+        headers['Upload-Offset'] = str(e.expected)
+        return Response(status=409, headers=headers)
+    except ValueError:
+        return Response(status=400, headers=headers)
+
+    headers['Upload-Offset'] = str(upload['offset'])
+    headers['Upload-Length'] = str(upload['length'])
+    if upload.get('job_id'):
+        headers['Upload-Job-Id'] = upload['job_id']
+    return Response(status=200 if request.method == 'HEAD' else 204, headers=headers)
+
+# -- Download transcript as txt / srt / vtt / json --
+@app.route('/transcript/<transcript_id>/export/<fmt>')
+@login_required
+def export_transcript(transcript_id, fmt):
+    """
+    Serves a rendered export. Renders are cached per transcript version and
+    sent with an ETag, so repeat downloads are answered with 304 Not Modified.
+    """
+    if fmt not in exporters.FORMATS:
+        return jsonify({'success': False, 'message': f'Unsupported format: {fmt}'}), 400
+    if not can_access_job(transcript_id):
+        return jsonify({'success': False, 'message': 'Transcript not found'}), 404
+    try:
+        path, etag, mimetype = exporters.get_export(transcript_id, fmt)
+    except transcript_store.TranscriptNotFound:
+        return jsonify({'success': False, 'message': 'Transcript not found'}), 404
+    response = send_file(path, mimetype=mimetype, as_attachment=True,
+                         download_name=f"{transcript_id}.{fmt}", etag=etag, conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# -- Queue ETA from the measured real-time factor --
+# Used until the first job finishes and there is a real-time factor to go on
+DEFAULT_REAL_TIME_FACTOR = 0.5
+
+def queue_estimate(job_id):
+    """Expected start and finish of a waiting job, or None if it isn't in the queue."""
+    import worker
+    rtf = analytics.real_time_factor() or DEFAULT_REAL_TIME_FACTOR
+    return job_queue.estimate_wait(job_id, rtf, worker.default_concurrency())
+
+# -- Job progress over Server-Sent Events --
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """
+    Streams job progress and partial transcript text as Server-Sent Events.
+    Events: 'progress' (status, percent, ETA; for waiting jobs also the expected
+    start and queue position), 'text' (newly transcribed lines; with
+    replace set, the text replaces everything sent so far, e.g. the final
+    speaker-labelled transcript) and 'done' once the job is Complete or Failed.
+    """
+    # Other users' jobs look the same as missing ones
+    if history_store.get_job(job_id) is None or not can_access_job(job_id):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    transcript_path = os.path.join(TRANSCRIPTS_FOLDER, f"{job_id}.txt")
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def stream():
+        offset, inode = 0, None
+        last_progress = None
+
+        def new_text(final=False):
+            """Transcript text added since the last call, or None; complete lines only until final."""
+            nonlocal offset, inode
+            try:
+                st = os.stat(transcript_path)
+            except FileNotFoundError:
+                return None
+            # The finished transcript replaces the streamed one (and a retry truncates it),
+            # so start over from the top of the new file
+            replace = (inode is not None and st.st_ino != inode) or st.st_size < offset
+            if replace:
+                offset = 0
+            inode = st.st_ino
+            if st.st_size <= offset and not replace:
+                return None
+            with open(transcript_path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+            if not final:
+                chunk = chunk[:chunk.rfind(b'\n') + 1]
+            offset += len(chunk)
+            if not chunk and not replace:
+                return None
+            return {'text': chunk.decode('utf-8', errors='replace'), 'replace': replace}
+
+        while True:
+            job = history_store.get_job(job_id) or {}
+            status = job.get('status')
+            progress = history_store.get_progress(job_id) or {}
+            snapshot = {
+                'status': status,
+                'percent': progress.get('percent', 0.0),
+                'processed': progress.get('processed'),
+                'duration': progress.get('duration'),
+                'eta_seconds': progress.get('eta_seconds')
+            }
+            if status == 'Pending':
+                estimate = queue_estimate(job_id)
+                if estimate:
+                    snapshot.update({'eta_seconds': estimate['eta_seconds'],
+                                     'start_seconds': estimate['start_seconds'],
+                                     'queue_position': estimate['position']})
+            if snapshot != last_progress:
+                yield sse('progress', snapshot)
+                last_progress = snapshot
+
+            if status in ('Complete', 'Failed'):
+                text = new_text(final=True)
+                if text:
+                    yield sse('text', text)
+                yield sse('done', {'status': status, 'error_message': job.get('error_message')})
+                return
+
+            text = new_text()
+            if text:
+                yield sse('text', text)
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            time.sleep(SSE_POLL_INTERVAL)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# -- NEW: Paginated History API --
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+@app.route('/api/history')
+@login_required
+def history_api():
+    args = request.args
+    # Only admins may look at other users' jobs
+    user = args.get('user') if session.get('role') == 'admin' else session['username']
+    try:
+        limit = min(int(args.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        cursor = json.loads(base64.urlsafe_b64decode(args['cursor'])) if args.get('cursor') else None
+        items, next_cursor = history_store.query_jobs(
+            user=user, status=args.get('status'), language=args.get('language'),
+            since=args.get('since'), until=args.get('until'), search=args.get('q'),
+            sort=args.get('sort', 'timestamp'), descending=args.get('order', 'desc') != 'asc',
+            cursor=cursor, limit=max(limit, 1)
+        )
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid query parameters'}), 400
+
+    if args.get('q'):
+        excerpts = search_index.snippets(args['q'], [item['job_id'] for item in items])
+        for item in items:
+            item['match'] = excerpts.get(item['job_id'])
+    return jsonify({
+        'items': items,
+        'next_cursor': base64.urlsafe_b64encode(json.dumps(next_cursor).encode()).decode() if next_cursor else None
+    })
+
+# -- NEW: Analytics --
+@app.route('/analytics')
+@login_required
+def analytics_page():
+    return render_template('analytics.html')
+
+@app.route('/api/analytics')
+@login_required
+def analytics_summary():
+    # Aggregates are maintained as jobs finish, so this never rescans the history.
+    # Only admins may see other users' (or everyone's) stats.
+    user = request.args.get('user') if session.get('role') == 'admin' else session['username']
+    return jsonify(analytics.summary(user))
+
+# -- NEW: Prometheus Metrics --
+@app.route('/metrics')
+def prometheus_metrics():
+    gauges = {'queue_jobs': job_queue.queue_stats()}
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# -- NEW: Log Viewer --
+LOG_TAIL_LINES = 200
+
+@app.route('/log')
+@login_required
+@admin_required
+def log_page():
+    return render_template('log.html', sources=log_store.sources(), current_path='/log')
+
+@app.route('/logs/<source>/events')
+@login_required
+@admin_required
+def log_events(source):
+    """
+    Stream a log over SSE: the last `lines` records (or everything from `since`),
+    then new records as they are written when `follow` is set.
+    """
+    try:
+        path = log_store.source_path(source)
+        lines = min(int(request.args.get('lines', LOG_TAIL_LINES)), 5000)
+        since = request.args.get('since')
+        since = datetime.strptime(history_store.normalize_timestamp(since), history_store.TIMESTAMP_FORMAT) \
+            if since else None
+    except FileNotFoundError:
+        return jsonify({'error': 'Log not found'}), 404
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    job_id = request.args.get('job_id') or None
+    level = request.args.get('level') or None
+    follow = request.args.get('follow', '1') != '0'
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def stream():
+        if since is not None:
+            records, offset = log_store.read_from(path, log_store.seek_time(path, since),
+                                                  job_id=job_id, level=level, limit=lines)
+        else:
+            records, offset = log_store.tail(path, lines, job_id=job_id, level=level)
+        for record in records:
+            yield sse('log', record)
+        if not follow:
+            yield sse('end', {'offset': offset})
+            return
+
+        inode = os.stat(path).st_ino
+        while True:
+            time.sleep(SSE_POLL_INTERVAL)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_ino != inode or st.st_size < offset:
+                # Rotated: carry on from the start of the new file
+                inode, offset = st.st_ino, 0
+            if st.st_size > offset:
+                records, offset = log_store.read_from(path, offset, job_id=job_id, level=level)
+                for record in records:
+                    yield sse('log', record)
+            else:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# -- NEW: Known Speakers --
+@app.route('/api/speakers')
+@login_required
+def list_speakers():
+    return jsonify({'speakers': speaker_index.list_speakers()})
+
+@app.route('/api/speakers/<int:speaker_id>', methods=['PUT'])
+@login_required
+def name_speaker(speaker_id):
+    """
+    Receives: { "name": "Jane Doe" }
+    Later transcripts label this speaker with the name; an empty name makes it anonymous again.
+    """
+    if not (request.is_json and isinstance(request.json, dict) and 'name' in request.json):
+        return jsonify({'success': False, 'message': 'Missing name'}), 400
+    name = (request.json['name'] or '').strip()
+    if not speaker_index.name_speaker(speaker_id, name):
+        return jsonify({'success': False, 'message': 'Speaker not found'}), 404
+    return jsonify({'success': True, 'message': 'Speaker updated'})
 
 # [ ... Rest of your app ... ]
 
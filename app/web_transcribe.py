@@ -1,15 +1,24 @@
 # web_transcribe.py
 import os
-import json
 import logging
 import time
 from datetime import datetime
-import filelock
-import torch
+import history_store
+import audio
 import uuid
 import traceback
-from faster_whisper import WhisperModel
-from pyannote.audio import Pipeline
+from concurrent.futures import ThreadPoolExecutor
+import speakers
+import long_audio
+import models
+import transcript_store
+import dedup_cache
+import analytics
+import metrics
+import alignment
+import speaker_index
+import preflight
+import shutil
 from dotenv import load_dotenv
 
 # Set up logging
@@ -25,35 +34,21 @@ load_dotenv()
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
 TRANSCRIPTS_FOLDER = os.getenv("TRANSCRIPTS_FOLDER", "transcripts")
 HISTORY_FILE = os.getenv("HISTORY_FILE", "uploads.json")
+# Minimum seconds between progress writes for a running job
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 2))
 
 if not UPLOAD_FOLDER or not TRANSCRIPTS_FOLDER or not HISTORY_FILE:
     logger.error("One or more required environment variables are missing. Please check UPLOAD_FOLDER, TRANSCRIPTS_FOLDER, and HISTORY_FILE.")
     raise EnvironmentError("Missing required environment variables.")
 
-    whisper_model = None
+if not os.getenv("HF_TOKEN"):
+    logger.error("Hugging Face token (HF_TOKEN) is not set in the environment variables.")
 
-# Load models with error handling
-try:
-    whisper_model = WhisperModel("large-v2", compute_type="float16" if torch.cuda.is_available() else "int8")
-    logger.info("Whisper model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load Whisper model: {str(e)}")
-    whisper_model = None
+# Models are loaded lazily through the models registry on first use
 
-hf_token = os.getenv("HF_TOKEN")
-if not hf_token:
-    logger.error("Hugging Face token (HF_TOKEN) is not set in the environment variables.")
-    diarization_pipeline = None
-else:
-    try:
-        diarization_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=hf_token)
-        logger.info("Diarization pipeline loaded successfully")
-    except Exception as e:
-        logger.error(f"Failed to load diarization pipeline: {str(e)}")
-        diarization_pipeline = None
 def update_job_status(job_id, status, error_message=None):
     """
-    Update the status of a transcription job in the history file.
+    Update the status of a transcription job in the history database.
     
     Args:
         job_id: The ID of the job to update.
@@ -61,29 +56,171 @@ def update_job_status(job_id, status, error_message=None):
         error_message: Optional error message if the job failed.
     """
     logger.info(f"Updating job status: job_id={job_id}, status={status}, error_message={error_message}")
-    if not os.path.exists(HISTORY_FILE):
-        data = []
-    else:
+    fields = {'status': status}
+    if error_message:
+        fields['error_message'] = error_message
+    try:
+        history_store.update_job(job_id, fields)
+    except Exception as e:
+        logger.error(f"Error updating job {job_id} in {history_store.HISTORY_DB}: {str(e)}")
+        return False
+    
+    return True
+
+def make_progress_reporter(job_id, duration, start_time):
+    """
+    Build a throttled callback that persists a job's progress and ETA.
+    
+    Args:
+        job_id: ID of the job being transcribed.
+        duration: Total seconds of audio.
+        start_time: time.time() when the job started.
+    
+    Returns:
+        callable: report(processed_seconds, force=False)
+    """
+    last_write = [0.0]
+    
+    def report(processed, force=False):
+        now = time.time()
+        if not force and now - last_write[0] < PROGRESS_INTERVAL:
+            return
+        last_write[0] = now
+        eta = None
+        if 0 < processed < duration:
+            eta = round((now - start_time) * (duration - processed) / processed, 1)
         try:
-            with open(HISTORY_FILE, 'r') as f:
-                data = json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON from {HISTORY_FILE}: {str(e)}")
-            return False
-        
-        for job in data:
-            if job.get('job_id') == job_id:
-                job['status'] = status
-                if error_message:
-                    job['error_message'] = error_message
-                break
-        
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+            history_store.set_progress(job_id, round(processed, 2), round(duration, 2), eta)
+        except Exception as e:
+            logger.warning(f"Could not record progress for {job_id}: {str(e)}")
+    
+    return report
+
+def reuse_cached_transcript(job_id, source_job_id, transcript_path):
+    """
+    Copy the finished transcript of an identical earlier job to this job.
     
+    Args:
+        job_id: ID of the job being short-circuited.
+        source_job_id: ID of the job whose result is reused.
+        transcript_path: Destination text transcript path for job_id.
+    
+    Returns:
+        bool: True if the transcript was copied.
+    """
+    source_path = os.path.join(TRANSCRIPTS_FOLDER, f"{source_job_id}.txt")
+    try:
+        segments = transcript_store.get_transcript(source_job_id)['segments']
+    except transcript_store.TranscriptNotFound:
+        return False
+    if not os.path.exists(source_path):
+        return False
+    shutil.copyfile(source_path, transcript_path)
+    transcript_store.write_transcript(job_id, segments)
     return True
 
-def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
+def run_diarization(diarization_pipeline, waveform, timings=None):
+    """
+    Run the diarization pipeline on a decoded waveform.
+    
+    Args:
+        diarization_pipeline: Loaded pyannote pipeline.
+        waveform: 16 kHz mono float32 samples from audio.load_audio.
+        timings: Optional per-job stage timings to add the diarization time to.
+    
+    Returns:
+        tuple: ((start, end, speaker) turns sorted by start time,
+            speaker label -> embedding, empty unless the speaker index is enabled)
+    """
+    with metrics.timed({} if timings is None else timings, 'diarization'):
+        if speaker_index.SPEAKER_INDEX_ENABLED:
+            diarization, embeddings = diarization_pipeline(audio.as_pyannote_input(waveform), return_embeddings=True)
+            # pyannote returns one embedding per label, in diarization.labels() order
+            embeddings = dict(zip(diarization.labels(), embeddings))
+        else:
+            diarization, embeddings = diarization_pipeline(audio.as_pyannote_input(waveform)), {}
+    return speakers.diarization_turns(diarization), embeddings
+
+def identify_speakers(job_id, turns, embeddings, timings=None):
+    """
+    Replace anonymous diarization labels with the names of recognized speakers.
+    
+    Recognition is best effort: a failure is logged and the turns keep their labels.
+    
+    Args:
+        job_id: Job the turns belong to.
+        turns: (start, end, speaker) turns from run_diarization.
+        embeddings: Speaker label -> embedding from run_diarization.
+        timings: Optional per-job stage timings to add the lookup time to.
+    
+    Returns:
+        tuple: (turns with known names substituted, label -> speaker_id)
+    """
+    if not embeddings:
+        return turns, {}
+    try:
+        with metrics.timed({} if timings is None else timings, 'speaker_identify'):
+            known = speaker_index.identify(job_id, embeddings)
+    except Exception as e:
+        logger.error(f"Speaker recognition failed for job {job_id}: {str(e)}")
+        return turns, {}
+    names = {label: match['name'] for label, match in known.items() if match['name']}
+    if names:
+        logger.info(f"Recognized speakers in job {job_id}: {names}")
+    turns = [(start, end, names.get(label, label)) for start, end, label in turns]
+    return turns, {label: match['speaker_id'] for label, match in known.items()}
+
+def record_stage_timings(job_id, timings, outcome, audio_seconds=None):
+    """
+    Store a job's stage timings in its record and in the shared metrics.
+    
+    Metrics are best effort: a failure here is logged and never fails the job.
+    
+    Args:
+        job_id: Job the timings belong to.
+        timings: Stage name -> seconds, collected with metrics.timed.
+        outcome: 'Complete' or 'Failed'.
+        audio_seconds: Length of the processed audio, if known.
+    """
+    try:
+        history_store.update_job(job_id, {
+            "stage_timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        })
+        metrics.record_job(timings, outcome, audio_seconds)
+    except Exception as e:
+        logger.error(f"Could not record stage timings for job {job_id}: {str(e)}")
+
+def _transcript_exists(job_id):
+    return os.path.exists(os.path.join(TRANSCRIPTS_FOLDER, f"{job_id}.txt"))
+
+
+def dedup_key(job_id, language, model_size=None, compute_type=None):
+    """
+    Dedup cache key of a job: (audio_hash, model, language, diarization).
+
+    Returns:
+        tuple: The key, or None if the job has no audio hash.
+    """
+    audio_hash = (history_store.get_job(job_id) or {}).get('audio_hash')
+    if not audio_hash:
+        return None
+    model_key = f"{model_size or models.DEFAULT_WHISPER_MODEL}/{models.resolve_compute_type(compute_type)}"
+    if alignment.enabled(language):
+        model_key += "/aligned"
+    return (audio_hash, model_key, language, bool(os.getenv("HF_TOKEN")))
+
+
+def has_cached_transcript(job_id, language, model_size=None, compute_type=None):
+    """Whether transcribe_file would reuse an earlier transcript instead of running Whisper."""
+    cache_key = dedup_key(job_id, language, model_size, compute_type)
+    if not cache_key:
+        return False
+    source_job_id = dedup_cache.peek(*cache_key)
+    return bool(source_job_id) and source_job_id != job_id and _transcript_exists(source_job_id)
+
+
+def transcribe_file(job_id=None, filename=None, language="en", user="unknown",
+                    model_size=None, compute_type=None, queue_wait=None, batched=None):
     """
     Transcribe an audio file with diarization.
     
@@ -92,6 +229,11 @@ def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
         filename: Name of the file to transcribe
         language: Language code for transcription
         user: Username who initiated the transcription
+        model_size: Whisper model size (defaults to WHISPER_MODEL)
+        compute_type: Whisper compute type, e.g. int8, int8_float16, float32
+        queue_wait: Seconds the job waited in the queue, recorded with the stage timings
+        batched: Whisper output already produced by a batched call (see batching.py),
+            as {'segments': [...], 'seconds': share of the call}; skips the Whisper step
     
     Returns:
         tuple: (job_id, transcript_path)
@@ -116,6 +258,7 @@ def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
     
     # Record the job start time
     start_time = time.time()
+    timings = {} if queue_wait is None else {'queue_wait': queue_wait}
     
     try:
         logger.info(f"Starting transcription of {filename} (job_id: {job_id})")
@@ -123,64 +266,148 @@ def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
         # Update status to "Processing"
         update_job_status(job_id, "Processing")
         
-        # Check if models loaded correctly
-        if not whisper_model:
-            raise Exception("Whisper model failed to load")
+        # Uploads marked "auto" get their language detected here, on one short window
+        if language == preflight.AUTO_LANGUAGE:
+            with metrics.timed(timings, 'language_detection'):
+                language = preflight.resolve_language(job_id, filepath, language)
+        # Still "auto" if detection failed; Whisper detects it instead
+        whisper_language = None if language == preflight.AUTO_LANGUAGE else language
         
-        has_diarization = False
-        if diarization_pipeline:
+        # Short-circuit if the exact same audio was already transcribed with these settings
+        compute_type = models.resolve_compute_type(compute_type)
+        cache_key = dedup_key(job_id, language, model_size, compute_type)
+        if cache_key:
+            source_job_id = dedup_cache.lookup(*cache_key, is_valid=_transcript_exists)
+            if source_job_id and source_job_id != job_id and reuse_cached_transcript(job_id, source_job_id, transcript_path):
+                source_job = history_store.get_job(source_job_id) or {}
+                history_store.update_job(job_id, {
+                    "status": "Complete",
+                    "diarization": source_job.get("diarization", False),
+                    "transcription_duration": round(time.time() - start_time, 2),
+                    "audio_duration": source_job.get("audio_duration"),
+                    "deduplicated_from": source_job_id
+                })
+                # Nothing was transcribed, so the job counts without audio or processing time
+                analytics.record_completion(job_id, "Complete")
+                timings['total'] = time.time() - start_time
+                record_stage_timings(job_id, timings, "Complete", source_job.get("audio_duration"))
+                metrics.increment('dedup_hits_total')
+                logger.info(f"Reused transcript of {source_job_id} for {filename} (job_id: {job_id})")
+                return job_id, transcript_path
+        
+        # Load (or reuse) the models for this job
+        with metrics.timed(timings, 'model_load'):
             try:
-                logger.info(f"Running diarization on {filename}")
-                diarization = diarization_pipeline(filepath)
-                has_diarization = True
-                logger.info(f"Diarization completed successfully: {diarization}")
+                whisper_model = models.get_whisper_model(model_size, compute_type)
             except Exception as e:
-                logger.warning(f"Diarization failed, continuing with transcription only: {str(e)}")
-        else:
-            logger.warning("Diarization pipeline not available, skipping diarization")
+                raise Exception(f"Whisper model failed to load: {str(e)}")
+            try:
+                diarization_pipeline = models.get_diarization_pipeline()
+            except Exception as e:
+                logger.error(f"Failed to load diarization pipeline: {str(e)}")
+                diarization_pipeline = None
+        
+        # Decode once; diarization and Whisper share the same 16 kHz buffer
+        with metrics.timed(timings, 'decode'):
+            waveform = audio.load_audio(filepath)
+        report_progress = make_progress_reporter(job_id, audio.duration_seconds(waveform), start_time)
+        report_progress(0.0, force=True)
+        
+        # Diarization runs on a background thread while Whisper transcribes;
+        # both release the GIL inside their native kernels.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            diarization_future = None
+            if diarization_pipeline:
+                logger.info(f"Running diarization on {filename}")
+                diarization_future = executor.submit(run_diarization, diarization_pipeline, waveform, timings)
+            else:
+                logger.warning("Diarization pipeline not available, skipping diarization")
+            
+            # Whisper transcription
+            with metrics.timed(timings, 'transcription'):
+                if batched is not None:
+                    transcript_segments = [dict(segment) for segment in batched['segments']]
+                elif long_audio.is_long(waveform):
+                    logger.info(f"Running chunked Whisper transcription on {filename}")
+                    transcript_segments, detected = long_audio.transcribe_chunked(
+                        filepath, waveform, whisper_language,
+                        model_size=model_size or models.DEFAULT_WHISPER_MODEL, compute_type=compute_type,
+                        on_progress=report_progress
+                    )
+                    if whisper_language is None and detected:
+                        language = detected
+                else:
+                    logger.info(f"Running Whisper transcription on {filename}")
+                    segments, info = whisper_model.transcribe(waveform, language=whisper_language, beam_size=5)
+                    if whisper_language is None:
+                        language = info.language
+                
+                    # Stream segments to the transcript file as Whisper yields them so
+                    # partial text is visible while the job is still running
+                    transcript_segments = []
+                    with open(transcript_path, "w", encoding="utf-8") as partial:
+                        for segment in segments:
+                            transcript_segments.append({
+                                "start": segment.start,
+                                "end": segment.end,
+                                "text": segment.text.strip()
+                            })
+                            partial.write(f"[{segment.start:.2f} - {segment.end:.2f}] {segment.text.strip()}\n")
+                            partial.flush()
+                            report_progress(segment.end)
+            
+            if batched is not None:
+                timings['transcription'] = batched['seconds']
+            
+            # Word-level timestamps (optional); overlaps with diarization still running
+            alignment_cost = alignment.align(transcript_segments, waveform, language, timings)
+            
+            turns, speaker_ids = [], {}
+            if diarization_future:
+                try:
+                    turns, embeddings = diarization_future.result()
+                    logger.info(f"Diarization completed successfully: {len(turns)} speaker turns")
+                except Exception as e:
+                    logger.warning(f"Diarization failed, continuing with transcription only: {str(e)}")
+                else:
+                    turns, speaker_ids = identify_speakers(job_id, turns, embeddings, timings)
         
-        # Whisper transcription
-        logger.info(f"Running Whisper transcription on {filename}")
-        segments, _ = whisper_model.transcribe(filepath, language=language, beam_size=5)
+        has_diarization = bool(turns)
+        with metrics.timed(timings, 'speaker_merge'):
+            speakers.assign_speakers(transcript_segments, turns)
         
-        transcript_lines = []
-        for segment in segments:
-            text = segment.text.strip()
-            start = segment.start
-            end = segment.end
-            transcript_lines.append(f"[{start:.2f} - {end:.2f}] {text}")
+        with metrics.timed(timings, 'write_output'):
+            transcript_lines = []
+            for segment in transcript_segments:
+                speaker = f"{segment['speaker']}: " if segment.get('speaker') else ""
+                transcript_lines.append(f"[{segment['start']:.2f} - {segment['end']:.2f}] {speaker}{segment['text']}")
         
-        transcript_text = "\n".join(transcript_lines)
+            transcript_text = "\n".join(transcript_lines)
         
-        # Write transcript to file
-        with open(transcript_path, "w", encoding="utf-8") as f:
-            f.write(transcript_text)
+            # Replace the streamed transcript with the speaker-labelled one
+            tmp_path = f"{transcript_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(transcript_text)
+            os.replace(tmp_path, transcript_path)
+            transcript_store.write_transcript(job_id, transcript_segments)
+        report_progress(audio.duration_seconds(waveform), force=True)
         
         # Calculate duration
         transcription_duration = time.time() - start_time
+        audio_duration = audio.duration_seconds(waveform)
         
-        # Update job status
-        lock = filelock.FileLock(f"{HISTORY_FILE}.lock")
-        with lock:
-            if os.path.exists(HISTORY_FILE):
-                with open(HISTORY_FILE, 'r') as f:
-                    data = json.load(f)
-            else:
-                data = []
-            
+        with metrics.timed(timings, 'history_update'):
             # Update existing job or create new one
-            job_updated = False
-            for job in data:
-                if job.get('job_id') == job_id:
-                    job['status'] = "Complete"
-                    job['diarization'] = has_diarization
-                    job['transcription_duration'] = round(transcription_duration, 2)
-                    job_updated = True
-                    break
-            
-            if not job_updated:
-                # Create new job record
-                record = {
+            if not history_store.update_job(job_id, {
+                "status": "Complete",
+                "language": language,
+                "diarization": has_diarization,
+                "transcription_duration": round(transcription_duration, 2),
+                "audio_duration": round(audio_duration, 2),
+                "alignment_cost_per_minute": None if alignment_cost is None else round(alignment_cost, 3),
+                "speaker_ids": speaker_ids
+            }):
+                history_store.insert_job({
                     "job_id": job_id,
                     "filename": filename,
                     "timestamp": timestamp,
@@ -189,12 +416,20 @@ def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
                     "file_size": file_size,
                     "user": user,
                     "diarization": has_diarization,
-                    "transcription_duration": round(transcription_duration, 2)
-                }
-                data.insert(0, record)
-            
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+                    "transcription_duration": round(transcription_duration, 2),
+                    "audio_duration": round(audio_duration, 2)
+                })
+                analytics.record_upload(history_store.get_job(job_id))
+            analytics.record_completion(job_id, "Complete", audio_duration, transcription_duration)
+        
+        # Keyed by the language actually used, which Whisper may have detected
+        cache_key = dedup_key(job_id, language, model_size, compute_type)
+        if cache_key:
+            dedup_cache.record(*cache_key, job_id,
+                               os.path.getsize(transcript_path))
+        
+        timings['total'] = time.time() - start_time
+        record_stage_timings(job_id, timings, "Complete", audio_duration)
         
         logger.info(f"Transcription completed for {filename} (job_id: {job_id})")
         return job_id, transcript_path
@@ -204,4 +439,10 @@ def transcribe_file(job_id=None, filename=None, language="en", user="unknown"):
         logger.error(f"Error transcribing {filename}: {error_msg}")
         logger.error(traceback.format_exc())
         update_job_status(job_id, "Failed", error_msg)
+        try:
+            analytics.record_completion(job_id, "Failed")
+        except Exception as analytics_error:
+            logger.error(f"Could not record failure in analytics: {analytics_error}")
+        timings['total'] = time.time() - start_time
+        record_stage_timings(job_id, timings, "Failed")
         return job_id, None
@@ -0,0 +1,235 @@
+# app/worker.py
+
+import os
+import time
+import uuid
+import signal
+import logging
+import threading
+import multiprocessing
+
+import job_queue
+import utils
+import retention
+import batching
+import ingest
+import resumable
+import email_manager
+import log_store
+
+# Number of long-lived worker processes. Each one loads the models once.
+# Defaults to one worker per CPU_THREADS_PER_WORKER cores on CPU, or one per GPU.
+CPU_THREADS_PER_WORKER = int(os.getenv("CPU_THREADS_PER_WORKER", 4))
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))
+WORKER_DEVICE = os.getenv("WORKER_DEVICE", "auto")
+GPU_COUNT = int(os.getenv("GPU_COUNT", 0))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 4 * 3600))
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 2))
+# Seconds between log lines with each worker's model registry stats (0 disables)
+MODEL_STATS_INTERVAL = float(os.getenv("MODEL_STATS_INTERVAL", 600))
+
+# Set up logging
+logging.basicConfig(
+    filename='logs/worker.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('worker')
+
+
+def default_concurrency():
+    """
+    Work out how many worker processes fit the machine.
+
+    Returns:
+        int: Number of worker processes to start.
+    """
+    if WORKER_PROCESSES > 0:
+        return WORKER_PROCESSES
+    if WORKER_DEVICE == "cuda" or (WORKER_DEVICE == "auto" and GPU_COUNT > 0):
+        return max(1, GPU_COUNT)
+    return max(1, (os.cpu_count() or 1) // CPU_THREADS_PER_WORKER)
+
+
+def worker_main(worker_id, slot):
+    """
+    Run a worker loop: load the models once, then claim and process jobs until stopped.
+
+    Args:
+        worker_id (str): Identifier recorded on claimed jobs.
+        slot (int): Index of this worker, used to pin it to a GPU.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_store.configure(f"worker-{slot}")
+    os.environ.setdefault("WHISPER_CPU_THREADS", str(CPU_THREADS_PER_WORKER))
+    if GPU_COUNT > 0:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(slot % GPU_COUNT)
+
+    import models
+
+    # Warm the default model so the first job doesn't pay for loading it;
+    # jobs asking for other sizes are loaded on demand and kept in the registry.
+    try:
+        models.get_whisper_model()
+    except Exception as e:
+        logger.error(f"Worker {worker_id} could not preload the Whisper model: {str(e)}")
+
+    logger.info(f"Worker {worker_id} ready")
+    stats_logged = time.monotonic()
+    while True:
+        if MODEL_STATS_INTERVAL and time.monotonic() - stats_logged >= MODEL_STATS_INTERVAL:
+            stats_logged = time.monotonic()
+            logger.info(f"Worker {worker_id} model stats: {models.stats()}")
+        try:
+            job = job_queue.claim(worker_id, JOB_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not claim a job: {str(e)}")
+            time.sleep(POLL_INTERVAL)
+            continue
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        logger.info(f"Worker {worker_id} picked job {job['job_id']} "
+                    f"(attempt {job['attempts']}, waited {job['wait_seconds']:.1f}s)")
+        try:
+            # Store the upload as 16 kHz mono before anything decodes it
+            job = ingest.prepare(job)
+            # Short jobs waiting behind this one share a single Whisper call
+            if batching.BATCH_SIZE > 1:
+                results = batching.process(worker_id, job, JOB_TIMEOUT, _transcribe_job)
+            else:
+                results = [(job, _transcribe_job(job))]
+        except Exception as e:
+            # Don't take the worker (and its loaded models) down over one bad upload;
+            # fail whatever this worker claimed in this round, including batch members
+            logger.exception(f"Worker {worker_id} could not run job {job['job_id']}: {str(e)}")
+            for job_id, retry in job_queue.release_worker(worker_id, str(e)):
+                _report_release(job_id, retry, str(e))
+            continue
+        for claimed, transcript_path in results:
+            if transcript_path:
+                job_queue.complete(claimed['job_id'])
+            else:
+                failed_job = utils.get_job_by_id(claimed['job_id']) or {}
+                _record_failure(claimed['job_id'], failed_job.get('error_message', "Transcription failed"))
+
+
+def _transcribe_job(job, batched=None):
+    """Run the transcription pipeline for a claimed job; returns the transcript path or None."""
+    import web_transcribe
+
+    try:
+        record = utils.get_job_by_id(job['job_id']) or {}
+        _, transcript_path = web_transcribe.transcribe_file(
+            job_id=job['job_id'],
+            filename=job['filename'],
+            language=job['language'],
+            user=job['user'],
+            model_size=record.get('model_size'),
+            compute_type=record.get('compute_type'),
+            queue_wait=job['wait_seconds'],
+            batched=batched
+        )
+    except Exception as e:
+        logger.exception(f"Job {job['job_id']} raised: {str(e)}")
+        utils.update_job_status(job['job_id'], "Failed", str(e))
+        return None
+    return transcript_path
+
+
+def _record_failure(job_id, error_message):
+    """Report a failed attempt to the queue and reflect a retry in the history."""
+    if job_queue.fail(job_id, error_message):
+        utils.update_job_status(job_id, "Pending", f"Retrying after error: {error_message}")
+
+
+def _report_release(job_id, retry, error_message):
+    """Reflect a job released from the queue in the history."""
+    if retry:
+        utils.update_job_status(job_id, "Pending", f"Retrying after error: {error_message}")
+    else:
+        utils.update_job_status(job_id, "Failed", error_message)
+
+
+def run_pool(concurrency=None):
+    """
+    Start the worker pool and supervise it.
+
+    Dead workers are restarted, and workers holding a job past JOB_TIMEOUT
+    are terminated so the job can be retried or failed. Resumable uploads
+    abandoned for UPLOAD_SESSION_TTL are cleaned up every
+    UPLOAD_EXPIRY_INTERVAL seconds.
+
+    Args:
+        concurrency (int): Number of worker processes (defaults to default_concurrency()).
+    """
+    log_store.configure("worker")
+    concurrency = concurrency or default_concurrency()
+    ctx = multiprocessing.get_context("spawn")
+    workers = {}
+
+    def start(slot):
+        worker_id = f"{os.uname().nodename}-{slot}-{uuid.uuid4().hex[:8]}"
+        # Not daemonic: workers start their own process pools for long files
+        process = ctx.Process(target=worker_main, args=(worker_id, slot))
+        process.start()
+        workers[slot] = (worker_id, process)
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    for slot in range(concurrency):
+        start(slot)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Retention runs beside the supervisor; it only holds the database for one batch at a time
+    background_stop = threading.Event()
+    if retention.enabled():
+        threading.Thread(target=retention.run_forever, kwargs={'stop_event': background_stop},
+                         name='retention', daemon=True).start()
+    if email_manager.DAILY_SUMMARY_HOUR:
+        threading.Thread(target=email_manager.run_daily_summary_forever, kwargs={'stop_event': background_stop},
+                         name='daily-summary', daemon=True).start()
+
+    uploads_expired_at = 0.0
+    while not stopping:
+        if time.monotonic() - uploads_expired_at >= resumable.UPLOAD_EXPIRY_INTERVAL:
+            uploads_expired_at = time.monotonic()
+            try:
+                resumable.expire_stale_uploads()
+            except Exception as e:
+                logger.error(f"Could not expire abandoned uploads: {str(e)}")
+        expired = dict(job_queue.expired_leases())
+        for slot, (worker_id, process) in list(workers.items()):
+            if worker_id in expired.values():
+                logger.warning(f"Worker {worker_id} exceeded the job timeout, terminating")
+                process.terminate()
+                process.join(10)
+            if not process.is_alive():
+                for job_id, retry in job_queue.release_worker(worker_id, "Job timed out or worker crashed"):
+                    _report_release(job_id, retry, "Job timed out or worker crashed")
+                start(slot)
+        # Expired jobs whose worker is gone, e.g. from before a restart of the pool
+        live = [worker_id for worker_id, _ in workers.values()]
+        for job_id, retry in job_queue.release_orphaned(live, "Job timed out or worker crashed"):
+            _report_release(job_id, retry, "Job timed out or worker crashed")
+        time.sleep(POLL_INTERVAL)
+
+    background_stop.set()
+    for worker_id, process in workers.values():
+        process.terminate()
+    for worker_id, process in workers.values():
+        process.join(10)
+    logger.info("Worker pool stopped")
+
+
+if __name__ == '__main__':
+    utils.ensure_directories()
+    run_pool()
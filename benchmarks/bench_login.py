@@ -0,0 +1,109 @@
+# benchmarks/bench_login.py
+"""
+Measure login throughput of app/password-utils.py against a large users.json.
+
+Usage (from the repository root):
+    python3 benchmarks/bench_login.py --users 10000 --logins 200
+
+Compares the previous behaviour (re-parse users.json and scan it on every
+login, single SHA-256 round) with the indexed user store and scrypt. Lookup
+cost and hashing cost are reported separately, since scrypt is slow on
+purpose.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import importlib.util
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def load_password_utils():
+    spec = importlib.util.spec_from_file_location(
+        "password_utils", os.path.join(APP_DIR, "password-utils.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_users(pu, count, password):
+    """Users share one salt and password so building 10k scrypt hashes stays cheap."""
+    salt = pu.generate_salt()
+    scrypt_hash, _ = pu.hash_password(password, salt)
+    return [
+        {
+            "username": f"user{i:06d}",
+            "email": f"user{i:06d}@example.com",
+            "password_hash": scrypt_hash,
+            "salt": salt,
+            "role": "user",
+            "active": True
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_validate(users_file, username, password):
+    """The pre-index login path: parse the file, scan it, one SHA-256 round."""
+    with open(users_file) as f:
+        users = json.load(f)
+    for user in users:
+        if user.get("username") == username:
+            digest = hashlib.sha256((password + user["salt"]).encode()).hexdigest()
+            return digest == user.get("legacy_hash")
+    return False
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--output", default="benchmarks/results/login.json")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    pu = load_password_utils()
+    password = "correct horse battery staple"
+    workdir = tempfile.mkdtemp(prefix="audium-login-bench-")
+    os.chdir(workdir)
+
+    users = build_users(pu, args.users, password)
+    for user in users:
+        user["legacy_hash"] = hashlib.sha256((password + user["salt"]).encode()).hexdigest()
+    with open(pu.USERS_FILE, "w") as f:
+        json.dump(users, f)
+
+    names = [f"user{random.randrange(args.users):06d}" for _ in range(args.logins)]
+    picks = iter(names * 4)
+
+    results = {"users": args.users, "logins": args.logins,
+               "scrypt": {"n": pu.SCRYPT_N, "r": pu.SCRYPT_R, "p": pu.SCRYPT_P}}
+    results["legacy_logins_per_sec"] = timed(lambda: legacy_validate(pu.USERS_FILE, next(picks), password), args.logins)
+    pu.get_user_by_username(names[0])  # build the index once, as a running server would have
+    results["indexed_lookups_per_sec"] = timed(lambda: pu.get_user_by_username(next(picks)), args.logins)
+    results["indexed_scrypt_logins_per_sec"] = timed(lambda: pu.validate_user(next(picks), password), args.logins)
+    results["scrypt_hashes_per_sec"] = timed(lambda: pu.hash_password(password, "salt"), min(args.logins, 50))
+
+    for key, value in results.items():
+        print(f"{key}: {value if isinstance(value, (int, dict)) else f'{value:,.1f}'}")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
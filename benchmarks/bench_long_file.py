@@ -0,0 +1,102 @@
+# benchmarks/bench_long_file.py
+"""
+Compare single-stream Whisper transcription with the VAD-chunked parallel path.
+
+Usage (from the repository root):
+    python3 benchmarks/bench_long_file.py --audio interview.mp3 --minutes 180 --workers 8
+
+The input recording is tiled up to --minutes so a short sample can stand in
+for a multi-hour interview. Results are printed and written as JSON.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+os.makedirs("logs", exist_ok=True)
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+import audio
+import long_audio
+
+
+def tile(waveform, minutes):
+    """Repeat a waveform until it is at least the given number of minutes long."""
+    target = int(minutes * 60 * audio.SAMPLE_RATE)
+    if not minutes or waveform.shape[0] >= target:
+        return np.asarray(waveform)
+    repeats = -(-target // waveform.shape[0])
+    return np.tile(waveform, repeats)[:target]
+
+
+def run_single(waveform, model_size, compute_type, language):
+    model = WhisperModel(model_size, compute_type=compute_type, cpu_threads=os.cpu_count() or 1)
+    started = time.perf_counter()
+    segments, _ = model.transcribe(waveform, language=language, beam_size=5)
+    count = sum(1 for _ in segments)
+    return time.perf_counter() - started, count
+
+
+def run_chunked(buffer_source, waveform, model_size, compute_type, language, workers):
+    pool = long_audio.get_pool(model_size, "auto", compute_type, workers)
+    # Warm the pool so model loading is not counted against the chunked path
+    list(pool.map(abs, range(workers)))
+    started = time.perf_counter()
+    segments, _ = long_audio.transcribe_chunked(
+        buffer_source, waveform, language,
+        model_size=model_size, compute_type=compute_type, workers=workers
+    )
+    return time.perf_counter() - started, len(segments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", required=True, help="Speech recording to benchmark with")
+    parser.add_argument("--minutes", type=float, default=0, help="Tile the recording to this length")
+    parser.add_argument("--model", default="tiny", help="Whisper model size")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--skip-single", action="store_true", help="Only run the chunked path")
+    parser.add_argument("--output", default="benchmarks/results/long_file.json")
+    args = parser.parse_args()
+
+    waveform = tile(audio.load_audio(args.audio), args.minutes)
+    duration = audio.duration_seconds(waveform)
+
+    # The chunked path shares audio with the pool through the decoded-buffer cache
+    buffer_source = f"bench-{os.getpid()}.wav"
+    os.makedirs(audio.AUDIO_CACHE_FOLDER, exist_ok=True)
+    waveform.astype(np.float32).tofile(audio.cache_path(buffer_source))
+
+    results = {"audio_seconds": duration, "model": args.model, "compute_type": args.compute_type,
+               "workers": args.workers, "cpu_count": os.cpu_count()}
+    try:
+        if not args.skip_single:
+            elapsed, count = run_single(waveform, args.model, args.compute_type, args.language)
+            results["single"] = {"seconds": elapsed, "segments": count, "rtf": elapsed / duration}
+            print(f"single-stream: {elapsed:.1f}s (RTF {elapsed / duration:.3f}, {count} segments)")
+
+        elapsed, count = run_chunked(buffer_source, waveform, args.model, args.compute_type,
+                                     args.language, args.workers)
+        results["chunked"] = {"seconds": elapsed, "segments": count, "rtf": elapsed / duration}
+        print(f"chunked x{args.workers}: {elapsed:.1f}s (RTF {elapsed / duration:.3f}, {count} segments)")
+
+        if "single" in results:
+            results["speedup"] = results["single"]["seconds"] / elapsed
+            print(f"speedup: {results['speedup']:.2f}x")
+    finally:
+        audio.evict(buffer_source)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark of the transcription pipeline and the job history.
+
+Usage (from the repository root):
+    python3 benchmarks/bench_pipeline.py                        # fake models, fast
+    python3 benchmarks/bench_pipeline.py --backend real --model tiny
+    python3 benchmarks/bench_pipeline.py --save-baseline        # record a baseline
+    python3 benchmarks/bench_pipeline.py --compare              # fail on regressions
+
+Synthetic speech-like fixtures (shaped noise gated into word- and
+pause-length bursts) are generated offline with a fixed seed, so every run
+sees the same audio. Each fixture is pushed through utils.register_upload and
+web_transcribe.transcribe_file. With --backend fake the Whisper model and the
+diarization pipeline are replaced by stand-ins, which isolates the cost of
+decoding, speaker assignment, output writing and bookkeeping; with --backend
+real the models registry loads the requested model as in production.
+
+Reported: real-time factor per fixture, peak RSS, jobs/sec for short jobs
+and ops/sec for the history functions in utils. Results are written as JSON;
+--compare checks them against the baseline and exits non-zero on regressions.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import resource
+import tempfile
+from collections import namedtuple
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+FakeSegment = namedtuple("FakeSegment", "start end text")
+FakeInfo = namedtuple("FakeInfo", "language duration")
+FakeTurn = namedtuple("FakeTurn", "start end")
+
+
+def speech_like(seconds, seed=0):
+    """
+    Build a deterministic speech-like signal.
+
+    White noise is shaped to a voice-band spectrum (roughly 1/f between
+    100 Hz and 4 kHz), modulated at a syllable rate and gated into
+    word-length bursts separated by pauses, so VAD and chunking see
+    realistic speech/silence structure.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freqs = np.fft.rfftfreq(n, 1 / SAMPLE_RATE)
+    band = (freqs >= 100) & (freqs <= 4000)
+    spectrum[~band] = 0
+    spectrum[band] /= np.sqrt(freqs[band])
+    signal = np.fft.irfft(spectrum, n)
+    signal /= np.abs(signal).max() or 1.0
+
+    t = np.arange(n) / SAMPLE_RATE
+    syllables = 0.6 + 0.4 * np.sin(2 * np.pi * 4.0 * t + rng.uniform(0, 2 * np.pi))
+    gate = np.zeros(n, dtype=np.float32)
+    position = 0
+    while position < n:
+        word = int(rng.uniform(0.2, 0.6) * SAMPLE_RATE) * int(rng.integers(1, 6))
+        pause = int(rng.uniform(0.15, 1.2) * SAMPLE_RATE)
+        gate[position:position + word] = 1.0
+        position += word + pause
+    return (0.3 * signal * syllables * gate).astype(np.float32)
+
+
+def write_wav(path, samples):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+class FakeWhisperModel:
+    """Yields one segment per 5 s of audio, optionally sleeping to emulate a given RTF."""
+
+    def __init__(self, rtf=0.0):
+        self.rtf = rtf
+
+    def transcribe(self, audio, language=None, beam_size=5, **kwargs):
+        duration = len(audio) / SAMPLE_RATE
+
+        def segments():
+            for start in np.arange(0.0, duration, 5.0):
+                end = min(start + 5.0, duration)
+                if self.rtf:
+                    time.sleep((end - start) * self.rtf)
+                yield FakeSegment(float(start), float(end), " synthetic benchmark speech")
+
+        return segments(), FakeInfo(language, duration)
+
+
+class FakeAnnotation:
+    def __init__(self, turns):
+        self.turns = turns
+
+    def itertracks(self, yield_label=False):
+        for start, end, speaker in self.turns:
+            yield FakeTurn(start, end), None, speaker
+
+    def labels(self):
+        return sorted({speaker for _, _, speaker in self.turns})
+
+
+class FakeDiarizationPipeline:
+    """Alternates two speakers every 7 s; both have fixed embeddings, so they recur across jobs."""
+
+    EMBEDDINGS = np.random.default_rng(0).standard_normal((2, 256)).astype(np.float32)
+
+    def __call__(self, audio, return_embeddings=False):
+        duration = len(audio) / SAMPLE_RATE
+        annotation = FakeAnnotation([(float(s), float(min(s + 7.0, duration)), f"SPEAKER_{i % 2:02d}")
+                                     for i, s in enumerate(np.arange(0.0, duration, 7.0))])
+        if return_embeddings:
+            return annotation, self.EMBEDDINGS[:len(annotation.labels())]
+        return annotation
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB (Linux reports KB)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(own / 1024, 1), round(children / 1024, 1)
+
+
+def rate(fn, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return iterations / (time.perf_counter() - started)
+
+
+def run_job(utils, web_transcribe, source, name, args):
+    """Register and transcribe one upload; returns wall-clock seconds."""
+    secure_filename = utils.make_secure_filename(name)
+    target = os.path.join(utils.UPLOAD_FOLDER, secure_filename)
+    shutil.copyfile(source, target)
+    job_id = utils.register_upload(name, secure_filename, "bench", args.language, os.path.getsize(target),
+                                   model_size=args.model, compute_type=args.compute_type)
+    started = time.perf_counter()
+    _, transcript_path = web_transcribe.transcribe_file(
+        job_id=job_id, filename=secure_filename, language=args.language, user="bench",
+        model_size=args.model, compute_type=args.compute_type
+    )
+    elapsed = time.perf_counter() - started
+    if not transcript_path:
+        job = utils.get_job_by_id(job_id) or {}
+        raise RuntimeError(f"Benchmark job {name} failed: {job.get('error_message')}")
+    return elapsed
+
+
+def bench_pipeline(args, fixtures):
+    import utils
+    import web_transcribe
+    import models
+    import audio
+
+    if args.backend == "fake":
+        whisper = FakeWhisperModel(args.fake_rtf)
+        diarization = FakeDiarizationPipeline()
+        models.get_whisper_model = lambda *a, **k: whisper
+        models.get_diarization_pipeline = lambda *a, **k: diarization
+        # The fake pipeline takes the raw buffer; skip the torch wrapper
+        audio.as_pyannote_input = lambda waveform: waveform
+
+    utils.ensure_directories()
+    os.makedirs(web_transcribe.TRANSCRIPTS_FOLDER, exist_ok=True)
+
+    results = {"fixtures": {}}
+    for seconds, path in fixtures:
+        elapsed = run_job(utils, web_transcribe, path, f"fixture-{seconds}s.wav", args)
+        rss, children_rss = peak_rss_mb()
+        results["fixtures"][f"{seconds}s"] = {
+            "audio_seconds": seconds,
+            "wall_seconds": round(elapsed, 3),
+            "rtf": round(elapsed / seconds, 4),
+            "peak_rss_mb": rss,
+            "peak_children_rss_mb": children_rss
+        }
+        print(f"{seconds:>6}s fixture: {elapsed:.2f}s wall, RTF {elapsed / seconds:.4f}, peak RSS {rss} MB")
+
+    # Short jobs back to back; every job is a fresh upload so decoding is included
+    short_seconds, short_path = fixtures[0]
+    started = time.perf_counter()
+    for i in range(args.jobs):
+        run_job(utils, web_transcribe, short_path, f"short-{i}.wav", args)
+    results["short_jobs_per_sec"] = round(args.jobs / (time.perf_counter() - started), 3)
+    print(f"{args.jobs} x {short_seconds}s jobs: {results['short_jobs_per_sec']} jobs/sec")
+    return results
+
+
+def bench_history(iterations):
+    """Throughput of the job-history functions in utils."""
+    import utils
+
+    job_ids = []
+
+    def register(i):
+        job_ids.append(utils.register_upload(f"history-{i}.wav", f"history-{i}.wav", f"user{i % 20}", "en", 1024))
+
+    results = {
+        "register_upload_per_sec": rate(register, iterations),
+        "update_job_status_per_sec": rate(lambda i: utils.update_job_status(job_ids[i], "Complete"), iterations),
+        "get_job_by_id_per_sec": rate(lambda i: utils.get_job_by_id(job_ids[i]), iterations),
+        "get_upload_history_per_sec": rate(lambda i: utils.get_upload_history(), max(1, iterations // 100)),
+    }
+    results = {key: round(value, 1) for key, value in results.items()}
+    for key, value in results.items():
+        print(f"{key}: {value:,.1f}")
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """
+    List metrics that regressed by more than tolerance (a fraction) against the baseline.
+
+    Rates (*_per_sec) regress when they drop; RTF and memory regress when they grow.
+    """
+    regressions = []
+    current = flatten(results)
+    for name, reference in flatten(baseline).items():
+        value = current.get(name)
+        if value is None or not reference:
+            continue
+        if name.endswith("_per_sec"):
+            change = (reference - value) / reference
+        elif name.endswith(".rtf") or name.endswith("_mb"):
+            change = (value - reference) / reference
+        else:
+            continue
+        if change > tolerance:
+            regressions.append(f"{name}: {reference} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("fake", "real"), default="fake")
+    parser.add_argument("--model", default="tiny", help="Whisper model size for --backend real")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--fixtures", default="10,60,300", help="Fixture lengths in seconds")
+    parser.add_argument("--jobs", type=int, default=20, help="Short jobs for the jobs/sec measurement")
+    parser.add_argument("--history-ops", type=int, default=1000)
+    parser.add_argument("--fake-rtf", type=float, default=0.0, help="Emulated RTF of the fake Whisper model")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output or os.path.join(BENCH_DIR, "results", f"pipeline-{args.backend}.json"))
+    baseline_path = os.path.abspath(args.baseline)
+
+    # Run in a scratch directory so the benchmark never touches real uploads or history
+    workdir = tempfile.mkdtemp(prefix="audium-pipeline-bench-")
+    os.chdir(workdir)
+    os.makedirs("logs", exist_ok=True)
+    os.makedirs("fixtures", exist_ok=True)
+    if args.backend == "fake":
+        # Keep every fixture on the in-process path; the chunked path's pool can't see the fakes
+        os.environ.setdefault("LONG_FILE_SECONDS", str(10 ** 9))
+    sys.path.insert(0, APP_DIR)
+
+    fixtures = []
+    for seconds in sorted(int(s) for s in args.fixtures.split(",")):
+        path = os.path.join("fixtures", f"speech-{seconds}s.wav")
+        write_wav(path, speech_like(seconds, seed=seconds))
+        fixtures.append((seconds, path))
+
+    results = {
+        "backend": args.backend,
+        "model": args.model if args.backend == "real" else "fake",
+        "cpu_count": os.cpu_count(),
+        "pipeline": bench_pipeline(args, fixtures),
+        "history": bench_history(args.history_ops),
+    }
+    results["peak_rss_mb"], results["peak_children_rss_mb"] = peak_rss_mb()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[args.backend] = results
+        with open(baseline_path, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Baseline for '{args.backend}' saved to {baseline_path}")
+    elif args.compare:
+        if args.backend not in baselines:
+            sys.exit(f"No '{args.backend}' baseline in {baseline_path}; run with --save-baseline first")
+        regressions = compare(results, baselines[args.backend], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# benchmarks/bench_scheduling.py
+"""
+Discrete-event simulation of the job queue under a mixed workload.
+
+Usage (from the repository root):
+    python3 benchmarks/bench_scheduling.py
+    python3 benchmarks/bench_scheduling.py --jobs 5000 --workers 4 --load 0.9
+    python3 benchmarks/bench_scheduling.py --aging 0,0.1,0.25,1
+
+Uploads arrive as a Poisson process with a seeded mix of lengths (mostly
+short memos, some meetings, a few multi-hour recordings) and are run by a
+fixed number of simulated workers at a noisy real-time factor. Every
+scheduling decision is made by the real job_queue.claim() against a scratch
+queue.db, on a virtual clock, so the SQL ordering being measured is the one
+that runs in production. Each policy sees the same arrivals.
+
+Reported per policy: latency (upload to finished) percentiles overall and
+for short (< 15 min) and long (>= 1 h) recordings, the worst wait of a long
+recording, and the median error of the ETA job_queue.estimate_wait() gave
+at upload time.
+"""
+import os
+import sys
+import json
+import heapq
+import shutil
+import argparse
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+import numpy as np
+
+# (share of uploads, min seconds, max seconds)
+WORKLOAD = [
+    (0.80, 60, 900),
+    (0.15, 1800, 3600),
+    (0.05, 7200, 14400),
+]
+USERS = 5
+
+
+class VirtualClock:
+    """Stands in for the time module inside job_queue so claims follow simulated time."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+def workload(jobs, workers, load, rtf, seed):
+    """Arrival times, audio lengths and owners for a run at the given utilization."""
+    rng = np.random.default_rng(seed)
+    shares = np.array([share for share, _, _ in WORKLOAD])
+    kinds = rng.choice(len(WORKLOAD), size=jobs, p=shares / shares.sum())
+    lengths = np.array([rng.uniform(WORKLOAD[k][1], WORKLOAD[k][2]) for k in kinds])
+    mean_service = lengths.mean() * rtf
+    arrival_rate = load * workers / mean_service
+    arrivals = np.cumsum(rng.exponential(1 / arrival_rate, size=jobs))
+    users = rng.integers(0, USERS, size=jobs)
+    noise = rng.lognormal(0.0, 0.2, size=jobs)
+    return [{'job_id': f"job-{i}", 'arrival': float(arrivals[i]), 'audio': float(lengths[i]),
+             'user': f"user-{users[i]}", 'service': float(lengths[i] * rtf * noise[i])}
+            for i in range(jobs)]
+
+
+def simulate(job_queue, clock, jobs, workers, rtf):
+    """Run one workload through the queue; returns the jobs with start, finish and ETA filled in."""
+    by_id = {job['job_id']: job for job in jobs}
+    events = [(job['arrival'], 0, job['job_id']) for job in jobs]  # kind 0 = arrival, n = finish on worker n - 1
+    heapq.heapify(events)
+    idle = list(range(workers))
+
+    while events:
+        clock.now, kind, job_id = heapq.heappop(events)
+        if kind == 0:
+            job = by_id[job_id]
+            job_queue.enqueue(job_id, f"{job_id}.flac", job['user'], "en", audio_seconds=job['audio'])
+            estimate = job_queue.estimate_wait(job_id, rtf, workers)
+            job['predicted_finish'] = clock.now + estimate['eta_seconds']
+        else:
+            job_queue.complete(job_id)
+            by_id[job_id]['finish'] = clock.now
+            idle.append(int(kind) - 1)
+        while idle:
+            claimed = job_queue.claim(f"worker-{idle[-1]}", lease_seconds=10 ** 9)
+            if claimed is None:
+                break
+            slot = idle.pop()
+            job = by_id[claimed['job_id']]
+            job['start'] = clock.now
+            heapq.heappush(events, (clock.now + job['service'], slot + 1, job['job_id']))
+    return jobs
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {f"p{p}": round(float(np.percentile(values, p)) / 60, 1) for p in (50, 90, 99)}
+
+
+def summarize(jobs):
+    latency = [job['finish'] - job['arrival'] for job in jobs]
+    short = [job['finish'] - job['arrival'] for job in jobs if job['audio'] < 900]
+    long_jobs = [job for job in jobs if job['audio'] >= 3600]
+    eta_error = [abs(job['predicted_finish'] - job['finish']) / max(job['finish'] - job['arrival'], 1.0)
+                 for job in jobs]
+    return {
+        'latency_minutes': percentiles(latency),
+        'short_latency_minutes': percentiles(short),
+        'long_latency_minutes': percentiles([job['finish'] - job['arrival'] for job in long_jobs]),
+        'long_max_wait_minutes': round(max((job['start'] - job['arrival'] for job in long_jobs), default=0) / 60, 1),
+        'eta_median_relative_error': round(float(np.median(eta_error)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--load", type=float, default=0.85, help="Target worker utilization")
+    parser.add_argument("--rtf", type=float, default=0.3, help="Mean real-time factor of a worker")
+    parser.add_argument("--aging", default="0,0.25,1", help="QUEUE_AGING_RATE values to try under sjf")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    output = os.path.abspath(args.output or os.path.join(BENCH_DIR, "results", "scheduling.json"))
+
+    workdir = tempfile.mkdtemp(prefix="audium-scheduling-bench-")
+    os.chdir(workdir)
+    os.makedirs("logs", exist_ok=True)
+    sys.path.insert(0, APP_DIR)
+    import job_queue
+
+    clock = VirtualClock()
+    job_queue.time = clock
+    policies = [("fifo", None)] + [("sjf", float(rate)) for rate in args.aging.split(",")]
+
+    results = {'jobs': args.jobs, 'workers': args.workers, 'load': args.load, 'rtf': args.rtf, 'policies': {}}
+    for scheduling, aging in policies:
+        job_queue.QUEUE_DB = os.path.join(workdir, f"queue-{scheduling}-{aging}.db")
+        job_queue.QUEUE_SCHEDULING = scheduling
+        if aging is not None:
+            job_queue.QUEUE_AGING_RATE = aging
+        clock.now = 0.0
+        jobs = simulate(job_queue, clock, workload(args.jobs, args.workers, args.load, args.rtf, args.seed),
+                        args.workers, args.rtf)
+        name = scheduling if aging is None else f"sjf(aging={aging:g})"
+        results['policies'][name] = summarize(jobs)
+
+    print(f"{'policy':<18}{'all p50/p90/p99 (min)':>26}{'short p50/p90/p99':>24}"
+          f"{'long p50/p99':>16}{'long max wait':>15}{'ETA err':>9}")
+    for name, summary in results['policies'].items():
+        overall, short, long_ = (summary['latency_minutes'], summary['short_latency_minutes'],
+                                 summary['long_latency_minutes'] or {'p50': 0, 'p99': 0})
+        print(f"{name:<18}{overall['p50']:>10}/{overall['p90']}/{overall['p99']:<8}"
+              f"{short['p50']:>12}/{short['p90']}/{short['p99']:<6}"
+              f"{long_['p50']:>9}/{long_['p99']:<6}{summary['long_max_wait_minutes']:>15}"
+              f"{summary['eta_median_relative_error']:>9}")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,10 @@ if ! python3 -c "import flask" &> /dev/null; then
   exit 1
 fi
 
+# Launch the transcription worker pool in the background
+echo "Starting transcription workers..."
+python3 worker.py &
+
 # Launch the Flask app
 echo "Launching the Flask app..."
 if ! exec python3 web.py; then